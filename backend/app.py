@@ -1,16 +1,30 @@
-from flask import Flask, jsonify, request, url_for, Response
+from flask import Flask, jsonify, request, url_for, Response, stream_with_context, g, send_file
 from flask_cors import CORS
 import services
 import os
 import map_renderer
+import layout
+import config_generator
+import map_versions
+import metrics
+import profiling
 import jwt
 from functools import wraps
 from datetime import datetime, timedelta
-import threading
 import uuid
-from io import BytesIO
+import json
+import threading
+import time
+from collections import OrderedDict
+import task_queue
+import uploads
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
+# Uploaded files are streamed straight into the task spool directory and
+# validated while they arrive instead of being buffered in memory.
+app.request_class = uploads.SpoolingRequest
 
 # --- Authentication Configuration ---
 # In a real production environment, this secret key should be loaded from a secure,
@@ -18,13 +32,72 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-super-secret-and-complex-key-that-is-not-in-git'
 # ---
 
+# --- Upload Limits ---
+# Leave room for the config text and other form fields on top of the image.
+app.config['MAX_CONTENT_LENGTH'] = uploads.MAX_UPLOAD_BYTES + 16 * 1024 * 1024
+# Text fields (config_content) may use that room too; werkzeug's default is 500 KB.
+app.config['MAX_FORM_MEMORY_SIZE'] = 16 * 1024 * 1024
+
 CORS(app)
 
+@app.errorhandler(RequestEntityTooLarge)
+@app.errorhandler(UnsupportedMediaType)
+def upload_rejected_handler(e):
+    """Returns upload rejections raised while the request body is streamed as JSON."""
+    return jsonify({"error": e.description}), e.code
+
+# --- Request Metrics ---
+# Bearer token /metrics scrapers must present; the endpoint is open when unset.
+METRICS_TOKEN = os.environ.get('AUTOCACTI_METRICS_TOKEN')
+
+def _route_label():
+    # The URL rule, not the path, so per-device URLs share one series.
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method, route=_route_label(), status=str(response.status_code)
+        )
+    return response
+
+# --- Request Profiling ---
+# Armed and downloaded through /admin/profiles, whose own requests are never profiled.
+PROFILE_ENDPOINT_PREFIX = '/admin/profiles'
+
+@app.before_request
+def start_request_profile():
+    if not request.path.startswith(PROFILE_ENDPOINT_PREFIX):
+        g.profile_run = profiling.start(
+            'request', f"{request.method} {request.path}", (request.path, _route_label())
+        )
+
+@app.teardown_request
+def stop_request_profile(exc):
+    run = g.pop('profile_run', None)
+    if run is not None:
+        run.stop()
+
 # Ensure the directories for storing maps, configs, and final outputs exist
 os.makedirs('static/maps', exist_ok=True)
 os.makedirs('static/configs', exist_ok=True)
 os.makedirs('static/final_maps', exist_ok=True)
 
+# Start the bounded map task executor in this process unless a separate
+# worker process (worker.py) has been configured to drain the queue. Under
+# the debug reloader (python app.py) this module also runs in the watcher
+# process; only the serving child, marked by WERKZEUG_RUN_MAIN, starts it.
+if task_queue.TASK_EXECUTION_MODE == 'inline' and \
+        (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    services.TASK_EXECUTOR.start()
+
 # --- MOCK USER DATABASE (Integrated from File 2) ---
 USERS_DB = {
     # System Admins
@@ -41,6 +114,63 @@ USERS_DB = {
     "7": { "id": "7", "username": "guest_monitor", "password": "guest_pass", "privilege": "viewer" },
     "8": { "id": "8", "username": "auditor", "password": "audit_pass", "privilege": "viewer" }
 }
+# Secondary index over the same user dicts, kept in sync by /register and /users/...
+USERS_BY_NAME = {u['username']: u for u in USERS_DB.values()}
+
+# --- Verified Token Cache ---
+TOKEN_CACHE_MAX_ENTRIES = 10_000
+
+class TokenCache:
+    """
+    Bounded LRU cache of JWTs that already passed signature verification.
+
+    Each entry maps a token to its username and expires with the token's own
+    'exp' claim, so a cached token is never accepted for longer than the
+    JWT itself would be. Entries are dropped per user on privilege changes
+    and deletion.
+    """
+
+    def __init__(self, max_entries=TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tokens_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        """Returns the username of a cached, unexpired token, or None."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            username, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+            return username
+
+    def put(self, token, username, expires_at):
+        with self._lock:
+            self._entries[token] = (username, expires_at)
+            self._entries.move_to_end(token)
+            self._tokens_by_user.setdefault(username, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, username):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(username, ())):
+                self._remove(token)
+
+    def _remove(self, token):
+        username, _ = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(username)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[username]
+
+TOKEN_CACHE = TokenCache()
 
 # --- Authentication Token Decorators (Updated) ---
 def token_required(f):
@@ -49,31 +179,51 @@ def token_required(f):
         if request.method == 'OPTIONS':
             return jsonify({'status': 'ok'}), 200
 
-        token = None
-        if 'Authorization' in request.headers:
-            # Expected format: "Bearer <token>"
-            try:
-                auth_header = request.headers['Authorization']
-                token = auth_header.split(" ")[1]
-            except IndexError:
-                return jsonify({'message': 'Malformed Authorization header'}), 401
-
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-
-        try:
-            # Decode the token using the secret key
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            # Find user by username and attach to request for RBAC checks
-            request.current_user = next((u for u in USERS_DB.values() if u['username'] == data['user']), None)
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Token is invalid!'}), 401
-        
+        with metrics.AUTH_SECONDS.time(route=_route_label()):
+            user, error = authenticate_token(request.headers.get('Authorization'))
+        if error:
+            return jsonify({'message': error}), 401
+        request.current_user = user
         return f(*args, **kwargs)
     return decorated
 
+def authenticate_token(auth_header):
+    """
+    Resolves an Authorization header ("Bearer <token>") to a user.
+    Returns (user, None), or (None, error_message) for a rejected token.
+    Shared with the async endpoints in asgi.py.
+    """
+    token = None
+    if auth_header:
+        # Expected format: "Bearer <token>"
+        try:
+            token = auth_header.split(" ")[1]
+        except IndexError:
+            return None, 'Malformed Authorization header'
+
+    if not token:
+        return None, 'Token is missing!'
+
+    username = TOKEN_CACHE.get(token)
+    if username is not None:
+        return USERS_BY_NAME.get(username), None
+
+    try:
+        # Decode the token using the secret key
+        data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        if 'scope' in data:
+            # Scoped tickets (e.g. for /task-events) are not session tokens.
+            return None, 'Token is invalid!'
+        # Find user by username and attach to request for RBAC checks
+        user = USERS_BY_NAME.get(data['user'])
+        if user and 'exp' in data:
+            TOKEN_CACHE.put(token, data['user'], data['exp'])
+    except jwt.ExpiredSignatureError:
+        return None, 'Token has expired!'
+    except jwt.InvalidTokenError:
+        return None, 'Token is invalid!'
+    return user, None
+
 def admin_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -98,7 +248,9 @@ def login():
     password = auth.get('password')
 
     # Logic updated to check local USERS_DB to support roles
-    user_found = next((u for u in USERS_DB.values() if u['username'] == username and u['password'] == password), None)
+    user_found = USERS_BY_NAME.get(username)
+    if user_found and user_found['password'] != password:
+        user_found = None
 
     if user_found:
         token = jwt.encode({
@@ -126,7 +278,7 @@ def register_user():
         return jsonify({'message': 'Missing username or password'}), 400
     
     # Check if username already exists
-    if any(u['username'] == data['username'] for u in USERS_DB.values()):
+    if data['username'] in USERS_BY_NAME:
         return jsonify({'message': 'Username already exists'}), 409
 
     # Generate new ID
@@ -145,6 +297,7 @@ def register_user():
     }
 
     USERS_DB[new_id] = new_user
+    USERS_BY_NAME[new_user['username']] = new_user
 
     return jsonify({
         'message': 'User registered successfully',
@@ -172,6 +325,7 @@ def change_privileges(user_id, new_privilege):
         return jsonify({'message': 'Invalid privilege level'}), 400
 
     USERS_DB[user_id]['privilege'] = new_privilege
+    TOKEN_CACHE.invalidate_user(USERS_DB[user_id]['username'])
     return jsonify({
         'message': 'Privilege updated',
         'user': {'id': user_id, 'username': USERS_DB[user_id]['username'], 'privilege': new_privilege}
@@ -190,9 +344,99 @@ def delete_user(user_id):
     if USERS_DB[user_id]['username'] == request.current_user['username']:
         return jsonify({'message': 'You cannot delete your own account'}), 400
 
-    del USERS_DB[user_id]
+    deleted_user = USERS_DB.pop(user_id)
+    USERS_BY_NAME.pop(deleted_user['username'], None)
+    TOKEN_CACHE.invalidate_user(deleted_user['username'])
     return jsonify({'message': 'User deleted successfully'}), 200
 
+@app.route('/admin/cache', methods=['GET', 'DELETE', 'OPTIONS'])
+@token_required
+@admin_required
+def snmp_cache_endpoint():
+    """Returns SNMP cache statistics (GET) or flushes the whole cache (DELETE)."""
+    if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
+
+    if request.method == 'DELETE':
+        removed = services.SNMP_CACHE.clear()
+        return jsonify({'message': 'Cache flushed', 'removed': removed})
+    return jsonify(services.SNMP_CACHE.get_stats())
+
+@app.route('/admin/cache/<ip_address>', methods=['DELETE', 'OPTIONS'])
+@token_required
+@admin_required
+def invalidate_snmp_cache_endpoint(ip_address):
+    """Drops all cached SNMP results for a single device."""
+    if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
+
+    removed = services.SNMP_CACHE.invalidate(ip_address)
+    return jsonify({'message': f'Cache invalidated for {ip_address}', 'removed': removed})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Returns request, SNMP, task and renderer metrics in the Prometheus text format."""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({'message': 'Token is invalid!'}), 401
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/admin/profiles', methods=['GET', 'POST', 'OPTIONS'])
+@token_required
+@admin_required
+def profiles_endpoint():
+    """
+    Lists armed and stored profiles (GET), or arms a profile (POST) for the
+    next request or map task run matching a glob pattern.
+    """
+    if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
+
+    if request.method == 'GET':
+        profiles = [
+            {key: value for key, value in profile.items() if key != 'path'}
+            for profile in profiling.PROFILES.list_profiles()
+        ]
+        return jsonify({'arms': profiling.PROFILES.list_arms(), 'profiles': profiles})
+
+    data = request.get_json(silent=True) or {}
+    target = data.get('target', 'request')
+    mode = data.get('mode', 'cprofile')
+    pattern = data.get('pattern', '*')
+    count = data.get('count', 1)
+    if target not in profiling.TARGETS:
+        return jsonify({'error': f"target must be one of: {', '.join(profiling.TARGETS)}"}), 400
+    if mode not in profiling.MODES:
+        return jsonify({'error': f"mode must be one of: {', '.join(profiling.MODES)}"}), 400
+    if not isinstance(pattern, str):
+        return jsonify({'error': 'pattern must be a string'}), 400
+    if not isinstance(count, int) or not 1 <= count <= profiling.PROFILE_MAX_ARM_COUNT:
+        return jsonify({'error': f"count must be between 1 and {profiling.PROFILE_MAX_ARM_COUNT}"}), 400
+
+    arm = profiling.PROFILES.arm(target, pattern, mode, count, request.current_user['username'])
+    return jsonify(arm), 201
+
+@app.route('/admin/profiles/arms/<arm_id>', methods=['DELETE', 'OPTIONS'])
+@token_required
+@admin_required
+def disarm_profile_endpoint(arm_id):
+    """Cancels the remaining runs of an armed profile."""
+    if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
+
+    if not profiling.PROFILES.disarm(arm_id):
+        return jsonify({'error': 'Profile arm not found'}), 404
+    return jsonify({'message': 'Profile disarmed'})
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET', 'OPTIONS'])
+@token_required
+@admin_required
+def download_profile_endpoint(profile_id):
+    """Downloads a stored profile (pstats or collapsed stacks)."""
+    if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
+
+    profile = profiling.PROFILES.get_profile(profile_id)
+    if profile is None or not os.path.exists(profile['path']):
+        return jsonify({'error': 'Profile not found'}), 404
+    mimetype = 'text/plain' if profile['format'] == 'collapsed' else 'application/octet-stream'
+    return send_file(os.path.abspath(profile['path']), mimetype=mimetype, as_attachment=True,
+                     download_name=os.path.basename(profile['path']))
+
 
 # --- Protected API Endpoints ---
 @app.route('/get-device-info/<ip_address>', methods=['GET'])
@@ -223,54 +467,111 @@ def get_full_device_neighbors_endpoint(ip_address):
         return jsonify(neighbors)
     return jsonify({"error": "Device not found or has no neighbors"}), 404
 # ----------------------------------
-    
+
+# --- Server-Side Discovery Limits ---
+DISCOVERY_MAX_DEPTH = 10
+DISCOVERY_MAX_DEVICES = 2000
+BATCH_MAX_IPS = 256
+
+def _get_batch_ips():
+    """Extracts and validates the 'ips' list from a batch request body."""
+    data = request.get_json(silent=True) or {}
+    ips = data.get('ips')
+    if not isinstance(ips, list) or not ips or not all(isinstance(ip, str) and ip for ip in ips):
+        return None, (jsonify({"error": "'ips' must be a non-empty list of IP addresses"}), 400)
+    if len(ips) > BATCH_MAX_IPS:
+        return None, (jsonify({"error": f"A batch may contain at most {BATCH_MAX_IPS} IPs"}), 400)
+    return ips, None
+
+@app.route('/devices/batch', methods=['POST'])
+@token_required
+def get_device_info_batch_endpoint():
+    """Retrieves device info for a list of IPs in one call, keyed by IP."""
+    ips, error_response = _get_batch_ips()
+    if error_response:
+        return error_response
+    return jsonify(services.get_device_info_batch(ips))
+
+@app.route('/neighbors/batch', methods=['POST'])
+@token_required
+def get_device_neighbors_batch_endpoint():
+    """Retrieves CDP neighbors for a list of IPs in one call, keyed by IP."""
+    ips, error_response = _get_batch_ips()
+    if error_response:
+        return error_response
+    return jsonify(services.get_device_neighbors_batch(ips))
+
+@app.route('/discover', methods=['POST'])
+@token_required
+def discover_topology_endpoint():
+    """Crawls the topology from a seed IP and returns all nodes and edges at once."""
+    data = request.get_json(silent=True) or {}
+    seed_ip = data.get('ip')
+    if not seed_ip:
+        return jsonify({"error": "IP address is required"}), 400
+
+    try:
+        max_depth = int(data.get('max_depth', 2))
+        max_devices = int(data.get('max_devices', 200))
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_depth and max_devices must be integers"}), 400
+
+    if not 0 <= max_depth <= DISCOVERY_MAX_DEPTH:
+        return jsonify({"error": f"max_depth must be between 0 and {DISCOVERY_MAX_DEPTH}"}), 400
+    if not 1 <= max_devices <= DISCOVERY_MAX_DEVICES:
+        return jsonify({"error": f"max_devices must be between 1 and {DISCOVERY_MAX_DEVICES}"}), 400
+
+    topology = services.discover_topology(
+        seed_ip,
+        max_depth=max_depth,
+        max_devices=max_devices,
+        full_scan=bool(data.get('full_scan', False))
+    )
+    if seed_ip in topology['errors']:
+        return jsonify({"error": topology['errors'][seed_ip]}), 404
+    return jsonify(topology)
+
 @app.route('/config-template', methods=['GET'])
 @token_required
 def get_config_template_endpoint():
     """Returns the Cacti Weathermap configuration template."""
-    template = """
-# Automatically generated by AutoCacti Map Creator
-
-BACKGROUND images/backgrounds/%name%.png
-WIDTH %width%
-HEIGHT %height%
-TITLE %name%
-
-KEYTEXTCOLOR 0 0 0
-KEYOUTLINECOLOR 0 0 0
-KEYBGCOLOR 255 255 255
-TITLECOLOR 0 0 0
-TIMECOLOR 0 0 0
-SCALE DEFAULT 0  0   192 192 192
-SCALE DEFAULT 0  1   255 255 255
-SCALE DEFAULT 1  10  140 0 255
-SCALE DEFAULT 10 25  32 32 255
-SCALE DEFAULT 25 40  0 192 255
-SCALE DEFAULT 40 55  0 240 0
-SCALE DEFAULT 55 70  240 240 0
-SCALE DEFAULT 70 85  255 192 0
-SCALE DEFAULT 85 100 255 0 0
-
-SET key_hidezero_DEFAULT 1
-
-# End of global section
-
-# TEMPLATE-only NODEs:
-# TEMPLATE-only LINKs:
-LINK DEFAULT
-    WIDTH 3
-    BWLABEL bits
-    BANDWIDTH 10000M
-
-# regular NODEs:
-%nodes%
-
-# regular LINKs:
-%links%
-
-# That's All Folks!
-""".strip()
-    return Response(template, mimetype='text/plain')
+    return Response(config_generator.CONFIG_TEMPLATE, mimetype='text/plain')
+
+@app.route('/generate-config', methods=['POST', 'OPTIONS'])
+@token_required
+def generate_config_endpoint():
+    """
+    Generates a Weathermap .conf from React Flow nodes and edges and streams it.
+
+    Body: {"nodes", "edges", "map_name", "map_width", "map_height",
+    "scale_factor"}. The output is identical to the frontend's
+    generateCactiConfig() for the same input.
+    """
+    if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
+
+    data = request.get_json(silent=True) or {}
+    nodes = data.get('nodes')
+    edges = data.get('edges')
+    map_name = data.get('map_name')
+    if not isinstance(nodes, list) or not isinstance(edges, list) or not map_name:
+        return jsonify({"error": "nodes, edges and map_name are required"}), 400
+    if not all(isinstance(n, dict) and 'id' in n and isinstance(n.get('position'), dict) for n in nodes):
+        return jsonify({"error": "Every node needs an 'id' and a 'position'"}), 400
+    if not all(isinstance(e, dict) and 'source' in e and 'target' in e for e in edges):
+        return jsonify({"error": "Every edge needs a 'source' and a 'target'"}), 400
+
+    try:
+        config = config_generator.iter_config(
+            nodes, edges, map_name,
+            data.get('map_width', 1920), data.get('map_height', 1080),
+            scale_factor=float(data.get('scale_factor', 1))
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid node or edge data: {e}"}), 400
+
+    return Response(config, mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename="{secure_filename(str(map_name)) or "map"}.conf"'
+    })
 
 @app.route('/groups', methods=['GET'])
 @token_required
@@ -303,7 +604,6 @@ def create_map_endpoint():
         return jsonify({"error": "Map image is required"}), 400
     
     map_image_file = request.files['map_image']
-    map_image_bytes = BytesIO(map_image_file.read())
 
     cacti_group_id = request.form.get('cacti_group_id')
     map_name = request.form.get('map_name')
@@ -321,8 +621,39 @@ def create_map_endpoint():
     if not installations:
         return jsonify({"error": f"Cacti group with ID {cacti_group_id} not found"}), 404
 
-    # --- RESTRICTED SERVER CHECK START ---
     # 2. Permission Check: Users & Restricted Servers
+    permission_error = _restricted_server_error(current_privilege, installations)
+    if permission_error:
+        return permission_error
+
+    # Uploads for an existing map_id become its next version.
+    map_id = request.form.get('map_id') or str(uuid.uuid4())
+    permission_error = _map_owner_error(current_privilege, map_id)
+    if permission_error:
+        return permission_error
+
+    try:
+        created_tasks = services.queue_map_upload(
+            map_image_file, config_content, map_name, installations,
+            username=request.current_user['username'], cacti_group_id=cacti_group_id,
+            map_id=map_id
+        )
+    except uploads.InvalidUploadError as e:
+        return jsonify({"error": str(e)}), 400
+    except task_queue.UserQuotaExceededError as e:
+        return jsonify({"error": str(e)}), 429, {'Retry-After': '30'}
+    except task_queue.QueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '30'}
+
+    return jsonify({
+        "message": f"Map creation process has been started for {len(installations)} installations.",
+        "map_id": map_id,
+        "tasks": created_tasks
+    }), 202
+
+def _restricted_server_error(current_privilege, installations):
+    """Returns a 403 response when a user may not deploy to one of the installations."""
+    # --- RESTRICTED SERVER CHECK START ---
     if current_privilege == 'user':
         for installation in installations:
             hostname = installation.get('hostname', '').strip()
@@ -330,39 +661,131 @@ def create_map_endpoint():
             if hostname.endswith('1'):
                  return jsonify({"error": f"Permission Denied: Users cannot upload to restricted server '{hostname}'."}), 403
     # --- RESTRICTED SERVER CHECK END ---
+    return None
 
-    created_tasks = []
-    
-    for installation in installations:
-        task_id = str(uuid.uuid4())
-        
-        services.MOCK_TASKS[task_id] = {
-            'id': task_id,
-            'status': 'PENDING',
-            'message': 'Map creation task has been queued.',
-            'updated_at': datetime.utcnow().isoformat()
-        }
-        
-        # We need to create a new BytesIO object for each thread
-        map_image_bytes.seek(0)
-        thread_map_image = BytesIO(map_image_bytes.read())
+def _map_owner_error(current_privilege, map_id):
+    """Returns a 403 response when a non-admin edits a map that another user created."""
+    if current_privilege == 'admin':
+        return None
+    owner = services.get_map_owner(map_id)
+    if owner is not None and owner != request.current_user['username']:
+        return jsonify({"error": "Permission Denied: Only the map's creator or an admin can edit it."}), 403
+    return None
 
-        thread = threading.Thread(
-            target=services.process_map_task,
-            args=(task_id, thread_map_image, config_content, map_name)
+# --- Map Versions ---
+@app.route('/maps/<map_id>', methods=['GET'])
+@token_required
+def get_map_versions_endpoint(map_id):
+    """Returns the version history of a map, latest last."""
+    versions = services.get_map_versions(map_id)
+    if not versions:
+        return jsonify({"error": "Map not found"}), 404
+    for version in versions:
+        version['final_map_url'] = url_for(
+            'static', filename=f"final_maps/{version.pop('final_map_filename')}", _external=True
         )
-        thread.start()
+        version.pop('config_path')
+    return jsonify({"map_id": map_id, "latest_version": versions[-1]['version'], "versions": versions})
 
-        created_tasks.append({
-            "hostname": installation['hostname'],
-            "task_id": task_id
-        })
+@app.route('/maps/<map_id>/diff', methods=['POST', 'OPTIONS'])
+@token_required
+def map_diff_endpoint(map_id):
+    """
+    Applies an incremental edit to the latest version of a map.
+
+    Body: {"base_version", "nodes": {node_id: {"x", "y", "keywords"} | null},
+    "links": {link_id: {"nodes": [a, b], "keywords"} | null},
+    "cacti_group_id" (optional, redeploys the new version)}.
+    The edit is checked and queued like /create-map; its task rewrites only
+    the config blocks and image tiles it touches. Returns 409 when
+    base_version is no longer the latest version.
+    """
+    if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
+
+    if not request.current_user:
+        return jsonify({"error": "User authentication failed."}), 401
+
+    current_privilege = request.current_user.get('privilege', 'viewer')
+    if current_privilege == 'viewer':
+        return jsonify({"error": "Permission Denied: Viewers cannot edit maps."}), 403
+    permission_error = _map_owner_error(current_privilege, map_id)
+    if permission_error:
+        return permission_error
+
+    data = request.get_json(silent=True) or {}
+    node_changes = data.get('nodes') or {}
+    link_changes = data.get('links') or {}
+    if not isinstance(node_changes, dict) or not isinstance(link_changes, dict):
+        return jsonify({"error": "'nodes' and 'links' must be objects keyed by ID"}), 400
+    if not node_changes and not link_changes:
+        return jsonify({"error": "The diff does not change anything"}), 400
+
+    installations = None
+    cacti_group_id = data.get('cacti_group_id')
+    if cacti_group_id is not None:
+        try:
+            cacti_group_id = int(cacti_group_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid cacti_group_id format"}), 400
+        installations = services.get_installations_by_group_id(cacti_group_id)
+        if not installations:
+            return jsonify({"error": f"Cacti group with ID {cacti_group_id} not found"}), 404
+        permission_error = _restricted_server_error(current_privilege, installations)
+        if permission_error:
+            return permission_error
+
+    try:
+        created_tasks = services.queue_map_diff(
+            map_id, data.get('base_version'), node_changes, link_changes,
+            username=request.current_user['username'],
+            installations=installations, cacti_group_id=cacti_group_id
+        )
+    except map_versions.MapVersionConflictError as e:
+        return jsonify({"error": str(e)}), 409
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid map diff: {e}"}), 400
+    except task_queue.UserQuotaExceededError as e:
+        return jsonify({"error": str(e)}), 429, {'Retry-After': '30'}
+    except task_queue.QueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '30'}
+    if created_tasks is None:
+        return jsonify({"error": "Map not found"}), 404
 
     return jsonify({
-        "message": f"Map creation process has been started for {len(installations)} installations.",
+        "message": "Map edit has been queued.",
+        "map_id": map_id,
         "tasks": created_tasks
     }), 202
 
+# --- Task Status ---
+TASK_BATCH_MAX_IDS = 256
+# How long an event stream waits for a change before re-reading the database
+# (picks up writes from external worker processes) and sending a keep-alive.
+TASK_EVENTS_POLL_SECONDS = 2.0
+# Event streams are closed after this long; EventSource clients reconnect.
+TASK_EVENTS_MAX_SECONDS = 15 * 60
+FINISHED_TASK_STATUSES = ('SUCCESS', 'FAILURE')
+# Browsers' EventSource cannot send an Authorization header, so event streams
+# are opened with a short-lived ticket in the query string instead.
+TASK_EVENTS_TICKET_SECONDS = 60
+TASK_EVENTS_TICKET_SCOPE = 'task-events'
+
+def _with_final_map_url(task):
+    """Replaces the message of a successful task with the URL of its rendered map."""
+    if task['status'] == 'SUCCESS':
+        final_map_filename = task.get('final_map_filename')
+        if final_map_filename:
+            task['message'] = url_for('static', filename=f'final_maps/{final_map_filename}', _external=True)
+    return task
+
+def _get_task_ids(task_ids):
+    """Validates a list of task IDs from a batch status or event stream request."""
+    if not isinstance(task_ids, list) or not task_ids or not all(isinstance(t, str) and t for t in task_ids):
+        return None, (jsonify({"error": "'task_ids' must be a non-empty list of task IDs"}), 400)
+    if len(task_ids) > TASK_BATCH_MAX_IDS:
+        return None, (jsonify({"error": f"A batch may contain at most {TASK_BATCH_MAX_IDS} task IDs"}), 400)
+    return list(dict.fromkeys(task_ids)), None
+
 @app.route('/task-status/<task_id>', methods=['GET'])
 @token_required
 def get_task_status_endpoint(task_id):
@@ -370,14 +793,262 @@ def get_task_status_endpoint(task_id):
     task = services.MOCK_TASKS.get(task_id)
     if not task:
         return jsonify({"error": "Task not found"}), 404
-    
-    # If the task is successful, generate the final map URL dynamically
-    if task['status'] == 'SUCCESS':
-        final_map_filename = task.get('final_map_filename')
-        if final_map_filename:
-            task['message'] = url_for('static', filename=f'final_maps/{final_map_filename}', _external=True)
 
-    return jsonify(task)
+    return jsonify(_with_final_map_url(task))
+
+@app.route('/task-status/batch', methods=['POST', 'OPTIONS'])
+@token_required
+def get_task_status_batch_endpoint():
+    """Returns the status of many tasks in one call, keyed by task ID."""
+    if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
+
+    task_ids, error_response = _get_task_ids((request.get_json(silent=True) or {}).get('task_ids'))
+    if error_response:
+        return error_response
+
+    found = services.MOCK_TASKS.get_many(task_ids)
+    return jsonify({
+        "tasks": {task_id: _with_final_map_url(task) for task_id, task in found.items()},
+        "missing": [task_id for task_id in task_ids if task_id not in found]
+    })
+
+@app.route('/tasks', methods=['GET'])
+@token_required
+def list_tasks_endpoint():
+    """
+    Lists map tasks newest first, one page at a time.
+
+    Optional filters: upload_id, cacti_group_id, status, and (admins only)
+    username. Other users only ever see their own tasks. Pass the returned
+    next_cursor as ?cursor= to fetch the following page.
+    """
+    current_user = request.current_user
+    if not current_user:
+        return jsonify({"error": "User authentication failed."}), 401
+
+    username = current_user['username']
+    if current_user.get('privilege') == 'admin':
+        username = request.args.get('username') or None
+
+    cacti_group_id = request.args.get('cacti_group_id')
+    limit = request.args.get('limit', 50)
+    try:
+        cacti_group_id = int(cacti_group_id) if cacti_group_id is not None else None
+        limit = int(limit)
+    except ValueError:
+        return jsonify({"error": "cacti_group_id and limit must be integers"}), 400
+
+    tasks, next_cursor = services.MOCK_TASKS.list_tasks(
+        username=username,
+        upload_id=request.args.get('upload_id'),
+        cacti_group_id=cacti_group_id,
+        status=request.args.get('status'),
+        limit=limit,
+        cursor=request.args.get('cursor')
+    )
+    return jsonify({
+        "tasks": [_with_final_map_url(task) for task in tasks],
+        "next_cursor": next_cursor
+    })
+
+@app.route('/admin/tasks/purge', methods=['POST', 'OPTIONS'])
+@token_required
+@admin_required
+def purge_tasks_endpoint():
+    """Deletes expired finished tasks immediately instead of waiting for the executor."""
+    if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
+
+    deleted = services.MOCK_TASKS.purge_expired()
+    return jsonify({"deleted": deleted, "counts": services.MOCK_TASKS.count_by_status()})
+
+@app.route('/task-events/ticket', methods=['POST', 'OPTIONS'])
+@token_required
+def task_events_ticket_endpoint():
+    """Issues a short-lived ticket for opening /task-events on a batch of tasks."""
+    if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
+
+    task_ids, error_response = _get_task_ids((request.get_json(silent=True) or {}).get('task_ids'))
+    if error_response:
+        return error_response
+
+    ticket = jwt.encode({
+        'user': request.current_user['username'],
+        'scope': TASK_EVENTS_TICKET_SCOPE,
+        'task_ids': task_ids,
+        'exp': datetime.utcnow() + timedelta(seconds=TASK_EVENTS_TICKET_SECONDS)
+    }, app.config['SECRET_KEY'], algorithm="HS256")
+    return jsonify({'ticket': ticket, 'expires_in': TASK_EVENTS_TICKET_SECONDS})
+
+def _verify_task_events_ticket(ticket, task_ids):
+    """Returns None for a valid ticket covering task_ids, otherwise an error message."""
+    try:
+        data = jwt.decode(ticket, app.config['SECRET_KEY'], algorithms=["HS256"])
+    except jwt.ExpiredSignatureError:
+        return 'Ticket has expired!'
+    except jwt.InvalidTokenError:
+        return 'Ticket is invalid!'
+    if data.get('scope') != TASK_EVENTS_TICKET_SCOPE or data.get('user') not in USERS_BY_NAME:
+        return 'Ticket is invalid!'
+    if not set(task_ids) <= set(data.get('task_ids') or ()):
+        return 'Ticket does not cover these tasks!'
+    return None
+
+@app.route('/task-events', methods=['GET'])
+def task_events_endpoint():
+    """
+    Streams status changes of a batch of tasks as Server-Sent Events.
+
+    Pass the task IDs as ?task_ids=a,b,c and either an Authorization header
+    or ?ticket= from /task-events/ticket (for EventSource). Every change is
+    sent as a 'task' event carrying the same JSON as /task-status/<task_id>.
+    A 'done' event follows once every task has finished, and the stream is
+    then closed.
+    """
+    task_ids, error_response = _get_task_ids(
+        [t for t in request.args.get('task_ids', '').split(',') if t]
+    )
+    if error_response:
+        return error_response
+
+    ticket = request.args.get('ticket')
+    if ticket:
+        error = _verify_task_events_ticket(ticket, task_ids)
+    else:
+        user, error = authenticate_token(request.headers.get('Authorization'))
+        if not error and user is None:
+            error = 'Token is invalid!'
+    if error:
+        return jsonify({'message': error}), 401
+
+    def generate():
+        store = services.MOCK_TASKS
+        sent = {}
+        # Read the version before the tasks so no change can slip in between.
+        version = store.version
+        deadline = datetime.utcnow() + timedelta(seconds=TASK_EVENTS_MAX_SECONDS)
+        while datetime.utcnow() < deadline:
+            found = store.get_many(task_ids)
+            for task_id in task_ids:
+                task = found.get(task_id)
+                if task is None:
+                    task = {"id": task_id, "status": "FAILURE", "message": "Task not found"}
+                state = (task['status'], task['message'], task.get('updated_at'))
+                if sent.get(task_id) != state:
+                    sent[task_id] = state
+                    yield f"event: task\ndata: {json.dumps(_with_final_map_url(task))}\n\n"
+
+            if all(state[0] in FINISHED_TASK_STATUSES for state in sent.values()):
+                yield "event: done\ndata: {}\n\n"
+                return
+
+            new_version = store.wait_for_change(version, TASK_EVENTS_POLL_SECONDS)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+            version = new_version
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# --- Topology Index ---
+@app.route('/topology/neighbors/<node_id>', methods=['GET'])
+@token_required
+def topology_neighbors_endpoint(node_id):
+    """Returns a node's neighbors with parallel links aggregated into bundles."""
+    result = services.get_topology_neighbors(node_id)
+    if result is None:
+        return jsonify({"error": "Node not found in topology"}), 404
+    return jsonify(result)
+
+@app.route('/topology/path', methods=['GET'])
+@token_required
+def topology_path_endpoint():
+    """Finds the best path between ?source= and ?target= (IP or hostname); ?metric=bandwidth|hops."""
+    source = request.args.get('source')
+    target = request.args.get('target')
+    metric = request.args.get('metric', 'bandwidth')
+    if not source or not target:
+        return jsonify({"error": "source and target are required"}), 400
+    if metric not in ('bandwidth', 'hops'):
+        return jsonify({"error": "metric must be 'bandwidth' or 'hops'"}), 400
+
+    path = services.find_topology_path(source, target, metric)
+    if path is None:
+        return jsonify({"error": "Source or target not found in topology"}), 404
+    if not path:
+        return jsonify({"error": "No path between source and target"}), 404
+    return jsonify(path)
+
+@app.route('/topology/critical', methods=['GET'])
+@token_required
+def topology_critical_endpoint():
+    """Lists the devices (articulation points) and bundles (bridges) that are single points of failure."""
+    return jsonify(services.get_topology_critical_elements())
+
+@app.route('/topology/impact/<node>', methods=['GET'])
+@token_required
+def topology_impact_endpoint(node):
+    """Reports which devices go dark if the given device fails."""
+    impact = services.get_failure_impact(node)
+    if impact is None:
+        return jsonify({"error": "Node not found in topology"}), 404
+    return jsonify(impact)
+
+@app.route('/topology/subgraph/<node>', methods=['GET'])
+@token_required
+def topology_subgraph_endpoint(node):
+    """Returns the nodes and bundles within ?hops= links (default 1) of a device."""
+    try:
+        hops = int(request.args.get('hops', 1))
+    except ValueError:
+        return jsonify({"error": "hops must be an integer"}), 400
+
+    subgraph = services.get_topology_subgraph(node, hops)
+    if subgraph is None:
+        return jsonify({"error": "Node not found in topology"}), 404
+    return jsonify(subgraph)
+
+# --- Automatic Layout ---
+LAYOUT_MAX_NODES = 5000
+
+@app.route('/layout', methods=['POST', 'OPTIONS'])
+@token_required
+def layout_endpoint():
+    """
+    Computes node positions for a map.
+
+    Body: {"nodes": [{"id", "type"}], "edges": [{"source", "target"}],
+    "width", "height", "mode": "hierarchical" | "force", "iterations"}.
+    Returns {"width", "height", "positions": {node_id: {"x", "y"}}} with
+    top-left node positions that keep every node inside width x height.
+    height grows when wide device tiers need to be wrapped onto extra rows.
+    """
+    if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
+
+    data = request.get_json(silent=True) or {}
+    nodes = data.get('nodes')
+    edges = data.get('edges', [])
+    if not isinstance(nodes, list) or not all(isinstance(n, dict) and n.get('id') for n in nodes):
+        return jsonify({"error": "'nodes' must be a list of objects with an 'id'"}), 400
+    if not isinstance(edges, list) or not all(isinstance(e, dict) and 'source' in e and 'target' in e for e in edges):
+        return jsonify({"error": "'edges' must be a list of objects with 'source' and 'target'"}), 400
+    if len(nodes) > LAYOUT_MAX_NODES:
+        return jsonify({"error": f"A layout may contain at most {LAYOUT_MAX_NODES} nodes"}), 400
+
+    try:
+        width = int(data.get('width', 1920))
+        height = int(data.get('height', 1080))
+        iterations = int(data.get('iterations', layout.FORCE_ITERATIONS))
+        positions, height = layout.compute_layout(
+            nodes, edges, width, height,
+            mode=data.get('mode', 'hierarchical'),
+            iterations=iterations
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid layout request: {e}"}), 400
+
+    return jsonify({"width": width, "height": height, "positions": positions})
 
 @app.route('/api/devices', methods=['POST'])
 @token_required
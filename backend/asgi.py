@@ -0,0 +1,174 @@
+"""
+ASGI entry point (async serving mode).
+
+Run from the backend directory with any ASGI server, for example:
+
+    uvicorn asgi:application --port 5000
+
+The SNMP-bound endpoints (/get-device-info, /get-device-neighbors,
+/get-full-neighbors and /api/devices) are served on the event loop: a lookup
+waiting on a device holds a coroutine instead of a worker thread, so one
+process can keep hundreds of discovery calls in flight. Every other route,
+and CORS preflight requests, are passed to the Flask app unchanged.
+"""
+import json
+import re
+import time
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+import metrics
+import services
+from app import app, authenticate_token
+
+
+# --- Flask Fallback ---
+wsgi_application = WsgiToAsgi(app)
+
+
+async def flask_application(scope, receive, send):
+    # WsgiToAsgi runs the WSGI app on one shared thread, which would serialize
+    # every Flask request (and block them all behind an event stream). Each
+    # request gets its own thread-sensitive context, and so its own thread.
+    async with ThreadSensitiveContext():
+        await wsgi_application(scope, receive, send)
+
+
+# --- Async Endpoints ---
+async def device_info_endpoint(user, ip_address, body):
+    """Retrieves device type, model, and hostname by IP address."""
+    device_info = await services.get_device_info_async(ip_address)
+    if device_info:
+        return 200, device_info
+    return 404, {"error": "Device not found"}
+
+async def device_neighbors_endpoint(user, ip_address, body):
+    """Gets CDP neighbors of a device by IP address using SNMP."""
+    neighbors = await services.get_device_neighbors_async(ip_address)
+    if neighbors:
+        return 200, neighbors
+    return 404, {"error": "Device not found or has no neighbors"}
+
+async def full_device_neighbors_endpoint(user, ip_address, body):
+    """Gets extended neighbors (CDP + ARP/IP scan) for a device."""
+    neighbors = await services.get_full_device_neighbors_async(ip_address)
+    if neighbors:
+        return 200, neighbors
+    return 404, {"error": "Device not found or has no neighbors"}
+
+async def initial_device_endpoint(user, _, body):
+    """Endpoint to get the very first device to start the map."""
+    try:
+        data = json.loads(body or b'null')
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return 400, {"error": "Request body must be a JSON object"}
+    ip = data.get('ip')
+    if not ip:
+        return 400, {"error": "IP address is required"}
+
+    device = await services.get_device_info_async(ip)
+    if device is None:
+        return 404, {"error": "Device not found"}
+    return 200, device
+
+# (method, Flask rule, path pattern, handler). Paths mirror the Flask routes
+# in app.py; the rule is the route label of their metrics.
+ASYNC_ROUTES = [
+    ('GET', '/get-device-info/<ip_address>', re.compile(r'^/get-device-info/([^/]+)$'), device_info_endpoint),
+    ('GET', '/get-device-neighbors/<ip_address>', re.compile(r'^/get-device-neighbors/([^/]+)$'),
+     device_neighbors_endpoint),
+    ('GET', '/get-full-neighbors/<ip_address>', re.compile(r'^/get-full-neighbors/([^/]+)$'),
+     full_device_neighbors_endpoint),
+    ('POST', '/api/devices', re.compile(r'^/api/devices$'), initial_device_endpoint),
+]
+
+
+def _match_route(method, path):
+    for route_method, rule, pattern, handler in ASYNC_ROUTES:
+        match = pattern.match(path)
+        if match and method == route_method:
+            return handler, rule, (match.group(1) if match.groups() else None)
+    return None, None, None
+
+
+async def _read_body(receive, limit):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            # The response is discarded; let the handler run to completion.
+            return body
+        body += message.get('body', b'')
+        if len(body) > limit:
+            return None
+        if not message.get('more_body'):
+            return body
+
+
+async def _send_json(send, status, payload, headers):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ] + headers,
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# Bodies of the async endpoints are small JSON documents.
+ASYNC_MAX_BODY_BYTES = 64 * 1024
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+
+    request_headers = dict(scope.get('headers') or [])
+    # Same CORS policy as CORS(app): any origin.
+    cors_headers = [(b'access-control-allow-origin', b'*')] if b'origin' in request_headers else []
+
+    handler, rule, argument = _match_route(scope['method'], scope['path'])
+    if handler is None:
+        content_length = request_headers.get(b'content-length', b'0')
+        if content_length.isdigit() and int(content_length) > app.config['MAX_CONTENT_LENGTH']:
+            # The adapter buffers the whole body before Flask sees it, so
+            # oversized uploads are refused before reading them.
+            return await _send_json(send, 413, {"error": "The data value transmitted exceeds the capacity limit."},
+                                    cors_headers)
+        return await flask_application(scope, receive, send)
+
+    started = time.perf_counter()
+    status, payload = await _handle(handler, rule, argument, request_headers, receive)
+    await _send_json(send, status, payload, cors_headers)
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - started, method=scope['method'], route=rule, status=str(status)
+    )
+
+
+async def _handle(handler, rule, argument, request_headers, receive):
+    auth_header = request_headers.get(b'authorization')
+    with metrics.AUTH_SECONDS.time(route=rule):
+        user, error = authenticate_token(auth_header.decode('latin-1') if auth_header else None)
+    if error:
+        return 401, {'message': error}
+
+    body = await _read_body(receive, ASYNC_MAX_BODY_BYTES)
+    if body is None:
+        return 413, {"error": "Request body is too large"}
+
+    return await handler(user, argument, body)
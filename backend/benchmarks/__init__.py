@@ -0,0 +1,10 @@
+"""
+Benchmarks for the map parsing, rendering and map-creation hot paths.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --quick --output results.json
+    python -m benchmarks.run --baseline results.json
+
+See benchmarks/run.py for the options.
+"""
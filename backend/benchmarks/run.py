@@ -0,0 +1,278 @@
+"""
+Benchmark harness.
+
+Times map_renderer.parse_config, render_map_from_config and
+render_and_save_map on synthetic maps, and the end-to-end /create-map ->
+SUCCESS latency through the Flask test client. Results are written as JSON
+and can be compared against an earlier run:
+
+    python -m benchmarks.run --quick --output baseline.json
+    python -m benchmarks.run --quick --baseline baseline.json --max-slowdown 1.25
+
+The comparison exits with status 1 when any benchmark's median is slower
+than the baseline by more than --max-slowdown.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# The harness changes into a scratch directory, so imports must not rely on
+# the working directory being backend/.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import map_renderer
+from benchmarks import synthetic
+
+# --- Default Scales ---
+LINK_SCALES = [100, 1000, 2000, 10000]
+BACKGROUND_SIZES = [(1024, 768), (4096, 2304), (16384, 9216)]
+QUICK_LINK_SCALES = [100, 1000, 2000]
+QUICK_BACKGROUND_SIZES = [(1024, 768), (4096, 2304)]
+DEFAULT_REPEAT = 3
+# How long one /create-map run may take before it is recorded as failed.
+PIPELINE_TIMEOUT_SECONDS = 300
+SUITES = ('parse', 'render', 'save', 'pipeline')
+
+
+def _summary(name, params, runs, error=None):
+    result = {'name': name, 'params': params, 'runs': runs}
+    if runs:
+        result.update({
+            'min': min(runs),
+            'median': statistics.median(runs),
+            'mean': statistics.fmean(runs),
+            'max': max(runs),
+        })
+    if error:
+        result['error'] = error
+    return result
+
+
+def _timed(function, repeat, before=None):
+    runs = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def _clear_render_caches():
+    map_renderer.PARSED_CONFIG_CACHE.clear()
+    map_renderer.BACKGROUND_CACHE.clear()
+
+
+# --- Benchmarks ---
+def bench_parse(config_path, params, repeat):
+    with open(config_path) as f:
+        config_text = f.read()
+    params = dict(params, config_bytes=len(config_text))
+    return [_summary('parse_config', params, _timed(lambda: map_renderer.parse_config(config_text), repeat))]
+
+
+def bench_render(config_path, params, repeat):
+    render = lambda: map_renderer.render_map_from_config(config_path)
+    return [
+        # Cold: config parsed and background decoded on every run.
+        _summary('render_map_from_config[cold]', params, _timed(render, repeat, before=_clear_render_caches)),
+        # Warm: parsed config and decoded background come from the caches.
+        _summary('render_map_from_config[warm]', params, _timed(render, repeat)),
+    ]
+
+
+def bench_save(config_path, params, repeat, output_dir):
+    output_path = os.path.join(output_dir, 'bench-render.png')
+
+    def render_and_save():
+        map_renderer.render_and_save_map(config_path, output_path)
+        os.remove(output_path)
+
+    return [_summary('render_and_save_map[cold]', params, _timed(render_and_save, repeat, before=_clear_render_caches))]
+
+
+def bench_pipeline(config_path, background_path, params, repeat):
+    """Uploads the map through /create-map and waits until every task of it has finished."""
+    import app
+    import services
+
+    client = app.app.test_client()
+    token = client.post('/login', json={'username': 'admin', 'password': 'password'}).json['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    with open(background_path, 'rb') as f:
+        image_bytes = f.read()
+    with open(config_path) as f:
+        config_text = f.read()
+
+    runs = []
+    for run in range(repeat):
+        # A new map name per run keeps the content keys distinct, so nothing is reused.
+        start = time.perf_counter()
+        response = client.post('/create-map', headers=headers, content_type='multipart/form-data', data={
+            'map_image': (io.BytesIO(image_bytes), 'background.png'),
+            'cacti_group_id': '1',
+            'map_name': f"bench-{run}",
+            'config_content': f"# run {run} {time.time()}\n{config_text}",
+        })
+        if response.status_code != 202:
+            return [_summary('create_map_to_success', params, runs,
+                             error=f"/create-map returned {response.status_code}: {response.get_data(as_text=True)[:200]}")]
+
+        task_ids = [task['task_id'] for task in response.json['tasks']]
+        deadline = time.monotonic() + PIPELINE_TIMEOUT_SECONDS
+        while True:
+            statuses = [services.MOCK_TASKS.get(task_id)['status'] for task_id in task_ids]
+            if all(status in ('SUCCESS', 'FAILURE') for status in statuses):
+                break
+            if time.monotonic() > deadline:
+                return [_summary('create_map_to_success', params, runs, error='Timed out waiting for the tasks')]
+            services.MOCK_TASKS.wait_for_change(services.MOCK_TASKS.version, timeout=0.05)
+        if 'FAILURE' in statuses:
+            return [_summary('create_map_to_success', params, runs, error='A map task failed')]
+        runs.append(time.perf_counter() - start)
+    return [_summary('create_map_to_success', params, runs)]
+
+
+# --- Runner ---
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_size(text):
+    width, _, height = text.lower().partition('x')
+    return int(width), int(height)
+
+
+def run_benchmarks(args):
+    cache_dir = os.path.abspath(args.cache_dir)
+    previous_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='autocacti-bench-')
+    # The app and services write static/ and data/ relative to the working
+    # directory; keep them out of the source tree.
+    os.chdir(work_dir)
+    try:
+        # The renderer prints progress; keep stdout for the JSON report.
+        with contextlib.redirect_stdout(sys.stderr):
+            results = _run_suites(args, cache_dir, work_dir)
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'latency_scale': args.latency_scale,
+            'render_supersample': map_renderer.RENDER_SUPERSAMPLE,
+        },
+        'results': results,
+    }
+
+
+def _run_suites(args, cache_dir, work_dir):
+    import services
+    services.SIMULATED_LATENCY_SCALE = args.latency_scale
+
+    results = []
+    for width, height in args.backgrounds:
+        for link_count in args.links:
+            print(f"{link_count} links on {width}x{height}...", file=sys.stderr)
+            config_path, background_path = synthetic.write_map_files(cache_dir, link_count, width, height)
+            params = {'links': link_count, 'width': width, 'height': height}
+            if 'parse' in args.suites:
+                results += bench_parse(config_path, params, args.repeat)
+            if 'render' in args.suites:
+                results += bench_render(config_path, params, args.repeat)
+            if 'save' in args.suites:
+                results += bench_save(config_path, params, args.repeat, work_dir)
+            if 'pipeline' in args.suites:
+                results += bench_pipeline(config_path, background_path,
+                                          dict(params, latency_scale=args.latency_scale), args.repeat)
+            _clear_render_caches()
+    return results
+
+
+def compare(report, baseline, max_slowdown):
+    """Prints median ratios against a baseline report. Returns the regressed benchmark names."""
+    def key(result):
+        return result['name'], json.dumps(result['params'], sort_keys=True)
+
+    previous = {key(result): result for result in baseline['results'] if 'median' in result}
+    regressions = []
+    for result in report['results']:
+        before = previous.get(key(result))
+        if before is None or 'median' not in result:
+            continue
+        ratio = result['median'] / before['median'] if before['median'] else float('inf')
+        flag = 'REGRESSION' if ratio > max_slowdown else ''
+        print(f"{result['name']:32} {key(result)[1]:60} {before['median']:9.4f}s -> "
+              f"{result['median']:9.4f}s  x{ratio:5.2f} {flag}", file=sys.stderr)
+        if flag:
+            regressions.append(f"{result['name']} {key(result)[1]}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--links', type=int, nargs='+', help=f"link counts (default {LINK_SCALES})")
+    parser.add_argument('--backgrounds', type=_parse_size, nargs='+', metavar='WxH',
+                        help="background sizes (default 1024x768 4096x2304 16384x9216)")
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--quick', action='store_true', help="smaller default scales for a fast run")
+    parser.add_argument('--latency-scale', type=float, default=0.0,
+                        help="scale of the simulated service delays in the pipeline (default 0: disabled)")
+    parser.add_argument('--cache-dir', default=os.path.join(tempfile.gettempdir(), 'autocacti-bench-cache'),
+                        help="where generated configs and backgrounds are kept between runs")
+    parser.add_argument('--output', help="write the JSON report here (default: stdout)")
+    parser.add_argument('--baseline', help="JSON report of an earlier run to compare against")
+    parser.add_argument('--max-slowdown', type=float, default=1.25,
+                        help="median ratio above which a benchmark counts as regressed")
+    args = parser.parse_args(argv)
+    args.links = args.links or (QUICK_LINK_SCALES if args.quick else LINK_SCALES)
+    args.backgrounds = args.backgrounds or (QUICK_BACKGROUND_SIZES if args.quick else BACKGROUND_SIZES)
+
+    output_path = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    report = run_benchmarks(args)
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions = compare(report, json.load(f), args.max_slowdown)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed.", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
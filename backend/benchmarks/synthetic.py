@@ -0,0 +1,95 @@
+import os
+import random
+
+from PIL import Image, ImageDraw
+
+import config_generator
+
+# --- Synthetic Maps ---
+# Node box size used by the frontend; positions are top-left corners.
+NODE_SIZE = config_generator.NODE_WIDTH
+
+
+def synthetic_topology(link_count, width, height, seed=0):
+    """
+    Returns (nodes, edges) in the React Flow shape used by config_generator,
+    with link_count edges between devices spread over a width x height map.
+    About a quarter of the device pairs are joined by parallel links.
+    """
+    rng = random.Random(seed)
+    node_count = max(2, link_count // 2 + 1)
+    nodes = [{
+        'id': f"dev{i}",
+        'type': 'Switch',
+        'position': {
+            'x': rng.uniform(0, max(width - NODE_SIZE, 1)),
+            'y': rng.uniform(0, max(height - NODE_SIZE, 1))
+        },
+        'data': {'hostname': f"sw-{i}", 'ip': f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}"}
+    } for i in range(node_count)]
+
+    edges = []
+    while len(edges) < link_count:
+        source = rng.randrange(node_count)
+        # Mostly short-range links, like a real campus or DC fabric.
+        target = (source + rng.randint(1, min(8, node_count - 1))) % node_count
+        for _ in range(2 if rng.random() < 0.25 else 1):
+            edges.append({
+                'source': f"dev{source}",
+                'target': f"dev{target}",
+                'data': {'interface': f"Gi0/{len(edges) % 48}", 'bandwidth': rng.choice(['1G', '10G', '40G'])}
+            })
+    return nodes, edges[:link_count]
+
+
+def synthetic_config(link_count, width, height, seed=0):
+    nodes, edges = synthetic_topology(link_count, width, height, seed)
+    return config_generator.generate_config(nodes, edges, f"bench-{link_count}", width, height)
+
+
+def synthetic_background(width, height, seed=0):
+    """
+    Returns an RGB background with gradients, grid lines and noise, so PNG
+    encoding and decoding cost is closer to a real floor plan or map than
+    a flat colour would be.
+    """
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 24)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(seed)
+    step = max(width, height) // 32 or 1
+    for x in range(0, width, step):
+        draw.line([(x, 0), (x, height)], fill=(255, 255, 255), width=2)
+    for y in range(0, height, step):
+        draw.line([(0, y), (width, y)], fill=(255, 255, 255), width=2)
+    for _ in range(64):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.rectangle([x, y, x + step, y + step // 2], fill=(rng.randrange(256), 200, 120))
+    return image
+
+
+def write_map_files(directory, link_count, width, height, seed=0):
+    """
+    Writes a background and a config referencing it under directory, reusing
+    files from earlier runs with the same parameters. Returns (config_path,
+    background_path).
+    """
+    maps_dir = os.path.join(directory, 'maps')
+    configs_dir = os.path.join(directory, 'configs')
+    os.makedirs(maps_dir, exist_ok=True)
+    os.makedirs(configs_dir, exist_ok=True)
+
+    background_name = f"bg-{width}x{height}-{seed}.png"
+    background_path = os.path.join(maps_dir, background_name)
+    if not os.path.exists(background_path):
+        synthetic_background(width, height, seed).save(background_path, 'PNG')
+
+    config_path = os.path.join(configs_dir, f"map-{link_count}-{width}x{height}-{seed}.conf")
+    if not os.path.exists(config_path):
+        config = synthetic_config(link_count, width, height, seed)
+        config = config.replace(f"BACKGROUND images/backgrounds/bench-{link_count}.png",
+                                f"BACKGROUND ../maps/{background_name}")
+        with open(config_path, 'w') as f:
+            f.write(config)
+    return config_path, background_path
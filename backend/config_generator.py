@@ -0,0 +1,219 @@
+import math
+
+# --- Weathermap Config Template ---
+# Served to the frontend by /config-template and used by generate_config().
+CONFIG_TEMPLATE = """
+# Automatically generated by AutoCacti Map Creator
+
+BACKGROUND images/backgrounds/%name%.png
+WIDTH %width%
+HEIGHT %height%
+TITLE %name%
+
+KEYTEXTCOLOR 0 0 0
+KEYOUTLINECOLOR 0 0 0
+KEYBGCOLOR 255 255 255
+TITLECOLOR 0 0 0
+TIMECOLOR 0 0 0
+SCALE DEFAULT 0  0   192 192 192
+SCALE DEFAULT 0  1   255 255 255
+SCALE DEFAULT 1  10  140 0 255
+SCALE DEFAULT 10 25  32 32 255
+SCALE DEFAULT 25 40  0 192 255
+SCALE DEFAULT 40 55  0 240 0
+SCALE DEFAULT 55 70  240 240 0
+SCALE DEFAULT 70 85  255 192 0
+SCALE DEFAULT 85 100 255 0 0
+
+SET key_hidezero_DEFAULT 1
+
+# End of global section
+
+# TEMPLATE-only NODEs:
+# TEMPLATE-only LINKs:
+LINK DEFAULT
+    WIDTH 3
+    BWLABEL bits
+    BANDWIDTH 10000M
+
+# regular NODEs:
+%nodes%
+
+# regular LINKs:
+%links%
+
+# That's All Folks!
+""".strip()
+
+# --- Geometry (kept identical to frontend/src/services/configGenerator.js) ---
+NODE_WIDTH = 140
+NODE_HEIGHT = 140
+CONFIG_X_OFFSET = 0
+CONFIG_Y_OFFSET = 0
+# An offset to ensure link endpoints land safely inside the node's visual boundary.
+LINK_ENDPOINT_OFFSET = 70
+# The perpendicular distance between parallel links.
+PARALLEL_LINK_OFFSET = 15
+
+DUMMY_NODE_TEMPLATE = "NODE {id}\n\tPOSITION {x} {y}"
+LINK_TEMPLATE = "LINK {a}-{b}\n\tNODES {a} {b}\n\tDEVICE {hostname} {ip}\n\tINTERFACE {interface}\n\tBANDWIDTH {bandwidth}"
+
+
+def _js_round(value):
+    """Math.round semantics (halves round up), so output matches the frontend exactly."""
+    return math.floor(value + 0.5)
+
+
+def _js_str(value):
+    """Formats a number the way JavaScript string conversion does (1920, not 1920.0)."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _js_field(data, key):
+    """Formats data[key] the way a JavaScript template literal does, including undefined and null."""
+    if key not in data:
+        return 'undefined'
+    if data[key] is None:
+        return 'null'
+    return _js_str(data[key])
+
+
+def group_edges(edges):
+    """
+    Groups edges by the unordered pair of nodes they connect and keeps, per
+    pair, the direction that reported more links (the forward direction from
+    the smaller node ID on ties), like the frontend. Groups keep the order in
+    which pairs first appear.
+    """
+    groups = {}
+    for edge in edges:
+        key = tuple(sorted((edge['source'], edge['target'])))
+        groups.setdefault(key, []).append(edge)
+
+    for (node_a, node_b), group in groups.items():
+        forward = [edge for edge in group if edge['source'] == node_a]
+        reverse = [edge for edge in group if edge['source'] == node_b]
+        yield forward if len(forward) >= len(reverse) else reverse
+
+
+def iter_config_entries(nodes, edges, scale_factor=1):
+    """
+    Yields (dummy_node_strings, link_string) for every drawable link. Each
+    link gets two invisible anchor nodes, offset perpendicular to the line so
+    parallel links between the same devices are drawn side by side.
+    """
+    node_info = {node['id']: node for node in nodes if node.get('type') != 'group'}
+    node_counter = 1
+
+    for edges_to_process in group_edges(edges):
+        total = len(edges_to_process)
+        initial_offset = -PARALLEL_LINK_OFFSET * (total - 1) / 2
+
+        for i, edge in enumerate(edges_to_process):
+            source = node_info.get(edge['source'])
+            target = node_info.get(edge['target'])
+            if not source or not target:
+                continue
+
+            source_center_x = source['position']['x'] + (NODE_WIDTH / 2)
+            source_center_y = source['position']['y'] + (NODE_HEIGHT / 2)
+            target_center_x = target['position']['x'] + (NODE_WIDTH / 2)
+            target_center_y = target['position']['y'] + (NODE_HEIGHT / 2)
+
+            dx = target_center_x - source_center_x
+            dy = target_center_y - source_center_y
+            distance = math.sqrt(dx * dx + dy * dy)
+            if distance == 0:
+                continue
+
+            ux, uy = dx / distance, dy / distance
+            px, py = -uy, ux
+
+            current_offset = initial_offset + i * PARALLEL_LINK_OFFSET
+            offset_x, offset_y = px * current_offset, py * current_offset
+
+            dummy1_x = _js_round((source_center_x + offset_x + ux * LINK_ENDPOINT_OFFSET) * scale_factor) + CONFIG_X_OFFSET
+            dummy1_y = _js_round((source_center_y + offset_y + uy * LINK_ENDPOINT_OFFSET) * scale_factor) + CONFIG_Y_OFFSET
+            dummy2_x = _js_round((target_center_x + offset_x - ux * LINK_ENDPOINT_OFFSET) * scale_factor) + CONFIG_X_OFFSET
+            dummy2_y = _js_round((target_center_y + offset_y - uy * LINK_ENDPOINT_OFFSET) * scale_factor) + CONFIG_Y_OFFSET
+
+            dummy1_id = f"node{node_counter:05d}"
+            dummy2_id = f"node{node_counter + 1:05d}"
+            node_counter += 2
+
+            edge_data = edge.get('data') or {}
+            source_data = source.get('data') or {}
+            yield (
+                (DUMMY_NODE_TEMPLATE.format(id=dummy1_id, x=dummy1_x, y=dummy1_y),
+                 DUMMY_NODE_TEMPLATE.format(id=dummy2_id, x=dummy2_x, y=dummy2_y)),
+                LINK_TEMPLATE.format(
+                    a=dummy1_id, b=dummy2_id,
+                    hostname=_js_field(source_data, 'hostname'), ip=_js_field(source_data, 'ip'),
+                    interface=edge_data.get('interface') or 'unknown',
+                    bandwidth=edge_data.get('bandwidth') or '1G'
+                )
+            )
+
+
+def _joined(strings, separator='\n\n'):
+    first = True
+    for string in strings:
+        if not first:
+            yield separator
+        yield string
+        first = False
+
+
+def _trimmed(chunks):
+    """Strips leading and trailing whitespace from a stream of chunks, like str.strip()."""
+    started = False
+    pending = ''
+    for chunk in chunks:
+        if not started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            started = True
+        stripped = chunk.rstrip()
+        if stripped:
+            yield pending + stripped
+            pending = chunk[len(stripped):]
+        else:
+            pending += chunk
+
+
+def iter_config(nodes, edges, map_name, map_width, map_height, scale_factor=1, template=CONFIG_TEMPLATE):
+    """
+    Generates a Weathermap .conf in chunks, byte-for-byte identical to
+    generateCactiConfig() in the frontend for the same input. Nodes and edges
+    use the React Flow shape: nodes {id, type, position: {x, y}, data:
+    {hostname, ip}} and edges {source, target, data: {interface, bandwidth}}.
+    """
+    config = template.replace('%name%', str(map_name))
+    config = config.replace('%width%', _js_str(map_width), 1)
+    config = config.replace('%height%', _js_str(map_height), 1)
+
+    entries = list(iter_config_entries(nodes, edges, scale_factor))
+    sections = {
+        '%nodes%': lambda: _joined(node for node_pair, _ in entries for node in node_pair),
+        '%links%': lambda: _joined(link for _, link in entries),
+    }
+
+    def chunks():
+        remaining = config
+        # Fill placeholders in the order they appear in the template.
+        placeholders = sorted((p for p in sections if p in remaining), key=remaining.index)
+        for placeholder in placeholders:
+            before, _, remaining = remaining.partition(placeholder)
+            yield before
+            yield from sections[placeholder]()
+        yield remaining
+
+    return _trimmed(chunks())
+
+
+def generate_config(nodes, edges, map_name, map_width, map_height, scale_factor=1, template=CONFIG_TEMPLATE):
+    """Returns the whole generated .conf as a string."""
+    return ''.join(iter_config(nodes, edges, map_name, map_width, map_height, scale_factor, template))
@@ -0,0 +1,364 @@
+"""
+Device data sources behind the SNMP lookups in services.py.
+
+A data source answers the three lookup kinds ('info', 'neighbors' and
+'full_neighbors') for one IP and says how long the lookup took on the wire.
+services.py sleeps for that long (scaled by AUTOCACTI_LATENCY_SCALE) and
+caches the answer, so discovery, caching and layout can be exercised against
+any backend:
+
+    AUTOCACTI_DATA_SOURCE=mock       the hand-written tables in services.py (default)
+    AUTOCACTI_DATA_SOURCE=synthetic  a seeded campus topology of
+                                     AUTOCACTI_SYNTHETIC_DEVICES devices
+    AUTOCACTI_DATA_SOURCE=replay     responses recorded in AUTOCACTI_REPLAY_FILE
+
+Replay files are gzip-compressed JSON lines and are written with:
+
+    python data_sources.py record --devices 20000 synthetic-20k.jsonl.gz
+"""
+import abc
+import argparse
+import gzip
+import json
+import math
+import os
+import random
+import sys
+
+import topology
+
+LOOKUP_KINDS = ('info', 'neighbors', 'full_neighbors')
+
+# --- Data Source Configuration ---
+DATA_SOURCE = os.environ.get('AUTOCACTI_DATA_SOURCE', 'mock')
+SYNTHETIC_DEVICES = int(os.environ.get('AUTOCACTI_SYNTHETIC_DEVICES', 20000))
+SYNTHETIC_SEED = int(os.environ.get('AUTOCACTI_SYNTHETIC_SEED', 0))
+REPLAY_FILE = os.environ.get('AUTOCACTI_REPLAY_FILE', os.path.join('data', 'snmp-replay.jsonl.gz'))
+
+
+class DataSource(abc.ABC):
+    """
+    Base class: device and neighbor tables plus a latency model.
+
+    The tables have the shapes of MOCK_NETWORK, MOCK_NEIGHBORS and
+    MOCK_FULL_SCAN_EXTRAS; they are indexed once, and neighbor answers are
+    read from the index. Subclasses implement sample().
+    """
+
+    def __init__(self, devices, neighbors, full_scan_extras=None):
+        self.devices = devices
+        self.index = topology.build_index(devices, neighbors, full_scan_extras)
+
+    @abc.abstractmethod
+    def sample(self, kind, ip_address):
+        """Returns (latency_seconds, responded) for one lookup."""
+
+    def response(self, kind, ip_address):
+        """Returns what the device answers to a lookup, or None."""
+        device = self.devices.get(ip_address)
+        if device is None:
+            return None
+        if kind == 'info':
+            return {
+                "ip": ip_address,
+                "model": device.get("model", "Unknown Model"),
+                "type": device.get("type", "Unknown Type"),
+                "hostname": device.get("hostname", "Unknown Hostname")
+            }
+        # Full scans return the standard neighbors plus the extra 'hidden'
+        # ones, merged once when the index was built.
+        neighbors = self.index.device_neighbors(ip_address, full_scan=(kind == 'full_neighbors'))
+        if neighbors:
+            return {"neighbors": neighbors}
+        return None
+
+    def lookup(self, kind, ip_address):
+        """Returns (latency_seconds, result); result is None for unknown devices and timeouts."""
+        latency, responded = self.sample(kind, ip_address)
+        return latency, (self.response(kind, ip_address) if responded else None)
+
+
+# --- Mock Tables ---
+# Simulated network latency of each lookup kind, in seconds.
+MOCK_LATENCY = {
+    'info': (0.3, 1.2),
+    'neighbors': (0.5, 1.5),
+    'full_neighbors': (2.0, 4.0),  # Full scan takes longer
+}
+
+class MockDataSource(DataSource):
+    """The fixed mock tables, with uniformly distributed latency and no failures."""
+
+    def __init__(self, devices, neighbors, full_scan_extras=None, latency=MOCK_LATENCY):
+        super().__init__(devices, neighbors, full_scan_extras)
+        self.latency = latency
+
+    def sample(self, kind, ip_address):
+        return random.uniform(*self.latency[kind]), True
+
+
+# --- Synthetic Topology ---
+# Access switches per distribution pair, and distribution pairs per core pair.
+SYNTHETIC_ACCESS_PER_DISTRIBUTION = 40
+SYNTHETIC_DISTRIBUTION_PER_CORE = 24
+# Share of access switches whose full scan finds unmanaged gear (ARP only).
+SYNTHETIC_ARP_EXTRAS_RATE = 0.3
+
+# Median round trip per tier, in seconds. Lookups cost a few round trips
+# ('info' reads sysDescr/sysName) or a table walk that grows with the
+# number of rows (CDP for 'neighbors', CDP + ARP for 'full_neighbors').
+SYNTHETIC_RTT = {'core': 0.004, 'distribution': 0.008, 'access': 0.02, 'firewall': 0.01}
+SYNTHETIC_RTT_SIGMA = 0.6
+SYNTHETIC_ROUND_TRIPS = {'info': 3, 'neighbors': 4, 'full_neighbors': 12}
+SYNTHETIC_ROWS_PER_ROUND_TRIP = 10
+# A slow device (busy CPU, far away) answers this many times slower.
+SYNTHETIC_SLOW_RATE = 0.05
+SYNTHETIC_SLOW_FACTOR = 8
+# Unreachable devices never answer; others drop a lookup now and then.
+# Either way the lookup costs the SNMP timeout for every try.
+SYNTHETIC_UNREACHABLE_RATE = 0.005
+SYNTHETIC_TIMEOUT_RATE = 0.01
+SYNTHETIC_SNMP_TIMEOUT = 1.0
+SYNTHETIC_SNMP_RETRIES = 2
+
+SYNTHETIC_MODELS = {
+    'core': ('Cisco ASR 9006', 'Cisco Nexus 9508', 'Juniper MX480'),
+    'distribution': ('Cisco Catalyst 9500', 'Cisco Nexus 93180YC-EX', 'Arista 7280R'),
+    'access': ('Cisco Catalyst 9300-48P', 'Cisco Catalyst 9200-24T', 'Aruba 6300M', 'Cisco Catalyst 2960-X'),
+    'firewall': ('Palo Alto PA-5220', 'Fortinet FortiGate 1800F'),
+}
+
+
+def _synthetic_ip(index):
+    """Device IPs in 10.0.0.0/8, skipping .0 and .255."""
+    block, host = divmod(index, 254)
+    return f"10.{block // 256 % 256}.{block % 256}.{host + 1}"
+
+
+class SyntheticDataSource(DataSource):
+    """
+    A seeded three-tier campus of device_count devices (one fewer when a
+    very small campus cannot be split into whole pairs).
+
+    Core routers come in pairs with parallel cross links; each core pair
+    serves up to SYNTHETIC_DISTRIBUTION_PER_CORE distribution pairs, and
+    each distribution pair up to SYNTHETIC_ACCESS_PER_DISTRIBUTION access
+    switches, dual-homed. The first core pair also connects to a firewall
+    pair, and every core router to its neighbouring pairs. Full scans find
+    out-of-band management links and ARP-only devices.
+
+    Lookups take a lognormal number of round trips to the device, slower
+    for access switches and for a few slow devices; some devices never
+    answer and others time out now and then. The same seed gives the same
+    topology and the same slow and unreachable devices.
+    """
+
+    def __init__(self, device_count=SYNTHETIC_DEVICES, seed=SYNTHETIC_SEED):
+        # The smallest campus is one core pair.
+        device_count = max(2, device_count)
+        self.device_count = device_count
+        self.seed = seed
+        rng = random.Random(seed)
+        self._tiers = {}
+        self._ports = {}
+        devices, neighbors, extras = {}, {}, {}
+
+        def add_device(tier, hostname):
+            ip = _synthetic_ip(len(devices))
+            devices[ip] = {
+                "hostname": hostname,
+                "type": 'Firewall' if tier == 'firewall' else ('Router' if tier == 'core' else 'Switch'),
+                "model": rng.choice(SYNTHETIC_MODELS[tier]),
+            }
+            self._tiers[ip] = tier
+            neighbors[ip] = []
+            return ip
+
+        def port(ip, prefix):
+            self._ports[ip] = self._ports.get(ip, 0) + 1
+            return f"{prefix}1/0/{self._ports[ip]}"
+
+        def connect(a, b, bandwidth, description, table=neighbors, parallel=1):
+            prefix = 'TenGigabitEthernet' if bandwidth != '1G' else 'GigabitEthernet'
+            for _ in range(parallel):
+                for local, remote in ((a, b), (b, a)):
+                    table.setdefault(local, []).append({
+                        "interface": port(local, prefix),
+                        "hostname": devices[remote]["hostname"],
+                        "ip": remote,
+                        "description": description,
+                        "bandwidth": bandwidth
+                    })
+                    if table is extras:
+                        table[local][-1]["isFullScan"] = True
+
+        # Size the tiers so the total comes out at device_count.
+        access_per_core = SYNTHETIC_DISTRIBUTION_PER_CORE * (2 + 2 * SYNTHETIC_ACCESS_PER_DISTRIBUTION)
+        core_pairs = max(1, math.ceil(device_count / (2 + access_per_core)))
+        has_firewalls = device_count >= 2 * core_pairs + 2
+        remaining = device_count - 2 * core_pairs - (2 if has_firewalls else 0)
+        distribution_pairs = math.ceil(remaining / (2 + SYNTHETIC_ACCESS_PER_DISTRIBUTION))
+        access_count = max(0, remaining - 2 * distribution_pairs)
+
+        cores = []
+        for pair in range(core_pairs):
+            a = add_device('core', f"core-rtr-{pair}-a")
+            b = add_device('core', f"core-rtr-{pair}-b")
+            connect(a, b, '100G', "Cross-Core Link", parallel=2)
+            if cores:
+                connect(cores[-1][0], a, '100G', "Core Ring")
+                connect(cores[-1][1], b, '100G', "Core Ring")
+            cores.append((a, b))
+        if has_firewalls:
+            firewalls = (add_device('firewall', "fw-edge-a"), add_device('firewall', "fw-edge-b"))
+            connect(*firewalls, '10G', "HA Link")
+            for firewall in firewalls:
+                for core in cores[0]:
+                    connect(core, firewall, '40G', "Internet Edge")
+
+        access_left = access_count
+        for pair in range(distribution_pairs):
+            if len(devices) + 2 > device_count:
+                break
+            core_pair = cores[pair * core_pairs // distribution_pairs]
+            dist = (add_device('distribution', f"dist-sw-{pair}-a"), add_device('distribution', f"dist-sw-{pair}-b"))
+            connect(*dist, '40G', "Distribution Peer Link", parallel=2)
+            for switch in dist:
+                for core in core_pair:
+                    connect(core, switch, '40G', f"Uplink to {devices[core]['hostname']}")
+            # Management interfaces are only seen by a full scan.
+            connect(core_pair[0], dist[0], '1G', "OOB Management detected via IP Scan", table=extras)
+
+            share = math.ceil(access_left / (distribution_pairs - pair))
+            for number in range(share):
+                access = add_device('access', f"acc-sw-{pair}-{number}")
+                for switch in dist:
+                    connect(switch, access, rng.choice(('1G', '10G', '10G')),
+                            f"Uplink to {devices[switch]['hostname']}")
+                if rng.random() < SYNTHETIC_ARP_EXTRAS_RATE:
+                    extras.setdefault(access, []).append({
+                        "interface": f"Vlan{rng.randint(100, 999)}",
+                        "hostname": f"unmanaged-{pair}-{number}",
+                        "ip": f"172.{16 + pair // 256 % 16}.{pair % 256}.{number % 254 + 1}",
+                        "description": "ARP Entry - Unmanaged Device",
+                        "bandwidth": "Unknown",
+                        "isFullScan": True
+                    })
+            access_left -= share
+
+        super().__init__(devices, neighbors, extras)
+
+        # Per-device latency traits, fixed by the seed.
+        self._rtt = {}
+        self._unreachable = set()
+        for ip, tier in self._tiers.items():
+            rtt = SYNTHETIC_RTT[tier]
+            if rng.random() < SYNTHETIC_SLOW_RATE:
+                rtt *= SYNTHETIC_SLOW_FACTOR
+            self._rtt[ip] = rtt
+            if tier == 'access' and rng.random() < SYNTHETIC_UNREACHABLE_RATE:
+                self._unreachable.add(ip)
+        self._rows = {ip: len(self.index.device_neighbors(ip, full_scan=True) or ()) for ip in devices}
+        self._rng = random.Random(seed + 1)
+
+    def sample(self, kind, ip_address):
+        timeout = SYNTHETIC_SNMP_TIMEOUT * (1 + SYNTHETIC_SNMP_RETRIES)
+        if ip_address not in self._rtt or ip_address in self._unreachable:
+            return timeout, False
+        if self._rng.random() < SYNTHETIC_TIMEOUT_RATE:
+            return timeout, False
+        round_trips = SYNTHETIC_ROUND_TRIPS[kind]
+        if kind != 'info':
+            round_trips += self._rows[ip_address] // SYNTHETIC_ROWS_PER_ROUND_TRIP
+        latency = self._rtt[ip_address] * round_trips * self._rng.lognormvariate(0, SYNTHETIC_RTT_SIGMA)
+        return min(latency, timeout), True
+
+
+# --- Replay ---
+REPLAY_FORMAT = 'autocacti-snmp-replay'
+REPLAY_VERSION = 1
+
+class ReplayDataSource(DataSource):
+    """
+    Answers lookups with responses recorded in a replay file, after the
+    recorded latency. Lookups that were not recorded answer None at once.
+    """
+
+    def __init__(self, path=REPLAY_FILE):
+        self.path = path
+        self._records = {}
+        devices, neighbors, extras = {}, {}, {}
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline() or 'null')
+            if not isinstance(header, dict) or header.get('format') != REPLAY_FORMAT:
+                raise ValueError(f"{path} is not an SNMP replay file.")
+            if header.get('version') != REPLAY_VERSION:
+                raise ValueError(f"Unsupported replay file version: {header.get('version')}")
+            for line in f:
+                kind, ip, latency_ms, value = json.loads(line)
+                self._records[(kind, ip)] = (latency_ms / 1000, value)
+                if value is None:
+                    continue
+                if kind == 'info':
+                    devices[ip] = {key: value[key] for key in ('hostname', 'type', 'model')}
+                elif kind == 'neighbors':
+                    neighbors[ip] = value['neighbors']
+                elif kind == 'full_neighbors':
+                    extras[ip] = [entry for entry in value['neighbors'] if entry.get('isFullScan')]
+        # The index serves the topology queries; lookups return the recordings.
+        super().__init__(devices, neighbors, extras)
+
+    def sample(self, kind, ip_address):
+        record = self._records.get((kind, ip_address))
+        return (record[0], True) if record else (0.0, False)
+
+    def response(self, kind, ip_address):
+        record = self._records.get((kind, ip_address))
+        return record[1] if record else None
+
+
+def record_replay(source, path, ip_addresses=None, kinds=LOOKUP_KINDS):
+    """
+    Runs every lookup kind against every device of source (or the given IPs)
+    without sleeping and writes the responses and latencies to a replay
+    file. Returns the number of records written.
+    """
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps({'format': REPLAY_FORMAT, 'version': REPLAY_VERSION}) + '\n')
+        for ip in (ip_addresses if ip_addresses is not None else source.devices):
+            for kind in kinds:
+                latency, value = source.lookup(kind, ip)
+                f.write(json.dumps([kind, ip, round(latency * 1000, 3), value], separators=(',', ':')) + '\n')
+                count += 1
+    return count
+
+
+def create_data_source(mock_devices, mock_neighbors, mock_full_scan_extras, name=DATA_SOURCE):
+    """Returns the data source selected by AUTOCACTI_DATA_SOURCE."""
+    if name == 'mock':
+        return MockDataSource(mock_devices, mock_neighbors, mock_full_scan_extras)
+    if name == 'synthetic':
+        return SyntheticDataSource(SYNTHETIC_DEVICES, SYNTHETIC_SEED)
+    if name == 'replay':
+        return ReplayDataSource(REPLAY_FILE)
+    raise ValueError(f"Unknown AUTOCACTI_DATA_SOURCE: {name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Records a synthetic topology as an SNMP replay file.")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    record = subcommands.add_parser('record')
+    record.add_argument('output')
+    record.add_argument('--devices', type=int, default=SYNTHETIC_DEVICES)
+    record.add_argument('--seed', type=int, default=SYNTHETIC_SEED)
+    args = parser.parse_args(argv)
+
+    source = SyntheticDataSource(args.devices, args.seed)
+    count = record_replay(source, args.output)
+    print(f"Recorded {count} lookups of {len(source.devices)} devices to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,303 @@
+import os
+import posixpath
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import paramiko
+except ImportError:  # Only needed for AUTOCACTI_DELIVERY=ssh.
+    paramiko = None
+
+# --- Delivery Configuration ---
+# 'off' keeps rendered maps local (static/final_maps only), 'ssh' pushes them
+# to every installation over SFTP, and 'local' writes them under
+# DELIVERY_LOCAL_ROOT/<installation ip>/, standing in for the installations.
+DELIVERY_MODE = os.environ.get('AUTOCACTI_DELIVERY', 'off')
+DELIVERY_LOCAL_ROOT = os.environ.get('AUTOCACTI_DELIVERY_LOCAL_ROOT', os.path.join('data', 'delivery'))
+
+DELIVERY_SSH_USER = os.environ.get('AUTOCACTI_DELIVERY_SSH_USER', 'cacti')
+DELIVERY_SSH_PORT = int(os.environ.get('AUTOCACTI_DELIVERY_SSH_PORT', 22))
+DELIVERY_SSH_KEY = os.environ.get(
+    'AUTOCACTI_DELIVERY_SSH_KEY', os.path.join('..', 'cacti_server', 'ssh-key-2025-06-24.key')
+)
+# Known-hosts file to verify installations against; unknown hosts are
+# rejected unless AUTOCACTI_DELIVERY_SSH_TRUST_NEW=1.
+DELIVERY_SSH_KNOWN_HOSTS = os.environ.get('AUTOCACTI_DELIVERY_SSH_KNOWN_HOSTS')
+DELIVERY_SSH_TRUST_NEW = os.environ.get('AUTOCACTI_DELIVERY_SSH_TRUST_NEW') == '1'
+DELIVERY_CONNECT_TIMEOUT = 10
+# Weathermap plugin directory on the installations.
+DELIVERY_REMOTE_ROOT = os.environ.get('AUTOCACTI_DELIVERY_REMOTE_ROOT', '/var/www/html/cacti/plugins/weathermap')
+
+# Installations delivered to at the same time, across all uploads.
+DELIVERY_MAX_WORKERS = int(os.environ.get('AUTOCACTI_DELIVERY_WORKERS', 8))
+# Open connections kept per installation, and how long an idle one is kept.
+DELIVERY_POOL_SIZE = 2
+DELIVERY_IDLE_SECONDS = 300
+# Published files get a '<name>.sha256' sidecar holding their content key;
+# a file whose sidecar already matches is not transferred again.
+DIGEST_SUFFIX = '.sha256'
+
+
+class DeliveryError(Exception):
+    """Raised when a map could not be published to an installation."""
+
+
+# --- Transports ---
+class LocalTransport:
+    """Publishes into a local directory tree; used for tests and as an SFTP stand-in."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, remote_path):
+        return os.path.join(self.root, remote_path.lstrip('/'))
+
+    def read_text(self, remote_path):
+        try:
+            with open(self._path(remote_path)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def makedirs(self, remote_dir):
+        os.makedirs(self._path(remote_dir), exist_ok=True)
+
+    def put(self, local_path, remote_path):
+        shutil.copyfile(local_path, self._path(remote_path))
+
+    def put_text(self, text, remote_path):
+        with open(self._path(remote_path), 'w') as f:
+            f.write(text)
+
+    def rename(self, source, destination):
+        os.replace(self._path(source), self._path(destination))
+
+    def remove(self, remote_path):
+        try:
+            os.remove(self._path(remote_path))
+        except FileNotFoundError:
+            pass
+
+    def is_alive(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class SftpTransport:
+    """One SSH connection with an SFTP session to an installation."""
+
+    def __init__(self, host, port=DELIVERY_SSH_PORT, username=DELIVERY_SSH_USER, key_path=DELIVERY_SSH_KEY):
+        if paramiko is None:
+            raise DeliveryError("SSH delivery requires the 'paramiko' package.")
+        self.client = paramiko.SSHClient()
+        if DELIVERY_SSH_KNOWN_HOSTS:
+            self.client.load_host_keys(DELIVERY_SSH_KNOWN_HOSTS)
+        else:
+            self.client.load_system_host_keys()
+        self.client.set_missing_host_key_policy(
+            paramiko.AutoAddPolicy() if DELIVERY_SSH_TRUST_NEW else paramiko.RejectPolicy()
+        )
+        self.client.connect(
+            host, port=port, username=username, key_filename=key_path,
+            timeout=DELIVERY_CONNECT_TIMEOUT, allow_agent=False, look_for_keys=False
+        )
+        self.sftp = self.client.open_sftp()
+        self._made_dirs = set()
+
+    def read_text(self, remote_path):
+        try:
+            with self.sftp.open(remote_path, 'r') as f:
+                return f.read().decode('utf-8')
+        except FileNotFoundError:
+            return None
+
+    def makedirs(self, remote_dir):
+        if remote_dir in self._made_dirs:
+            return
+        path = ''
+        for part in remote_dir.split('/'):
+            path = posixpath.join(path, part) if path else (part or '/')
+            try:
+                self.sftp.stat(path)
+            except FileNotFoundError:
+                try:
+                    self.sftp.mkdir(path)
+                except OSError:
+                    # Another connection may have created it in the meantime.
+                    self.sftp.stat(path)
+        self._made_dirs.add(remote_dir)
+
+    def put(self, local_path, remote_path):
+        self.sftp.put(local_path, remote_path, confirm=False)
+
+    def put_text(self, text, remote_path):
+        with self.sftp.open(remote_path, 'w') as f:
+            f.write(text.encode('utf-8'))
+
+    def rename(self, source, destination):
+        # posix-rename@openssh.com replaces the destination atomically.
+        self.sftp.posix_rename(source, destination)
+
+    def remove(self, remote_path):
+        try:
+            self.sftp.remove(remote_path)
+        except FileNotFoundError:
+            pass
+
+    def is_alive(self):
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def close(self):
+        self.client.close()
+
+
+# --- Connection Pool ---
+class ConnectionPool:
+    """
+    Keeps up to max_per_host open transports per installation for reuse.
+
+    acquire() hands out an idle live transport or opens a new one, waiting
+    when max_per_host are already in use. Transports idle for longer than
+    idle_seconds are closed on the next acquire.
+    """
+
+    def __init__(self, connect, max_per_host=DELIVERY_POOL_SIZE, idle_seconds=DELIVERY_IDLE_SECONDS):
+        self._connect = connect
+        self.max_per_host = max_per_host
+        self.idle_seconds = idle_seconds
+        self._idle = {}   # host -> [(released_at, transport)]
+        self._slots = {}  # host -> BoundedSemaphore
+        self._lock = threading.Lock()
+
+    def acquire(self, host):
+        with self._lock:
+            slots = self._slots.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+        slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    idle = self._idle.get(host)
+                    released_at, transport = idle.pop() if idle else (None, None)
+                if transport is None:
+                    return self._connect(host)
+                if time.monotonic() - released_at < self.idle_seconds and transport.is_alive():
+                    return transport
+                transport.close()
+        except BaseException:
+            slots.release()
+            raise
+
+    def release(self, host, transport, broken=False):
+        if broken:
+            transport.close()
+        else:
+            with self._lock:
+                self._idle.setdefault(host, []).append((time.monotonic(), transport))
+        self._slots[host].release()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for transports in idle.values():
+            for _, transport in transports:
+                transport.close()
+
+
+# --- Publishing ---
+def publish_files(transport, files):
+    """
+    Publishes files ([(local_path, remote_path, digest)]) through a transport.
+
+    Each file is uploaded under a temporary name and renamed over the final
+    path, so Cacti never reads a partial file. Files whose remote digest
+    sidecar already matches are skipped. Returns (uploaded, skipped).
+    """
+    uploaded = skipped = 0
+    for local_path, remote_path, digest in files:
+        digest_path = remote_path + DIGEST_SUFFIX
+        remote_digest = transport.read_text(digest_path)
+        if remote_digest is not None and remote_digest.strip() == digest:
+            skipped += 1
+            continue
+
+        transport.makedirs(posixpath.dirname(remote_path))
+        tmp_path = f"{remote_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            transport.put(local_path, tmp_path)
+            transport.rename(tmp_path, remote_path)
+        except BaseException:
+            transport.remove(tmp_path)
+            raise
+        transport.put_text(digest + '\n', digest_path)
+        uploaded += 1
+    return uploaded, skipped
+
+
+class Deliverer:
+    """Publishes rendered maps to installations over pooled connections, in parallel."""
+
+    def __init__(self, mode=DELIVERY_MODE, max_workers=DELIVERY_MAX_WORKERS):
+        self.mode = mode
+        if mode == 'ssh':
+            self.pool = ConnectionPool(lambda host: SftpTransport(host))
+        elif mode == 'local':
+            self.pool = ConnectionPool(lambda host: LocalTransport(os.path.join(DELIVERY_LOCAL_ROOT, host)))
+        elif mode == 'off':
+            self.pool = None
+        else:
+            raise ValueError(f"Unknown AUTOCACTI_DELIVERY mode: {mode}")
+        self.max_workers = max_workers
+        # Created on the first submit(), so processes that never deliver
+        # (delivery off, or a web process with external workers) start no threads.
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.pool is not None
+
+    def deliver(self, host, files):
+        """Publishes files to one installation host. Returns (uploaded, skipped)."""
+        try:
+            transport = self.pool.acquire(host)
+        except Exception as e:
+            raise DeliveryError(f"Could not connect to {host}: {e}")
+        try:
+            result = publish_files(transport, files)
+        except Exception as e:
+            # The connection may be half-broken; never hand it out again.
+            self.pool.release(host, transport, broken=True)
+            raise DeliveryError(f"Delivery to {host} failed: {e}")
+        self.pool.release(host, transport)
+        return result
+
+    def submit(self, host, files):
+        """Starts deliver() on the delivery pool and returns its Future."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='map-delivery')
+        return self._executor.submit(self.deliver, host, files)
+
+
+def map_files(artifact, map_name):
+    """
+    Lists the files that publish one rendered map, laid out like the
+    Weathermap plugin: configs/<name>.conf referencing ../maps/<image>.png,
+    and output/<name>.png for the rendered map. Digests are the content keys
+    the files are already stored under, so nothing is re-hashed.
+    """
+    safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in map_name) or 'map'
+    return [
+        (artifact['image_path'], posixpath.join(DELIVERY_REMOTE_ROOT, 'maps', os.path.basename(artifact['image_path'])),
+         artifact['image_key']),
+        (artifact['config_path'], posixpath.join(DELIVERY_REMOTE_ROOT, 'configs', f"{safe_name}.conf"),
+         artifact['content_key']),
+        (artifact['final_map_path'], posixpath.join(DELIVERY_REMOTE_ROOT, 'output', f"{safe_name}.png"),
+         artifact['content_key']),
+    ]
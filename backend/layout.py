@@ -0,0 +1,237 @@
+import math
+import random
+
+# --- Layout Configuration ---
+# Node box size used by the frontend (see configGenerator.js); positions are
+# the top-left corner of that box, like React Flow node positions.
+NODE_WIDTH = 140
+NODE_HEIGHT = 140
+LAYOUT_MARGIN = 20
+# Smallest gap kept between node boxes when a tier is wrapped onto several rows.
+MIN_NODE_SPACING = 20
+
+# Hierarchical layers by device type; anything else is treated as an endpoint.
+TYPE_LAYERS = {
+    'Router': 0,
+    'Firewall': 1,
+    'Encryptor': 1,
+    'Switch': 2,
+}
+ENDPOINT_LAYER = 3
+# Barycenter ordering passes (down and up) used to reduce edge crossings.
+ORDERING_PASSES = 4
+
+FORCE_ITERATIONS = 150
+FORCE_MAX_ITERATIONS = 500
+
+
+def _fit_to_canvas(positions, width, height, node_width, node_height):
+    """Scales raw center coordinates into top-left positions that keep every node inside the map."""
+    if not positions:
+        return {}
+    xs = [x for x, _ in positions.values()]
+    ys = [y for _, y in positions.values()]
+    min_x, max_x, min_y, max_y = min(xs), max(xs), min(ys), max(ys)
+
+    usable_width = max(width - node_width - 2 * LAYOUT_MARGIN, 0)
+    usable_height = max(height - node_height - 2 * LAYOUT_MARGIN, 0)
+
+    def scale(value, low, high, usable):
+        if high - low < 1e-9:
+            return LAYOUT_MARGIN + usable / 2
+        return LAYOUT_MARGIN + (value - low) / (high - low) * usable
+
+    return {
+        node_id: {
+            'x': round(scale(x, min_x, max_x, usable_width)),
+            'y': round(scale(y, min_y, max_y, usable_height))
+        }
+        for node_id, (x, y) in positions.items()
+    }
+
+
+def _build_adjacency(node_ids, edges):
+    adjacency = {node_id: set() for node_id in node_ids}
+    for edge in edges:
+        source, target = edge['source'], edge['target']
+        if source in adjacency and target in adjacency and source != target:
+            adjacency[source].add(target)
+            adjacency[target].add(source)
+    return adjacency
+
+
+# --- Hierarchical Layout ---
+def _layer_of(node):
+    return TYPE_LAYERS.get(node.get('type'), ENDPOINT_LAYER)
+
+def row_capacity(width, node_width=NODE_WIDTH):
+    """Returns how many nodes fit side by side in width, MIN_NODE_SPACING apart."""
+    usable = width - 2 * LAYOUT_MARGIN + MIN_NODE_SPACING
+    return max(1, int(usable // (node_width + MIN_NODE_SPACING)))
+
+def rows_height(row_count, node_height=NODE_HEIGHT):
+    """Returns the canvas height that fits row_count rows, MIN_NODE_SPACING apart."""
+    return 2 * LAYOUT_MARGIN + row_count * node_height + max(row_count - 1, 0) * MIN_NODE_SPACING
+
+def hierarchical_positions(nodes, edges, max_row_nodes=None):
+    """
+    Places nodes in rows by device type (routers on top, endpoints at the
+    bottom). Rows are ordered with alternating barycenter sweeps so that
+    connected devices line up and edge crossings are reduced. A tier with
+    more than max_row_nodes nodes is wrapped onto several rows.
+    Returns {node_id: (x, y)} in abstract units, one unit per row.
+    """
+    node_ids = [node['id'] for node in nodes]
+    adjacency = _build_adjacency(node_ids, edges)
+
+    layers = {}
+    for node in nodes:
+        layers.setdefault(_layer_of(node), []).append(node['id'])
+    rows = [sorted(layers[layer]) for layer in sorted(layers)]
+
+    order = {}
+    for row in rows:
+        for index, node_id in enumerate(row):
+            order[node_id] = index
+
+    def barycenter(node_id, reference):
+        linked = [order[n] for n in adjacency[node_id] if n in reference]
+        return sum(linked) / len(linked) if linked else order[node_id]
+
+    for sweep in range(ORDERING_PASSES):
+        row_indexes = range(1, len(rows)) if sweep % 2 == 0 else range(len(rows) - 2, -1, -1)
+        for row_index in row_indexes:
+            neighbor_row = rows[row_index - 1] if sweep % 2 == 0 else rows[row_index + 1]
+            reference = set(neighbor_row)
+            rows[row_index].sort(key=lambda node_id: barycenter(node_id, reference))
+            for index, node_id in enumerate(rows[row_index]):
+                order[node_id] = index
+
+    if max_row_nodes:
+        rows = [row[start:start + max_row_nodes] for row in rows for start in range(0, len(row), max_row_nodes)]
+
+    widest = max((len(row) for row in rows), default=1)
+    positions = {}
+    for row_index, row in enumerate(rows):
+        # Center shorter rows under the widest one.
+        offset = (widest - len(row)) / 2
+        for index, node_id in enumerate(row):
+            positions[node_id] = (offset + index, float(row_index))
+    return positions
+
+
+# --- Force-Directed Layout ---
+# Each grid cell is paired with itself and these four neighbors, so every pair
+# of adjacent cells is visited exactly once per iteration.
+HALF_NEIGHBORHOOD = ((0, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+def force_directed_positions(nodes, edges, width, height, iterations=FORCE_ITERATIONS, seed=0,
+                             initial_positions=None):
+    """
+    Fruchterman-Reingold layout. Repulsion is only computed between nodes in
+    neighboring cells of a uniform grid (cell size 2k), which keeps each
+    iteration close to linear in the number of nodes instead of quadratic.
+    Returns {node_id: (x, y)} in map coordinates.
+    """
+    node_ids = [node['id'] for node in nodes]
+    if not node_ids:
+        return {}
+    index_of = {node_id: index for index, node_id in enumerate(node_ids)}
+    adjacency = _build_adjacency(node_ids, edges)
+    edge_pairs = [(index_of[a], index_of[b]) for a in adjacency for b in adjacency[a] if a < b]
+
+    rng = random.Random(seed)
+    count = len(node_ids)
+    k = math.sqrt(max(width * height, 1) / count)
+    k_squared = k * k
+    cell_size = 2 * k
+    cutoff_squared = cell_size * cell_size
+
+    xs, ys = [0.0] * count, [0.0] * count
+    for index, node_id in enumerate(node_ids):
+        if initial_positions and node_id in initial_positions:
+            xs[index], ys[index] = initial_positions[node_id]
+        else:
+            xs[index], ys[index] = rng.uniform(0, width), rng.uniform(0, height)
+
+    temperature = max(width, height) / 10
+    cooling = temperature / (iterations + 1)
+
+    for _ in range(iterations):
+        grid = {}
+        for index in range(count):
+            grid.setdefault((int(xs[index] // cell_size), int(ys[index] // cell_size)), []).append(index)
+
+        disp_x, disp_y = [0.0] * count, [0.0] * count
+
+        for (cell_x, cell_y), members in grid.items():
+            for offset_x, offset_y in HALF_NEIGHBORHOOD:
+                others = grid.get((cell_x + offset_x, cell_y + offset_y))
+                if others is None:
+                    continue
+                same_cell = offset_x == 0 and offset_y == 0
+                for position, a in enumerate(members):
+                    ax, ay = xs[a], ys[a]
+                    for b in (members[position + 1:] if same_cell else others):
+                        delta_x = ax - xs[b]
+                        delta_y = ay - ys[b]
+                        distance_squared = delta_x * delta_x + delta_y * delta_y
+                        if distance_squared > cutoff_squared:
+                            continue
+                        if distance_squared < 1e-4:
+                            delta_x, delta_y = rng.uniform(-1, 1), rng.uniform(-1, 1)
+                            distance_squared = delta_x * delta_x + delta_y * delta_y + 1e-4
+                        # Repulsion k^2 / d along the unit vector: delta * k^2 / d^2
+                        factor = k_squared / distance_squared
+                        disp_x[a] += delta_x * factor
+                        disp_y[a] += delta_y * factor
+                        disp_x[b] -= delta_x * factor
+                        disp_y[b] -= delta_y * factor
+
+        for a, b in edge_pairs:
+            delta_x = xs[a] - xs[b]
+            delta_y = ys[a] - ys[b]
+            # Attraction d^2 / k along the unit vector: delta * d / k
+            factor = math.sqrt(delta_x * delta_x + delta_y * delta_y) / k
+            disp_x[a] -= delta_x * factor
+            disp_y[a] -= delta_y * factor
+            disp_x[b] += delta_x * factor
+            disp_y[b] += delta_y * factor
+
+        for index in range(count):
+            length = math.hypot(disp_x[index], disp_y[index])
+            if length > 0:
+                step = min(length, temperature) / length
+                xs[index] = min(width, max(0.0, xs[index] + disp_x[index] * step))
+                ys[index] = min(height, max(0.0, ys[index] + disp_y[index] * step))
+        temperature -= cooling
+
+    return {node_id: (xs[index], ys[index]) for index, node_id in enumerate(node_ids)}
+
+
+def compute_layout(nodes, edges, width, height, mode='hierarchical', iterations=FORCE_ITERATIONS,
+                   node_width=NODE_WIDTH, node_height=NODE_HEIGHT):
+    """
+    Lays out nodes ([{'id', 'type'}]) and edges ([{'source', 'target'}]) on a
+    width x height map. Tiers too wide for width are wrapped onto extra rows,
+    and the map grows taller when those rows do not fit in height.
+    Returns ({node_id: {'x', 'y'}} top-left positions, map height).
+    Force-directed mode starts from the hierarchical layout, so results are
+    deterministic for the same input.
+    """
+    layered = hierarchical_positions(nodes, edges, max_row_nodes=row_capacity(width, node_width))
+    row_count = len({y for _, y in layered.values()})
+    height = max(height, rows_height(row_count, node_height))
+    if mode == 'hierarchical':
+        return _fit_to_canvas(layered, width, height, node_width, node_height), height
+    if mode != 'force':
+        raise ValueError(f"Unknown layout mode: {mode}")
+
+    # Spread the layered start over the canvas before relaxing it.
+    start = _fit_to_canvas(layered, width, height, 0, 0)
+    positions = force_directed_positions(
+        nodes, edges, width, height,
+        iterations=max(1, min(iterations, FORCE_MAX_ITERATIONS)),
+        initial_positions={node_id: (p['x'], p['y']) for node_id, p in start.items()}
+    )
+    return _fit_to_canvas(positions, width, height, node_width, node_height), height
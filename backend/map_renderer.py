@@ -1,113 +1,810 @@
-import re
+import io
+import math
 import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from PIL import Image, ImageDraw
 
-def parse_config(config_content):
-    """
-    Parses Cacti weathermap config content to extract the background image path,
-    node positions, and link connections using a robust block-parsing method.
-    """
-    data = {'nodes': {}, 'links': []}
-    
-    # Extract the background image path, ensuring it's at the start of a line
-    background_match = re.search(r'^BACKGROUND\s+(.*)', config_content, re.MULTILINE)
-    if background_match:
-        data['background'] = background_match.group(1).strip()
-
-    # This robust regex pattern correctly captures multi-line blocks.
-    # It reads from a keyword (NODE/LINK) until it sees the next keyword or the end of the file.
-    node_pattern = re.compile(r'^NODE\s+(\S+)\n(.*?)(?=^NODE|^LINK|\Z)', re.DOTALL | re.MULTILINE)
-    link_pattern = re.compile(r'^LINK\s+(\S+)\n(.*?)(?=^NODE|^LINK|\Z)', re.DOTALL | re.MULTILINE)
-
-    # Parse all NODE blocks to find their positions
-    for match in node_pattern.finditer(config_content):
-        node_id = match.group(1)
-        node_body = match.group(2)
-        node_data = {}
-
-        # Search for the POSITION within the captured block
-        pos_match = re.search(r'^\s*POSITION\s+(\d+)\s+(\d+)', node_body, re.MULTILINE)
-        if pos_match:
-            node_data['x'] = int(pos_match.group(1))
-            node_data['y'] = int(pos_match.group(2))
-        
-        if 'x' in node_data and 'y' in node_data:
-            data['nodes'][node_id] = node_data
-
-    # Parse all LINK blocks to find their connections
-    for match in link_pattern.finditer(config_content):
-        link_id = match.group(1)
-        link_body = match.group(2)
-
-        # Skip the "LINK DEFAULT" template block
-        if link_id == 'DEFAULT':
+import metrics
+
+# --- Render Caches ---
+# Memory budgets for the parsed-config and decoded-background caches.
+CONFIG_CACHE_MAX_BYTES = int(os.environ.get('AUTOCACTI_CONFIG_CACHE_MB', 64)) * 1024 * 1024
+BACKGROUND_CACHE_MAX_BYTES = int(os.environ.get('AUTOCACTI_BACKGROUND_CACHE_MB', 512)) * 1024 * 1024
+# Rough in-memory size of a parsed model relative to its config file size.
+PARSED_CONFIG_SIZE_FACTOR = 10
+
+# --- Bounded Rendering ---
+# Largest RGBA canvas a single render may allocate. Backgrounds that would
+# exceed it are reduced by an integer factor and rendered at that scale.
+RENDER_MAX_BYTES = int(os.environ.get('AUTOCACTI_RENDER_MAX_MB', 256)) * 1024 * 1024
+# Total canvas memory that concurrent renders in this process may hold at once.
+RENDER_MEMORY_BUDGET_BYTES = int(os.environ.get('AUTOCACTI_RENDER_BUDGET_MB', 1024)) * 1024 * 1024
+
+
+class BoundedLRUCache:
+    """
+    Thread-safe LRU cache bounded by the total estimated size of its values.
+
+    Keys include the file's modification time and size, so an edited file
+    simply misses and its stale entry ages out.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return  # Never evict everything for a single oversized value.
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+PARSED_CONFIG_CACHE = BoundedLRUCache(CONFIG_CACHE_MAX_BYTES)
+BACKGROUND_CACHE = BoundedLRUCache(BACKGROUND_CACHE_MAX_BYTES)
+RENDER_CACHES = {'parsed_config': PARSED_CONFIG_CACHE, 'background': BACKGROUND_CACHE}
+
+
+def _file_cache_key(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def load_parsed_config(config_path):
+    """Returns the parsed model of a config file, reusing it while the file is unchanged."""
+    with metrics.MAP_STAGE_SECONDS.time(stage='parse'):
+        key = _file_cache_key(config_path)
+        map_data = PARSED_CONFIG_CACHE.get(key)
+        if map_data is None:
+            with open(config_path, 'r') as f:
+                map_data = parse_config(f)
+            PARSED_CONFIG_CACHE.put(key, map_data, key[2] * PARSED_CONFIG_SIZE_FACTOR)
+    return map_data
+
+
+def plan_render_scale(width, height, max_render_bytes):
+    """Returns the integer reduction factor that keeps a width x height RGBA canvas within budget."""
+    canvas_bytes = width * height * 4
+    if canvas_bytes <= max_render_bytes:
+        return 1
+    return math.ceil(math.sqrt(canvas_bytes / max_render_bytes))
+
+
+# Modes Image.reduce() accepts; other modes are expanded to RGBA first.
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA')
+# JPEG decoders can reduce by these factors while decoding (draft mode).
+JPEG_DRAFT_FACTORS = (8, 4, 2, 1)
+
+
+def _reducible(image):
+    return image if image.mode in REDUCIBLE_MODES else image.convert('RGBA')
+
+
+def reduced_background_path(image_path, scale):
+    """Path of the copy of a background pre-reduced by scale, stored next to it."""
+    return f"{os.path.splitext(image_path)[0]}.x{scale}.png"
+
+
+def _jpeg_draft_factor(width, height, scale):
+    ratio = min(width // math.ceil(width / scale), height // math.ceil(height / scale))
+    return next(factor for factor in JPEG_DRAFT_FACTORS if ratio >= factor)
+
+
+def _decode_bytes(source, image_path, scale):
+    """
+    Memory held while decoding source before it is expanded to RGBA: the
+    decoded image plus its reduced copy.
+    """
+    width, height = source.size
+    bands = len(source.getbands()) if source.mode in REDUCIBLE_MODES else 4
+    reduced_bytes = math.ceil(width / scale) * math.ceil(height / scale) * bands
+    if scale == 1:
+        return width * height * bands
+    if source.format == 'JPEG':
+        factor = _jpeg_draft_factor(width, height, scale)
+        return math.ceil(width / factor) * math.ceil(height / factor) * bands + reduced_bytes
+    if os.path.exists(reduced_background_path(image_path, scale)):
+        return reduced_bytes
+    return width * height * bands + reduced_bytes
+
+
+def _decode_background(image_path, max_render_bytes):
+    """
+    Decodes a background to RGBA, reduced so the canvas fits max_render_bytes.
+
+    JPEG backgrounds are reduced while decoding (draft mode), so the full
+    resolution is never held in memory. Other formats are read from the
+    pre-reduced copy stored at upload time (store_reduced_background()) when
+    there is one; otherwise they are decoded once at their native depth,
+    reduced, and only then expanded to RGBA.
+    """
+    with Image.open(image_path) as source:
+        full_width, full_height = source.size
+        scale = plan_render_scale(full_width, full_height, max_render_bytes)
+        reduced_path = reduced_background_path(image_path, scale)
+        if scale > 1 and source.format != 'JPEG' and os.path.exists(reduced_path):
+            with Image.open(reduced_path) as reduced:
+                image = reduced.convert('RGBA')
+        elif scale > 1:
+            source.draft('RGB', (math.ceil(full_width / scale), math.ceil(full_height / scale)))
+            remaining = plan_render_scale(source.size[0], source.size[1], max_render_bytes)
+            if remaining > 1:
+                image = _reducible(source).reduce(remaining).convert('RGBA')
+            else:
+                image = source.convert('RGBA')
+        else:
+            image = source.convert('RGBA')
+
+    return image, (full_width / image.width, full_height / image.height)
+
+
+def store_reduced_background(image_path, max_render_bytes=RENDER_MAX_BYTES):
+    """
+    Stores a pre-reduced copy of a background that renders would otherwise
+    decode at full resolution (anything but JPEG that exceeds
+    max_render_bytes). The one full decode this takes reserves its size from
+    the render memory budget. Returns the copy's path, or None.
+    """
+    with Image.open(image_path) as source:
+        scale = plan_render_scale(source.width, source.height, max_render_bytes)
+        if scale == 1 or source.format == 'JPEG':
+            return None
+        reduced_path = reduced_background_path(image_path, scale)
+        if os.path.exists(reduced_path):
+            return reduced_path
+        with RENDER_MEMORY_BUDGET.reserve(_decode_bytes(source, image_path, scale)):
+            reduced = _reducible(source).reduce(scale)
+        tmp_path = f"{reduced_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            reduced.save(tmp_path, 'PNG')
+            os.replace(tmp_path, reduced_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return reduced_path
+
+
+def load_background(image_path, max_render_bytes=RENDER_MAX_BYTES):
+    """
+    Returns (rgba_image, (scale_x, scale_y)) for a background, reusing the
+    decoded image while the file is unchanged. scale maps config coordinates
+    to canvas pixels by division. The cached image is shared: callers must
+    copy it before drawing on it.
+    """
+    with metrics.MAP_STAGE_SECONDS.time(stage='decode_background'):
+        key = _file_cache_key(image_path) + (max_render_bytes,)
+        entry = BACKGROUND_CACHE.get(key)
+        if entry is None:
+            entry = _decode_background(image_path, max_render_bytes)
+            image = entry[0]
+            BACKGROUND_CACHE.put(key, entry, image.width * image.height * 4)
+    return entry
+
+
+class RenderMemoryBudget:
+    """
+    Limits the canvas memory held by concurrent renders in one process.
+
+    A render reserves its planned canvas size before decoding and waits while
+    the budget is exhausted. A render larger than the whole budget still runs,
+    but only when nothing else is rendering.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._in_use = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes):
+        with self._condition:
+            while self._in_use and self._in_use + nbytes > self.max_bytes:
+                self._condition.wait()
+            self._in_use += nbytes
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_use -= nbytes
+                self._condition.notify_all()
+
+
+RENDER_MEMORY_BUDGET = RenderMemoryBudget(RENDER_MEMORY_BUDGET_BYTES)
+
+
+# Global keywords that may legitimately appear several times in a config.
+REPEATABLE_GLOBAL_KEYWORDS = {'SCALE', 'SET', 'FONTDEFINE', 'KEYPOS', 'KEYSTYLE', 'INCLUDE'}
+# NODE/LINK keywords that may appear several times inside one block.
+REPEATABLE_BLOCK_KEYWORDS = {'VIA', 'SET'}
+
+
+def _iter_config_lines(config_source):
+    """Yields lines from a config given as a string, a file object or any iterable of lines."""
+    if isinstance(config_source, str):
+        return io.StringIO(config_source)
+    return config_source
+
+
+def _new_block(kind, block_id):
+    return {'id': block_id, 'kind': kind, 'keywords': {}}
+
+
+def _store_keyword(keywords, keyword, value, repeatable):
+    if keyword in repeatable:
+        keywords.setdefault(keyword, []).append(value)
+    else:
+        keywords[keyword] = value
+
+
+def _finish_node(block, data):
+    """Extracts the structured fields of a NODE block."""
+    node = {'keywords': block['keywords']}
+    position = block['keywords'].get('POSITION', '').split()
+    try:
+        if len(position) == 2:
+            node['x'], node['y'] = int(position[0]), int(position[1])
+        elif len(position) == 3:
+            # Relative position: POSITION <other-node> <dx> <dy>, resolved after parsing.
+            node['relative_to'] = position[0]
+            node['dx'], node['dy'] = int(position[1]), int(position[2])
+    except ValueError:
+        pass
+    data['nodes'][block['id']] = node
+
+
+def _finish_link(block, data):
+    """Extracts the structured fields of a LINK block."""
+    keywords = block['keywords']
+    endpoints = keywords.get('NODES', '').split()
+    if len(endpoints) < 2:
+        return
+
+    link = {'id': block['id'], 'keywords': keywords}
+    for index, endpoint in enumerate(endpoints[:2], start=1):
+        # An endpoint may carry an offset, e.g. "node1:NE" or "node1:10:-5".
+        name, _, offset = endpoint.partition(':')
+        link[f'node{index}'] = name
+        if offset:
+            link[f'offset{index}'] = offset
+
+    via_points = []
+    for via in keywords.get('VIA', []):
+        parts = via.split()
+        try:
+            via_points.append((int(parts[0]), int(parts[1])))
+        except (IndexError, ValueError):
+            continue
+    link['via'] = via_points
+
+    if 'BANDWIDTH' in keywords:
+        link['bandwidth'] = keywords['BANDWIDTH']
+    if 'WIDTH' in keywords:
+        link['width'] = keywords['WIDTH']
+    if 'TARGET' in keywords:
+        link['targets'] = keywords['TARGET'].split()
+    data['links'].append(link)
+
+
+def _finish_block(block, data):
+    if block is None:
+        return
+    if block['id'] == 'DEFAULT':
+        # Template blocks only provide defaults for the real NODEs/LINKs.
+        data['templates'][block['kind']] = block['keywords']
+    elif block['kind'] == 'NODE':
+        _finish_node(block, data)
+    else:
+        _finish_link(block, data)
+
+
+def _resolve_relative_positions(nodes):
+    """Turns 'POSITION <node> <dx> <dy>' into absolute coordinates where possible."""
+    for node_id, node in nodes.items():
+        # Walk the chain of anchors until an absolute node, then unwind it.
+        chain = []
+        current_id, current = node_id, node
+        while current is not None and 'x' not in current and 'relative_to' in current:
+            if current_id in chain:
+                break  # Circular reference; leave these nodes unpositioned.
+            chain.append(current_id)
+            current_id = current['relative_to']
+            current = nodes.get(current_id)
+
+        if current is None or 'x' not in current:
+            continue
+        x, y = current['x'], current['y']
+        for chained_id in reversed(chain):
+            chained = nodes[chained_id]
+            x, y = x + chained['dx'], y + chained['dy']
+            chained['x'], chained['y'] = x, y
+
+
+def parse_config(config_source):
+    """
+    Parses a Cacti Weathermap config in a single line-oriented pass.
+
+    config_source may be the config text, an open file or any iterable of
+    lines, so large configs can be parsed without loading them into memory
+    first. Returns a model with:
+      - 'background': the BACKGROUND path (if any)
+      - 'globals': global keywords (repeatable ones such as SCALE as lists)
+      - 'templates': keywords of the NODE/LINK DEFAULT blocks
+      - 'nodes': {node_id: {'x', 'y', 'keywords'}}
+      - 'links': [{'id', 'node1', 'node2', 'via', 'bandwidth', 'keywords', ...}]
+    """
+    data = {'globals': {}, 'templates': {}, 'nodes': {}, 'links': []}
+    block = None
+
+    for raw_line in _iter_config_lines(config_source):
+        line = raw_line.strip()
+        if not line or line.startswith('#'):
             continue
 
-        # Search for the NODES line within the captured block
-        nodes_match = re.search(r'^\s*NODES\s+(\S+)\s+(\S+)', link_body, re.MULTILINE)
-        if nodes_match:
-            data['links'].append({
-                'node1': nodes_match.group(1),
-                'node2': nodes_match.group(2)
-            })
+        parts = line.split(None, 1)
+        keyword = parts[0].upper()
+        value = parts[1] if len(parts) > 1 else ''
+
+        if keyword in ('NODE', 'LINK'):
+            _finish_block(block, data)
+            block = _new_block(keyword, value.split()[0] if value else '')
+        elif block is not None:
+            _store_keyword(block['keywords'], keyword, value, REPEATABLE_BLOCK_KEYWORDS)
+        else:
+            _store_keyword(data['globals'], keyword, value, REPEATABLE_GLOBAL_KEYWORDS)
+
+    _finish_block(block, data)
+    _resolve_relative_positions(data['nodes'])
+
+    if data['globals'].get('BACKGROUND'):
+        data['background'] = data['globals']['BACKGROUND']
 
     return data
 
-def render_map_from_config(config_path):
+# --- Link Geometry ---
+# Perpendicular distance between parallel links joining the same two nodes,
+# matching PARALLEL_LINK_OFFSET in frontend/src/services/configGenerator.js.
+PARALLEL_LINK_OFFSET = 15
+# Weathermap's default link width when neither the link nor LINK DEFAULT sets one.
+DEFAULT_LINK_WIDTH = 7
+# Arrowhead size relative to the link width (Weathermap's classic arrow style).
+ARROW_HEAD_LENGTH_FACTOR = 2.0
+ARROW_HEAD_WIDTH_FACTOR = 2.0
+OUTLINE_COLOR = (0, 0, 0, 255)
+# Fallback colours when the config defines no SCALE for the link.
+LINK_COLORS = ['#E6194B', '#3CB44B', '#4363D8', '#F58231', '#911EB4', '#46F0F0', '#FABEBE', '#008080', '#E6BEFF', '#AA6E28']
+# Anti-aliasing factor: links are rasterized this many times larger, then
+# box-filtered down. 1 disables anti-aliasing and draws directly on the canvas.
+RENDER_SUPERSAMPLE = int(os.environ.get('AUTOCACTI_RENDER_SUPERSAMPLE', 1))
+# Supersampled links are rasterized tile by tile; an enlarged tile has as
+# many pixels as a tile of this size, so it stays small.
+RENDER_TILE_SIZE = 1024
+
+
+def _zero_scale_color(map_data, scale_name):
+    """Returns the colour Weathermap uses for 0% utilisation in the named SCALE, or None."""
+    for entry in map_data['globals'].get('SCALE', []):
+        parts = entry.split()
+        # "SCALE [name] low high r g b"; the name defaults to DEFAULT.
+        if parts and not _is_number(parts[0]):
+            name, parts = parts[0], parts[1:]
+        else:
+            name = 'DEFAULT'
+        if name != scale_name or len(parts) < 5:
+            continue
+        try:
+            low, high = float(parts[0]), float(parts[1])
+            color = tuple(int(value) for value in parts[2:5])
+        except ValueError:
+            continue
+        if low <= 0 <= high:
+            return color + (255,)
+    return None
+
+
+def _is_number(text):
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+
+def _half_arrow_polygons(path, width, head_length, head_width):
     """
-    Renders a final map image by drawing the links defined in a .conf file
-    onto the specified background image. Returns a PIL Image object.
+    Builds the polygons of one Weathermap half-arrow: a shaft of the given
+    width following path, ending in an arrowhead at the path's last point.
     """
-    if not os.path.exists(config_path):
-        raise FileNotFoundError(f"Config file not found at {config_path}")
+    polygons = []
+    half_width = width / 2
+    last_index = len(path) - 2
+    for index in range(len(path) - 1):
+        (x1, y1), (x2, y2) = path[index], path[index + 1]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        if length == 0:
+            continue
+        ux, uy = dx / length, dy / length
+        px, py = -uy * half_width, ux * half_width
+
+        if index == last_index:
+            # Shaft and arrowhead form one outline so no seam is drawn between them.
+            head = min(head_length, length)
+            bx, by = x2 - ux * head, y2 - uy * head
+            hx, hy = -uy * head_width / 2, ux * head_width / 2
+            polygons.append([
+                (x1 + px, y1 + py), (bx + px, by + py), (bx + hx, by + hy), (x2, y2),
+                (bx - hx, by - hy), (bx - px, by - py), (x1 - px, y1 - py)
+            ])
+        else:
+            polygons.append([(x1 + px, y1 + py), (x2 + px, y2 + py), (x2 - px, y2 - py), (x1 - px, y1 - py)])
+    return polygons
 
-    with open(config_path, 'r') as f:
-        config_content = f.read()
 
-    map_data = parse_config(config_content)
+def _split_path_at_midpoint(points):
+    """Splits a polyline at half its length into two paths that both end at the midpoint."""
+    lengths = [math.hypot(b[0] - a[0], b[1] - a[1]) for a, b in zip(points, points[1:])]
+    remaining = sum(lengths) / 2
+    for index, segment_length in enumerate(lengths):
+        if remaining <= segment_length and segment_length > 0:
+            t = remaining / segment_length
+            a, b = points[index], points[index + 1]
+            mid = (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+            return points[:index + 1] + [mid], list(reversed(points[index + 1:])) + [mid]
+        remaining -= segment_length
+    return points, list(reversed(points))
 
+
+def compute_link_geometry(map_data, scale_x=1.0, scale_y=1.0):
+    """
+    Computes every link polygon of a parsed map in one pass.
+    Returns a list of (fill_color, polygon) in drawing order.
+    """
+    return [(color, polygon) for _, color, polygon in compute_link_shapes(map_data, scale_x, scale_y)]
+
+
+def compute_link_shapes(map_data, scale_x=1.0, scale_y=1.0):
+    """
+    Computes every link polygon of a parsed map in one pass, tagged with the
+    ID of the link it belongs to.
+
+    Links are drawn the way Weathermap draws them: two half-arrows meeting at
+    the middle of the path (through any VIA points), coloured by the link's
+    SCALE colour for 0% utilisation. Links that share the same two nodes are
+    spread apart perpendicular to their direction. Coordinates are divided by
+    scale_x/scale_y to map config space onto the canvas.
+
+    Returns a list of (link_id, fill_color, polygon) in drawing order.
+    """
+    nodes = map_data['nodes']
+    link_template = map_data['templates'].get('LINK', {})
+
+    drawable = []
+    bundles = {}
+    for link in map_data['links']:
+        node1, node2 = nodes.get(link['node1']), nodes.get(link['node2'])
+        if not (node1 and node2 and 'x' in node1 and 'x' in node2):
+            continue
+        drawable.append((link, node1, node2))
+        bundle_key = tuple(sorted((link['node1'], link['node2'])))
+        bundles.setdefault(bundle_key, []).append(link['id'])
+
+    bundle_positions = {}
+    for members in bundles.values():
+        for position, link_id in enumerate(members):
+            bundle_positions[link_id] = (position, len(members))
+
+    shapes = []
+    for color_index, (link, node1, node2) in enumerate(drawable):
+        keywords = link['keywords']
+        try:
+            width = float(keywords.get('WIDTH', link_template.get('WIDTH', DEFAULT_LINK_WIDTH)))
+        except ValueError:
+            width = DEFAULT_LINK_WIDTH
+        width /= max(scale_x, scale_y)
+
+        # An empty USESCALE line falls back to the DEFAULT scale.
+        scale_name = (keywords.get('USESCALE', link_template.get('USESCALE', '')).split() or ['DEFAULT'])[0]
+        color = _zero_scale_color(map_data, scale_name) or LINK_COLORS[color_index % len(LINK_COLORS)]
+
+        points = [(node1['x'], node1['y'])] + list(link['via']) + [(node2['x'], node2['y'])]
+
+        position, bundle_size = bundle_positions[link['id']]
+        if bundle_size > 1:
+            # Offset the whole path perpendicular to the node1 -> node2 direction.
+            dx, dy = node2['x'] - node1['x'], node2['y'] - node1['y']
+            if link['node1'] > link['node2']:
+                dx, dy = -dx, -dy
+            length = math.hypot(dx, dy) or 1
+            offset = -PARALLEL_LINK_OFFSET * (bundle_size - 1) / 2 + position * PARALLEL_LINK_OFFSET
+            ox, oy = -dy / length * offset, dx / length * offset
+            points = [(x + ox, y + oy) for x, y in points]
+
+        points = [(x / scale_x, y / scale_y) for x, y in points]
+        head_length = width * ARROW_HEAD_LENGTH_FACTOR
+        head_width = width * ARROW_HEAD_WIDTH_FACTOR
+        for half in _split_path_at_midpoint(points):
+            for polygon in _half_arrow_polygons(half, width, head_length, head_width):
+                shapes.append((link['id'], color, polygon))
+
+    return shapes
+
+
+def _draw_link_shapes(image, shapes, supersample=RENDER_SUPERSAMPLE, tile_size=RENDER_TILE_SIZE):
+    """
+    Rasterizes link polygons onto image in order, each filled and then
+    outlined. When supersampling, polygons are bucketed into canvas tiles,
+    and each tile is drawn the same way on an enlarged copy that is then
+    box-filtered back down, so overlapping links layer as they do without it.
+    """
+    if supersample <= 1:
+        # Without anti-aliasing, polygons are drawn straight onto the canvas in one pass.
+        draw = ImageDraw.Draw(image)
+        for color, polygon in shapes:
+            draw.polygon(polygon, fill=color, outline=OUTLINE_COLOR)
+        return
+
+    # An enlarged tile is as large as a tile_size tile drawn directly.
+    tile_size = max(1, tile_size // supersample)
+    columns = math.ceil(image.width / tile_size)
+    rows = math.ceil(image.height / tile_size)
+    tiles = {}
+    for shape_index, (color, polygon) in enumerate(shapes):
+        # Pad the bounding box so the outline drawn around the edge is not clipped.
+        xs = [x for x, _ in polygon]
+        ys = [y for _, y in polygon]
+        first_col, last_col = max(0, int(min(xs) - 2) // tile_size), min(columns - 1, int(max(xs) + 2) // tile_size)
+        first_row, last_row = max(0, int(min(ys) - 2) // tile_size), min(rows - 1, int(max(ys) + 2) // tile_size)
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                tiles.setdefault((col, row), []).append(shape_index)
+
+    for (col, row), shape_indexes in tiles.items():
+        left, top = col * tile_size, row * tile_size
+        box = (left, top, min(left + tile_size, image.width), min(top + tile_size, image.height))
+        tile = image.crop(box)
+        tile = tile.resize((tile.width * supersample, tile.height * supersample), Image.NEAREST)
+        draw = ImageDraw.Draw(tile)
+        for shape_index in shape_indexes:
+            color, polygon = shapes[shape_index]
+            local = [((x - left) * supersample, (y - top) * supersample) for x, y in polygon]
+            draw.polygon(local, fill=color)
+            # One canvas pixel wide, like the direct pass. A wide polygon
+            # outline is much slower to draw than the same closed line.
+            draw.line(local + [local[0]], fill=OUTLINE_COLOR, width=supersample)
+        image.paste(tile.reduce(supersample), box[:2])
+
+
+def _resolve_background_path(config_path, map_data):
     if not map_data.get('background'):
         raise ValueError("BACKGROUND image path not found in config file.")
 
     config_dir = os.path.dirname(config_path)
     background_image_path = os.path.normpath(os.path.join(config_dir, map_data['background']))
-    
+
     if not os.path.exists(background_image_path):
         raise FileNotFoundError(f"Background image not found at {background_image_path}")
+    return background_image_path
 
-    image = Image.open(background_image_path).convert("RGBA")
-    draw = ImageDraw.Draw(image)
 
-    LINK_COLORS = ['#E6194B', '#3CB44B', '#4363D8', '#F58231', '#911EB4', '#46F0F0', '#FABEBE', '#008080', '#E6BEFF', '#AA6E28']
-    color_index = 0
+def render_map_from_config(config_path, max_render_bytes=RENDER_MAX_BYTES):
+    """
+    Renders a final map image by drawing the links defined in a .conf file
+    onto the specified background image. Returns a PIL Image object.
 
-    for link in map_data['links']:
-        node1_id = link['node1']
-        node2_id = link['node2']
-
-        if node1_id in map_data['nodes'] and node2_id in map_data['nodes']:
-            node1 = map_data['nodes'][node1_id]
-            node2 = map_data['nodes'][node2_id]
-            
-            current_color = LINK_COLORS[color_index % len(LINK_COLORS)]
-            color_index += 1
-            
-            draw.line(
-                [(node1['x'], node1['y']), (node2['x'], node2['y'])], 
-                fill=current_color, 
-                width=4
-            )
+    Backgrounds whose RGBA canvas would exceed max_render_bytes are rendered
+    at a reduced size, with link coordinates scaled to match.
+    """
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"Config file not found at {config_path}")
 
+    map_data = load_parsed_config(config_path)
+    background_image_path = _resolve_background_path(config_path, map_data)
+
+    base_image, (scale_x, scale_y) = load_background(background_image_path, max_render_bytes)
+    image = base_image.copy()
+    with metrics.MAP_STAGE_SECONDS.time(stage='draw'):
+        _draw_link_shapes(image, compute_link_geometry(map_data, scale_x, scale_y))
     return image
 
-def render_and_save_map(config_path, output_path):
+
+def estimate_render_bytes(config_path, max_render_bytes=RENDER_MAX_BYTES):
+    """Estimates the memory a render will hold, reading only the image header."""
+    map_data = load_parsed_config(config_path)
+    image_path = _resolve_background_path(config_path, map_data)
+    with Image.open(image_path) as source:
+        width, height = source.size
+        scale = plan_render_scale(width, height, max_render_bytes)
+        decode_bytes = _decode_bytes(source, image_path, scale)
+    # The decode buffers, the cached base canvas and the working copy that
+    # links are drawn on.
+    return decode_bytes + 2 * math.ceil(width / scale) * math.ceil(height / scale) * 4
+
+
+def _save_atomic(image, output_path):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with metrics.MAP_STAGE_SECONDS.time(stage='encode_png'):
+            image.save(tmp_path, 'PNG')
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def render_and_save_map(config_path, output_path, max_render_bytes=RENDER_MAX_BYTES):
     """
     Renders a map from a config file and saves it to a specified path.
+    The render waits for its share of the process-wide render memory budget.
+    """
+    with RENDER_MEMORY_BUDGET.reserve(estimate_render_bytes(config_path, max_render_bytes)):
+        final_image = render_map_from_config(config_path, max_render_bytes)
+
+        # Write through a temporary file so a partially written PNG is never
+        # mistaken for a finished render of the same content.
+        _save_atomic(final_image, output_path)
+    print(f"Final map image saved to {output_path}")
+
+
+# --- Incremental Re-rendering ---
+# Tile size used to track which parts of a previous render need redrawing.
+DIRTY_TILE_SIZE = 256
+# Above this fraction of dirty tiles a full render is cheaper than patching.
+INCREMENTAL_MAX_DIRTY_FRACTION = 0.5
+
+
+def _shape_tiles(polygon, columns, rows, tile_size):
+    """Returns the (col, row) tiles a polygon's padded bounding box touches."""
+    xs = [x for x, _ in polygon]
+    ys = [y for _, y in polygon]
+    first_col, last_col = max(0, int(min(xs) - 2) // tile_size), min(columns - 1, int(max(xs) + 2) // tile_size)
+    first_row, last_row = max(0, int(min(ys) - 2) // tile_size), min(rows - 1, int(max(ys) + 2) // tile_size)
+    return [(col, row) for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)]
+
+
+def render_map_update(base_config_path, base_render_path, config_path, output_path,
+                      max_render_bytes=RENDER_MAX_BYTES):
     """
-    final_image = render_map_from_config(config_path)
+    Renders config_path by patching the previous render of base_config_path
+    instead of drawing every link again.
+
+    Links whose polygons changed between the two configs mark the tiles they
+    covered before and cover now as dirty. Only those tiles are restored from
+    the background and redrawn, with every link that touches them, in the
+    original drawing order. Falls back to a full render when the background,
+    the global settings or the canvas size changed, or when most of the map
+    is dirty. Returns {'mode': 'incremental' | 'full', 'dirty_links', 'dirty_tiles'}.
+    """
+    old_data = load_parsed_config(base_config_path)
+    new_data = load_parsed_config(config_path)
+
+    with RENDER_MEMORY_BUDGET.reserve(estimate_render_bytes(config_path, max_render_bytes)):
+        background_path = _resolve_background_path(config_path, new_data)
+        base_image, (scale_x, scale_y) = load_background(background_path, max_render_bytes)
+
+        reusable = (
+            os.path.exists(base_render_path)
+            and old_data.get('background') == new_data.get('background')
+            and old_data['globals'] == new_data['globals']
+            and old_data['templates'] == new_data['templates']
+        )
+        if reusable:
+            with Image.open(base_render_path) as previous:
+                reusable = previous.size == base_image.size
+                if reusable:
+                    image = previous.convert('RGBA')
+
+        old_shapes = compute_link_shapes(old_data, scale_x, scale_y)
+        new_shapes = compute_link_shapes(new_data, scale_x, scale_y)
+
+        old_by_link, new_by_link = {}, {}
+        for link_id, color, polygon in old_shapes:
+            old_by_link.setdefault(link_id, []).append((color, polygon))
+        for link_id, color, polygon in new_shapes:
+            new_by_link.setdefault(link_id, []).append((color, polygon))
+        dirty_links = [
+            link_id for link_id in old_by_link.keys() | new_by_link.keys()
+            if old_by_link.get(link_id) != new_by_link.get(link_id)
+        ]
+
+        tile_size = DIRTY_TILE_SIZE
+        columns = math.ceil(base_image.width / tile_size)
+        rows = math.ceil(base_image.height / tile_size)
+        dirty_tiles = set()
+        for link_id in dirty_links:
+            for _, polygon in old_by_link.get(link_id, []) + new_by_link.get(link_id, []):
+                dirty_tiles.update(_shape_tiles(polygon, columns, rows, tile_size))
+
+        if not reusable or len(dirty_tiles) > INCREMENTAL_MAX_DIRTY_FRACTION * columns * rows:
+            image = base_image.copy()
+            with metrics.MAP_STAGE_SECONDS.time(stage='draw'):
+                _draw_link_shapes(image, [(color, polygon) for _, color, polygon in new_shapes])
+            _save_atomic(image, output_path)
+            return {'mode': 'full', 'dirty_links': len(dirty_links), 'dirty_tiles': columns * rows}
+
+        if not dirty_tiles:
+            # Nothing visible changed (e.g. only DEVICE or INTERFACE keywords).
+            _save_atomic(image, output_path)
+            return {'mode': 'incremental', 'dirty_links': 0, 'dirty_tiles': 0}
+
+        # Redraw every link touching a dirty tile onto a copy of the background.
+        # The copy starts at the canvas origin so polygons keep their canvas
+        # coordinates: Pillow's rasterization is not translation invariant.
+        scratch = base_image.crop((
+            0, 0,
+            min(image.width, (max(col for col, _ in dirty_tiles) + 1) * tile_size),
+            min(image.height, (max(row for _, row in dirty_tiles) + 1) * tile_size)
+        ))
+        with metrics.MAP_STAGE_SECONDS.time(stage='draw'):
+            _draw_link_shapes(scratch, [
+                (color, polygon) for _, color, polygon in new_shapes
+                if not dirty_tiles.isdisjoint(_shape_tiles(polygon, columns, rows, tile_size))
+            ])
+        for col, row in dirty_tiles:
+            left, top = col * tile_size, row * tile_size
+            box = (left, top, min(left + tile_size, image.width), min(top + tile_size, image.height))
+            image.paste(scratch.crop(box), box[:2])
+
+        _save_atomic(image, output_path)
+    return {'mode': 'incremental', 'dirty_links': len(dirty_links), 'dirty_tiles': len(dirty_tiles)}
+
+
+# --- Metrics ---
+# Read from the render caches when /metrics is scraped.
+def _render_cache_requests():
+    counts = {}
+    for name, cache in RENDER_CACHES.items():
+        stats = cache.get_stats()
+        counts[(name, 'hits')] = stats['hits']
+        counts[(name, 'misses')] = stats['misses']
+    return counts
 
-    output_dir = os.path.dirname(output_path)
-    os.makedirs(output_dir, exist_ok=True)
+def _render_cache_bytes():
+    return {(name,): cache.get_stats()['bytes'] for name, cache in RENDER_CACHES.items()}
 
-    final_image.save(output_path, 'PNG')
-    print(f"Final map image saved to {output_path}")
\ No newline at end of file
+metrics.CallbackMetric(
+    'autocacti_render_cache_requests_total', "Render cache lookups, by cache and hits/misses.",
+    ('cache', 'result'), _render_cache_requests, kind='counter'
+)
+metrics.CallbackMetric(
+    'autocacti_render_cache_bytes', "Estimated size of the values held by each render cache.",
+    ('cache',), _render_cache_bytes
+)
@@ -0,0 +1,285 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+import task_queue
+
+# --- Map Versions ---
+# Version history lives next to the task queue, outside 'static/'.
+MAP_DB_PATH = task_queue.TASK_DB_PATH
+
+
+class MapVersionConflictError(Exception):
+    """Raised when a diff is based on a version that is no longer the latest."""
+
+
+class MapStore:
+    """
+    SQLite-backed version history of maps.
+
+    A map is identified by a map_id that stays the same across edits. Each
+    version points at content-addressed files: the stored config, the
+    background image and the rendered map.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS map_versions (
+                map_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                map_name TEXT,
+                username TEXT,
+                content_key TEXT NOT NULL,
+                image_key TEXT NOT NULL,
+                config_path TEXT NOT NULL,
+                final_map_filename TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (map_id, version)
+            );
+        """)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def add_version(self, map_id, map_name, username, content_key, image_key, config_path,
+                    final_map_filename, base_version=None):
+        """
+        Records a new version of map_id and returns it. When the content did
+        not change, the latest version is returned instead of a duplicate.
+        With base_version set, the write fails with MapVersionConflictError
+        unless base_version is still the latest version.
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            latest = conn.execute(
+                "SELECT * FROM map_versions WHERE map_id = ? ORDER BY version DESC LIMIT 1", (map_id,)
+            ).fetchone()
+            latest_version = latest['version'] if latest else 0
+            if base_version is not None and base_version != latest_version:
+                raise MapVersionConflictError(
+                    f"Map {map_id} is at version {latest_version}, not {base_version}."
+                )
+            if latest and latest['content_key'] == content_key:
+                return dict(latest)
+
+            conn.execute(
+                "INSERT INTO map_versions (map_id, version, map_name, username, content_key, image_key, "
+                "config_path, final_map_filename, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (map_id, latest_version + 1, map_name, username, content_key, image_key, config_path,
+                 final_map_filename, datetime.utcnow().isoformat())
+            )
+        return self.get_version(map_id, latest_version + 1)
+
+    def get_version(self, map_id, version=None):
+        """Returns one version of a map (the latest when version is None), or None."""
+        if version is None:
+            row = self._connection().execute(
+                "SELECT * FROM map_versions WHERE map_id = ? ORDER BY version DESC LIMIT 1", (map_id,)
+            ).fetchone()
+        else:
+            row = self._connection().execute(
+                "SELECT * FROM map_versions WHERE map_id = ? AND version = ?", (map_id, version)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list_versions(self, map_id):
+        return [dict(row) for row in self._connection().execute(
+            "SELECT * FROM map_versions WHERE map_id = ? ORDER BY version", (map_id,)
+        )]
+
+
+# --- Config Patching ---
+# Keywords a diff may set inside NODE and LINK blocks.
+NODE_KEYWORDS = {
+    'LABEL', 'POSITION', 'ICON', 'INFOURL', 'NOTES', 'TARGET', 'USESCALE', 'MAXVALUE', 'ZORDER', 'TEMPLATE',
+    'SET', 'LABELOFFSET', 'LABELFONT', 'LABELANGLE', 'LABELBGCOLOR', 'LABELFONTCOLOR', 'LABELOUTLINECOLOR',
+    'LABELFONTSHADOWCOLOR', 'OVERLIBGRAPH', 'OVERLIBCAPTION', 'OVERLIBWIDTH', 'OVERLIBHEIGHT',
+}
+LINK_KEYWORDS = {
+    'NODES', 'DEVICE', 'INTERFACE', 'BANDWIDTH', 'MAXVALUE', 'WIDTH', 'VIA', 'TARGET', 'USESCALE', 'ZORDER',
+    'TEMPLATE', 'SET', 'ARROWSTYLE', 'LINKSTYLE', 'SPLITPOS', 'DUPLEX', 'BWLABEL', 'BWLABELPOS', 'BWSTYLE',
+    'BWFONT', 'BWFONTCOLOR', 'BWBOXCOLOR', 'BWOUTLINECOLOR', 'OUTLINECOLOR', 'INBWFORMAT', 'OUTBWFORMAT',
+    'COMMENTFONT', 'COMMENTFONTCOLOR', 'COMMENTPOS', 'COMMENTSTYLE', 'INCOMMENT', 'OUTCOMMENT', 'INFOURL',
+    'ININFOURL', 'OUTINFOURL', 'NOTES', 'INNOTES', 'OUTNOTES', 'OVERLIBGRAPH', 'INOVERLIBGRAPH',
+    'OUTOVERLIBGRAPH', 'OVERLIBCAPTION', 'OVERLIBWIDTH', 'OVERLIBHEIGHT',
+}
+
+
+def _check_block_id(kind, block_id):
+    """Block and node IDs are single config tokens, and DEFAULT is the template block."""
+    if not isinstance(block_id, str) or len(block_id.split()) != 1 or block_id.startswith('#') or \
+            block_id.upper() == 'DEFAULT':
+        raise ValueError(f"Invalid {kind} ID: {block_id!r}")
+
+
+def _check_keywords(kind, block_id, keywords, allowed):
+    """
+    Returns keywords upper-cased. Raises ValueError for a keyword outside
+    allowed or a value with a line break, which would inject config lines.
+    """
+    checked = {}
+    for keyword, value in keywords.items():
+        name = str(keyword).upper()
+        if name not in allowed:
+            raise ValueError(f"Keyword {keyword!r} cannot be set on {kind} {block_id}.")
+        if value is not None and ('\r' in str(value) or '\n' in str(value)):
+            raise ValueError(f"Value of {name} on {kind} {block_id} must be a single line.")
+        checked[name] = value
+    return checked
+
+
+def _split_blocks(config_text):
+    """
+    Splits a config into segments: the global section, then one segment per
+    NODE/LINK block, with blank and comment lines that follow a block kept as
+    separate filler segments. Each segment is [kind, block_id, lines].
+    """
+    segments = [[None, None, []]]
+    for line in config_text.split('\n'):
+        stripped = line.strip()
+        parts = stripped.split(None, 2)
+        keyword = parts[0].upper() if parts else ''
+        if keyword in ('NODE', 'LINK'):
+            segments.append([keyword, parts[1] if len(parts) > 1 else '', [line]])
+        elif segments[-1][0] is not None and (not stripped or stripped.startswith('#')):
+            segments.append(['FILLER', None, [line]])
+        elif segments[-1][0] == 'FILLER' and stripped:
+            # A keyword line after filler still belongs to the block before the filler.
+            filler = segments.pop()
+            segments[-1][2].extend(filler[2])
+            segments[-1][2].append(line)
+        else:
+            segments[-1][2].append(line)
+
+    # Merge consecutive filler segments.
+    merged = []
+    for segment in segments:
+        if merged and segment[0] == 'FILLER' and merged[-1][0] == 'FILLER':
+            merged[-1][2].extend(segment[2])
+        else:
+            merged.append(segment)
+    return merged
+
+
+def _set_keyword(lines, keyword, value):
+    """Replaces (or appends, or with value None removes) a keyword line inside a block."""
+    for index, line in enumerate(lines[1:], start=1):
+        parts = line.split(None, 1)
+        if parts and parts[0].upper() == keyword:
+            if value is None:
+                del lines[index]
+            else:
+                lines[index] = f"\t{keyword} {value}"
+            return
+    if value is not None:
+        lines.append(f"\t{keyword} {value}")
+
+
+def _block_nodes(lines):
+    for line in lines[1:]:
+        parts = line.split()
+        if parts and parts[0].upper() == 'NODES':
+            return [part.split(':')[0] for part in parts[1:3]]
+    return []
+
+
+def patch_config(config_text, node_changes=None, link_changes=None):
+    """
+    Applies node and link deltas to a Weathermap config without regenerating it.
+
+    node_changes maps node IDs to {'x', 'y', 'keywords'} (create or update)
+    or None (delete). link_changes maps link IDs to {'nodes': [a, b],
+    'keywords'} or None. Deleting a node also deletes the links that use it.
+    Untouched blocks keep their exact text. Returns (patched_text,
+    removed_link_ids). Raises ValueError for an invalid or DEFAULT ID, a
+    keyword outside NODE_KEYWORDS/LINK_KEYWORDS, a multi-line value, 'nodes'
+    that are not two node IDs, or a link that would reference a node that
+    does not exist.
+    """
+    node_changes = node_changes or {}
+    link_changes = link_changes or {}
+    keywords = {}
+    for kind, changes, allowed in (('NODE', node_changes, NODE_KEYWORDS), ('LINK', link_changes, LINK_KEYWORDS)):
+        for block_id, change in changes.items():
+            _check_block_id(kind, block_id)
+            if change is None:
+                continue
+            if not isinstance(change, dict):
+                raise ValueError(f"Change of {kind} {block_id} must be an object or null.")
+            nodes = change.get('nodes')
+            if nodes is not None:
+                if not isinstance(nodes, list) or len(nodes) != 2:
+                    raise ValueError(f"Nodes of {kind} {block_id} must be a list of two node IDs.")
+                for node_id in nodes:
+                    _check_block_id('NODE', node_id)
+            keywords[(kind, block_id)] = _check_keywords(kind, block_id, change.get('keywords') or {}, allowed)
+    segments = _split_blocks(config_text)
+    by_key = {}
+    for segment in segments:
+        if segment[0] in ('NODE', 'LINK'):
+            by_key[(segment[0], segment[1])] = segment
+
+    def insert_after_last(kind, segment):
+        positions = [index for index, existing in enumerate(segments) if existing[0] == kind]
+        position = positions[-1] + 1 if positions else len(segments)
+        segments.insert(position, segment)
+        # Keep a blank line between blocks, like generated configs.
+        segments.insert(position, ['FILLER', None, ['']])
+
+    removed_links = []
+    for node_id, change in node_changes.items():
+        segment = by_key.get(('NODE', node_id))
+        if change is None:
+            if segment is not None:
+                segments.remove(segment)
+                del by_key[('NODE', node_id)]
+            continue
+        if segment is None:
+            segment = ['NODE', node_id, [f"NODE {node_id}"]]
+            insert_after_last('NODE', segment)
+            by_key[('NODE', node_id)] = segment
+        if 'x' in change and 'y' in change:
+            _set_keyword(segment[2], 'POSITION', f"{int(round(change['x']))} {int(round(change['y']))}")
+        for keyword, value in keywords[('NODE', node_id)].items():
+            _set_keyword(segment[2], keyword, value)
+
+    for link_id, change in link_changes.items():
+        segment = by_key.get(('LINK', link_id))
+        if change is None:
+            if segment is not None:
+                segments.remove(segment)
+                del by_key[('LINK', link_id)]
+            continue
+        if segment is None:
+            if change.get('nodes') is None:
+                raise ValueError(f"Nodes of new LINK {link_id} must be a list of two node IDs.")
+            segment = ['LINK', link_id, [f"LINK {link_id}"]]
+            insert_after_last('LINK', segment)
+            by_key[('LINK', link_id)] = segment
+        if change.get('nodes') is not None:
+            _set_keyword(segment[2], 'NODES', ' '.join(change['nodes']))
+        for keyword, value in keywords[('LINK', link_id)].items():
+            _set_keyword(segment[2], keyword, value)
+
+    node_ids = {block_id for kind, block_id in by_key if kind == 'NODE'}
+    for (kind, link_id), segment in list(by_key.items()):
+        if kind != 'LINK':
+            continue
+        link_nodes = _block_nodes(segment[2])
+        missing = [node for node in link_nodes if node not in node_ids]
+        if not missing:
+            continue
+        if link_id in link_changes:
+            raise ValueError(f"Link {link_id} references unknown node(s): {', '.join(missing)}")
+        segments.remove(segment)
+        removed_links.append(link_id)
+
+    return '\n'.join(line for segment in segments for line in segment[2]), removed_links
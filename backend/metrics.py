@@ -0,0 +1,204 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are updated where the work happens and read by the
+/metrics endpoint (app.py). Gauges that mirror existing state, like task
+counts, are computed from a callback when the endpoint is scraped. Values
+are kept per process: a worker started with worker.py serves its own on
+AUTOCACTI_WORKER_METRICS_PORT.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds. Request and lookup latencies use the Prometheus
+# defaults; map stages run much longer on big backgrounds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Returns every registered metric in the text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                # One broken callback must not hide every other metric.
+                print(f"Could not collect metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, _format_labels(self.labels, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set, with their sum."""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall time of the with-block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        samples = []
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket",
+                                _format_labels(self.labels, key, [('le', _format_value(bound))]), cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labels, key), counts[-1]))
+            samples.append((f"{self.name}_count", _format_labels(self.labels, key), cumulative))
+        return samples
+
+
+class CallbackMetric:
+    """
+    A gauge (or counter kept elsewhere) read from callback() at scrape time.
+    callback returns {label values tuple: value}.
+    """
+
+    def __init__(self, name, help_text, labels, callback, kind='gauge', registry=REGISTRY):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.callback = callback
+        registry.register(self)
+
+    def samples(self):
+        return [(self.name, _format_labels(self.labels, key), value)
+                for key, value in sorted(self.callback().items())]
+
+
+def start_http_server(port, registry=REGISTRY):
+    """Serves registry on port from a daemon thread, for processes without the Flask app."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+# --- Application Metrics ---
+HTTP_REQUEST_SECONDS = Histogram(
+    'autocacti_http_request_duration_seconds', "Time spent serving a request, by route.",
+    ('method', 'route', 'status')
+)
+AUTH_SECONDS = Histogram(
+    'autocacti_auth_duration_seconds', "Time spent authenticating the bearer token of a request, by route.",
+    ('route',)
+)
+SNMP_LOOKUP_SECONDS = Histogram(
+    'autocacti_snmp_lookup_duration_seconds', "Duration of SNMP lookups that missed the cache, by kind.",
+    ('kind', 'result')
+)
+MAP_STAGE_SECONDS = Histogram(
+    'autocacti_map_stage_duration_seconds',
+    "Time an upload spent in each stage: queue, save, parse, decode_background, draw, encode_png.",
+    ('stage',), buckets=STAGE_BUCKETS
+)
+STATIC_BYTES_WRITTEN = Counter(
+    'autocacti_static_bytes_written_total', "Bytes written under static/, by directory.",
+    ('directory',)
+)
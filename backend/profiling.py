@@ -0,0 +1,262 @@
+"""
+On-demand profiling of single requests and map task runs.
+
+An admin arms a profile (POST /admin/profiles) for the next request or
+process_map_task run whose path, route rule, map name, upload ID, map ID or
+username matches a glob pattern. That run is profiled with cProfile
+(downloaded as a pstats file) or with a stack sampler (downloaded as
+collapsed stacks for flamegraph.pl or speedscope). Profiles are stored
+under PROFILE_DIR, outside 'static/'.
+
+Arms live in SQLite next to the task queue, so a worker process started with
+worker.py picks them up too. While nothing is armed, the only cost per
+request or task is a cached flag check; the database is polled at most once
+per PROFILE_ARM_POLL_SECONDS.
+"""
+import cProfile
+import fnmatch
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+import task_queue
+
+# --- Profiling Configuration ---
+PROFILE_DIR = os.environ.get('AUTOCACTI_PROFILE_DIR', os.path.join(task_queue.TASK_DATA_DIR, 'profiles'))
+PROFILE_DB_PATH = task_queue.TASK_DB_PATH
+PROFILE_MAX_STORED = int(os.environ.get('AUTOCACTI_PROFILE_MAX_STORED', 50))
+PROFILE_MAX_ARM_COUNT = 20
+PROFILE_ARM_POLL_SECONDS = 1.0
+SAMPLING_INTERVAL_SECONDS = 0.005
+
+TARGETS = ('request', 'task')
+# mode -> (download format, file extension)
+MODES = {'cprofile': ('pstats', 'prof'), 'sampling': ('collapsed', 'folded')}
+
+
+class ProfileStore:
+    """SQLite-backed profile arms and the index of stored profiles."""
+
+    def __init__(self, db_path, profile_dir):
+        self.db_path = db_path
+        self.profile_dir = profile_dir
+        self._local = threading.local()
+        self._armed_targets = set()
+        self._checked_until = 0.0
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS profile_arms (
+                id TEXT PRIMARY KEY,
+                target TEXT NOT NULL,
+                pattern TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                remaining INTEGER NOT NULL,
+                created_by TEXT,
+                created_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS profiles (
+                id TEXT PRIMARY KEY,
+                arm_id TEXT NOT NULL,
+                target TEXT NOT NULL,
+                label TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                format TEXT NOT NULL,
+                path TEXT NOT NULL,
+                duration REAL NOT NULL,
+                created_at TEXT NOT NULL
+            );
+        """)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # --- Arms ---
+    def arm(self, target, pattern, mode, count, username):
+        arm = {
+            'id': str(uuid.uuid4()), 'target': target, 'pattern': pattern or '*', 'mode': mode,
+            'remaining': count, 'created_by': username, 'created_at': datetime.utcnow().isoformat()
+        }
+        self._connection().execute(
+            "INSERT INTO profile_arms (id, target, pattern, mode, remaining, created_by, created_at) "
+            "VALUES (:id, :target, :pattern, :mode, :remaining, :created_by, :created_at)", arm
+        )
+        self._checked_until = 0.0
+        return arm
+
+    def disarm(self, arm_id):
+        """Removes one arm. Returns False when it no longer exists."""
+        return self._connection().execute("DELETE FROM profile_arms WHERE id = ?", (arm_id,)).rowcount > 0
+
+    def list_arms(self):
+        return [dict(row) for row in self._connection().execute("SELECT * FROM profile_arms ORDER BY created_at")]
+
+    def is_armed(self, target):
+        """Cheap check for the hot path; may lag behind the database by PROFILE_ARM_POLL_SECONDS."""
+        now = time.monotonic()
+        if now >= self._checked_until:
+            try:
+                self._armed_targets = {
+                    row[0] for row in self._connection().execute("SELECT DISTINCT target FROM profile_arms")
+                }
+            except sqlite3.Error as e:
+                print(f"Could not read profile arms: {e}")
+                self._armed_targets = set()
+            self._checked_until = now + PROFILE_ARM_POLL_SECONDS
+        return target in self._armed_targets
+
+    def claim(self, target, labels):
+        """
+        Takes one run from the oldest arm of target matching any of labels.
+        Returns the arm, or None.
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for row in conn.execute(
+                "SELECT * FROM profile_arms WHERE target = ? ORDER BY created_at", (target,)
+            ).fetchall():
+                if not any(fnmatch.fnmatchcase(str(label), row['pattern']) for label in labels if label):
+                    continue
+                if row['remaining'] > 1:
+                    conn.execute("UPDATE profile_arms SET remaining = remaining - 1 WHERE id = ?", (row['id'],))
+                else:
+                    conn.execute("DELETE FROM profile_arms WHERE id = ?", (row['id'],))
+                return dict(row)
+        return None
+
+    # --- Profiles ---
+    def add_profile(self, profile):
+        conn = self._connection()
+        conn.execute(
+            "INSERT INTO profiles (id, arm_id, target, label, mode, format, path, duration, created_at) "
+            "VALUES (:id, :arm_id, :target, :label, :mode, :format, :path, :duration, :created_at)", profile
+        )
+        # Keep the newest PROFILE_MAX_STORED profiles.
+        for row in conn.execute(
+            "SELECT id, path FROM profiles ORDER BY created_at DESC LIMIT -1 OFFSET ?", (PROFILE_MAX_STORED,)
+        ).fetchall():
+            conn.execute("DELETE FROM profiles WHERE id = ?", (row['id'],))
+            try:
+                os.remove(row['path'])
+            except FileNotFoundError:
+                pass
+
+    def list_profiles(self):
+        return [dict(row) for row in self._connection().execute("SELECT * FROM profiles ORDER BY created_at DESC")]
+
+    def get_profile(self, profile_id):
+        row = self._connection().execute("SELECT * FROM profiles WHERE id = ?", (profile_id,)).fetchone()
+        return dict(row) if row else None
+
+
+# --- Profilers ---
+class _CProfileSession:
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self, path):
+        self.profiler.disable()
+        self.profiler.dump_stats(path)
+
+
+class _SamplingSession:
+    """Samples the stack of the thread that started it every SAMPLING_INTERVAL_SECONDS."""
+
+    def __init__(self, interval=SAMPLING_INTERVAL_SECONDS):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._sample, args=(thread_id,), name='profile-sampler', daemon=True)
+        self._thread.start()
+
+    def _sample(self, thread_id):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self, path):
+        self._stopped.set()
+        self._thread.join()
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfileRun:
+    """One armed run being profiled."""
+
+    def __init__(self, store, arm, label):
+        self.store = store
+        self.arm = arm
+        self.label = label
+        self.mode = arm['mode']
+        self.session = _CProfileSession() if self.mode == 'cprofile' else _SamplingSession()
+
+    def start(self):
+        self.started = time.perf_counter()
+        try:
+            self.session.start()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process; sample instead.
+            self.mode = 'sampling'
+            self.session = _SamplingSession()
+            self.session.start()
+        return self
+
+    def stop(self):
+        duration = time.perf_counter() - self.started
+        profile_id = str(uuid.uuid4())
+        profile_format, extension = MODES[self.mode]
+        os.makedirs(self.store.profile_dir, exist_ok=True)
+        path = os.path.join(self.store.profile_dir, f"{profile_id}.{extension}")
+        try:
+            self.session.stop(path)
+            self.store.add_profile({
+                'id': profile_id, 'arm_id': self.arm['id'], 'target': self.arm['target'], 'label': self.label,
+                'mode': self.mode, 'format': profile_format, 'path': path, 'duration': duration,
+                'created_at': datetime.utcnow().isoformat()
+            })
+        except Exception as e:
+            # Losing a profile must never fail the request or task it measured.
+            print(f"Could not store profile of {self.label}: {e}")
+
+
+PROFILES = ProfileStore(PROFILE_DB_PATH, PROFILE_DIR)
+
+
+def start(target, label, match_labels):
+    """
+    Starts profiling the current thread when an arm of target matches any of
+    match_labels. Returns the ProfileRun to stop(), or None.
+    """
+    if not PROFILES.is_armed(target):
+        return None
+    try:
+        arm = PROFILES.claim(target, match_labels)
+    except sqlite3.Error as e:
+        print(f"Could not claim a profile arm: {e}")
+        return None
+    return ProfileRun(PROFILES, arm, label).start() if arm else None
@@ -1,12 +1,25 @@
+import asyncio
 import os
 import uuid
 import re
+import hashlib
 from PIL import Image
 from werkzeug.security import check_password_hash
 import time
 from datetime import datetime
+import data_sources
+import delivery
 import map_renderer
-import random
+import map_versions
+import metrics
+import profiling
+import task_queue
+import topology
+import uploads
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 
 # --- Mock Authentication Data ---
 MOCK_USERS = {
@@ -15,8 +28,9 @@ MOCK_USERS = {
     }
 }
 
-# --- Mock Task Queue ---
-MOCK_TASKS = {}
+# --- Task Queue ---
+# Persistent (SQLite-backed) store shared by the web server and any worker processes.
+MOCK_TASKS = task_queue.TaskStore(task_queue.TASK_DB_PATH)
 
 
 def verify_user(username, password):
@@ -402,124 +416,899 @@ def get_installations_by_group_id(group_id):
             return group['installations']
     return None
 
-def get_device_info(ip_address):
-    """Fetches device type, model, and hostname by IP address."""
-    time.sleep(random.uniform(0.3, 1.2)) # Simulate network latency
-    if ip_address in MOCK_NETWORK:
-        device_data = MOCK_NETWORK[ip_address]
-        return {
-            "ip": ip_address,
-            "model": device_data.get("model", "Unknown Model"),
-            "type": device_data.get("type", "Unknown Type"),
-            "hostname": device_data.get("hostname", "Unknown Hostname")
-        }
-    return None
+# --- Device Data Source ---
+# The mock tables above, a synthetic topology or recorded responses, selected
+# by AUTOCACTI_DATA_SOURCE (see data_sources.py).
+DATA_SOURCE = data_sources.create_data_source(MOCK_NETWORK, MOCK_NEIGHBORS, MOCK_FULL_SCAN_EXTRAS)
 
-def get_device_neighbors(ip_address):
-    """Gets CDP neighbors of a device by IP address using SNMP (mocked)."""
-    time.sleep(random.uniform(0.5, 1.5)) # Simulate network latency
-    if ip_address not in MOCK_NETWORK:
+# --- Topology Index ---
+# Built once by the data source from its neighbor tables; neighbor lookups
+# read the merged per-device lists from here instead of re-merging them on
+# every call.
+TOPOLOGY = DATA_SOURCE.index
+
+def get_topology_neighbors(node_id):
+    """Returns the node and its aggregated link bundles from the topology index, or None."""
+    node = TOPOLOGY.get_node(node_id)
+    if node is None:
         return None
-    if ip_address in MOCK_NEIGHBORS:
-        return {"neighbors": MOCK_NEIGHBORS[ip_address]}
-    return None
+    return {
+        "node": dict(node),
+        "bundles": [
+            dict(bundle, neighbor=neighbor_id, links=[dict(link) for link in bundle['links']])
+            for neighbor_id, bundle in TOPOLOGY.neighbors(node_id).items()
+        ]
+    }
 
-def get_full_device_neighbors(ip_address):
-    """Gets extended neighbors (CDP + ARP/IP scan) for a device."""
-    time.sleep(random.uniform(2.0, 4.0)) # Full scan takes longer
-    
-    if ip_address not in MOCK_NETWORK:
+def _record_topology(kind, ip_address, result):
+    """
+    Folds a successful SNMP lookup into TOPOLOGY. A changed device or
+    neighbor list bumps the index version, which drops the cached queries.
+    """
+    if not result or 'error' in result:
+        return
+    if kind == 'info':
+        TOPOLOGY.add_device(ip_address, result.get('hostname', ip_address), result.get('type', 'Unknown'),
+                            result.get('model', 'Unknown Model'))
+        return
+    neighbors = result.get('neighbors') or []
+    if kind == 'neighbors':
+        TOPOLOGY.set_neighbors(ip_address, neighbors, scope='cdp')
+    else:
+        # Full scans answer the CDP neighbors plus the extras only they find.
+        TOPOLOGY.set_neighbors(ip_address, [n for n in neighbors if not n.get('isFullScan')], scope='cdp')
+        TOPOLOGY.set_neighbors(ip_address, [n for n in neighbors if n.get('isFullScan')], scope='full')
+
+# Query results are cached until the index changes.
+TOPOLOGY_QUERIES = topology.QueryCache(TOPOLOGY)
+TOPOLOGY_MAX_HOPS = 6
+
+def find_topology_path(source, target, metric='bandwidth'):
+    """
+    Returns the best path between two devices (IP or hostname) as
+    {'nodes', 'bundles', 'cost'}, {} when they are not connected, or None
+    when either device is unknown.
+    """
+    source_id, target_id = TOPOLOGY.find_node(source), TOPOLOGY.find_node(target)
+    if source_id is None or target_id is None:
         return None
-        
-    # Start with standard neighbors (using list() to create a copy and avoid mutating global)
-    results = []
-    if ip_address in MOCK_NEIGHBORS:
-        results.extend([dict(n) for n in MOCK_NEIGHBORS[ip_address]])
-        
-    # Add extra 'hidden' neighbors found by full scan
-    if ip_address in MOCK_FULL_SCAN_EXTRAS:
-        results.extend([dict(n) for n in MOCK_FULL_SCAN_EXTRAS[ip_address]])
-        
-    if not results:
+    path = TOPOLOGY_QUERIES.get_or_compute(
+        ('path', source_id, target_id, metric),
+        lambda: topology.shortest_path(TOPOLOGY, source_id, target_id, metric)
+    )
+    return path or {}
+
+def get_topology_critical_elements():
+    """Returns the articulation points and bridges of the whole topology."""
+    return TOPOLOGY_QUERIES.get_or_compute(('critical',), lambda: topology.critical_elements(TOPOLOGY))
+
+def get_failure_impact(node):
+    """Returns what is cut off from the network if the given device fails, or None if unknown."""
+    node_id = TOPOLOGY.find_node(node)
+    if node_id is None:
         return None
-        
-    return {"neighbors": results}
+    return TOPOLOGY_QUERIES.get_or_compute(('impact', node_id), lambda: topology.failure_impact(TOPOLOGY, node_id))
+
+def get_topology_subgraph(node, hops):
+    """Returns the nodes and bundles within hops links of a device, or None if unknown."""
+    node_id = TOPOLOGY.find_node(node)
+    if node_id is None:
+        return None
+    hops = max(0, min(hops, TOPOLOGY_MAX_HOPS))
+    return TOPOLOGY_QUERIES.get_or_compute(
+        ('subgraph', node_id, hops),
+        lambda: TOPOLOGY.to_dict(topology.k_hop_node_ids(TOPOLOGY, node_id, hops))
+    )
+
+# --- Simulated Latency ---
+# Multiplies every simulated delay (SNMP lookups and the map pipeline), so
+# tests and benchmarks can shorten or disable them (0).
+SIMULATED_LATENCY_SCALE = float(os.environ.get('AUTOCACTI_LATENCY_SCALE', 1.0))
+
+def _simulate_latency(seconds):
+    if SIMULATED_LATENCY_SCALE > 0:
+        time.sleep(seconds * SIMULATED_LATENCY_SCALE)
+
+async def _simulate_latency_async(seconds):
+    if SIMULATED_LATENCY_SCALE > 0:
+        await asyncio.sleep(seconds * SIMULATED_LATENCY_SCALE)
+
+# --- SNMP Lookups (mocked) ---
+# The data source answers each lookup and says how long it took; the delay
+# is simulated here so the async variants can wait without blocking.
+def _fetch_device_info(ip_address):
+    """Fetches device type, model, and hostname by IP address."""
+    latency, result = DATA_SOURCE.lookup('info', ip_address)
+    _simulate_latency(latency) # Simulate network latency
+    return result
+
+def _fetch_device_neighbors(ip_address):
+    """Gets CDP neighbors of a device by IP address using SNMP (mocked)."""
+    latency, result = DATA_SOURCE.lookup('neighbors', ip_address)
+    _simulate_latency(latency) # Simulate network latency
+    return result
+
+def _fetch_full_device_neighbors(ip_address):
+    """Gets extended neighbors (CDP + ARP/IP scan) for a device."""
+    latency, result = DATA_SOURCE.lookup('full_neighbors', ip_address)
+    _simulate_latency(latency)
+    return result
+
+# Async variants wait on the event loop instead of blocking a thread (see asgi.py).
+async def _fetch_device_info_async(ip_address):
+    latency, result = DATA_SOURCE.lookup('info', ip_address)
+    await _simulate_latency_async(latency)
+    return result
+
+async def _fetch_device_neighbors_async(ip_address):
+    latency, result = DATA_SOURCE.lookup('neighbors', ip_address)
+    await _simulate_latency_async(latency)
+    return result
+
+async def _fetch_full_device_neighbors_async(ip_address):
+    latency, result = DATA_SOURCE.lookup('full_neighbors', ip_address)
+    await _simulate_latency_async(latency)
+    return result
+
+# --- SNMP Result Cache ---
+# Seconds a result stays fresh, per lookup kind. Full scans are the most
+# expensive (2-4s per device), so they are kept the longest.
+SNMP_CACHE_TTLS = {
+    'info': 600,
+    'neighbors': 300,
+    'full_neighbors': 900,
+}
+# Negative results (unknown device, SNMP timeout) are retried much sooner.
+SNMP_CACHE_NEGATIVE_TTL = 30
+SNMP_CACHE_MAX_ENTRIES = 5000
+
+def _observe_lookup(kind, start, result):
+    # 'empty' covers unknown devices, devices without neighbors and timeouts.
+    metrics.SNMP_LOOKUP_SECONDS.observe(time.perf_counter() - start, kind=kind, result=result)
+
+class SnmpCache:
+    """
+    Thread-safe TTL + LRU cache for SNMP lookup results.
+
+    Entries are keyed by (kind, ip). On a miss, concurrent callers asking for
+    the same key wait on a single in-flight fetch instead of each querying
+    the device. Cached values are shared between callers and must not be
+    mutated.
+    """
+
+    def __init__(self, ttls, negative_ttl, max_entries):
+        self._ttls = ttls
+        self._negative_ttl = negative_ttl
+        self._max_entries = max_entries
+        self._entries = OrderedDict()  # (kind, ip) -> (expires_at, value)
+        self._inflight = {}            # (kind, ip) -> Future
+        self._lock = threading.Lock()
+        self._stats = {kind: {'hits': 0, 'misses': 0, 'coalesced': 0} for kind in ttls}
+
+    def _begin(self, kind, key):
+        """
+        Returns (value, future, owner). value is set on a fresh hit; otherwise
+        the caller either owns the new in-flight future or waits on another's.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats[kind]['hits'] += 1
+                return entry[1], None, False
+
+            future = self._inflight.get(key)
+            if future:
+                self._stats[kind]['coalesced'] += 1
+                return None, future, False
+
+            future = Future()
+            self._inflight[key] = future
+            self._stats[kind]['misses'] += 1
+            return None, future, True
+
+    def _fail(self, key, future, e):
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_exception(e)
+
+    def _finish(self, kind, key, future, value):
+        ttl = self._ttls[kind] if value is not None else self._negative_ttl
+        with self._lock:
+            # An invalidation during the fetch removes the in-flight marker;
+            # in that case the (possibly stale) result is not stored.
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+                self._entries[key] = (time.monotonic() + ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def get_or_fetch(self, kind, ip_address, fetch):
+        key = (kind, ip_address)
+        value, future, owner = self._begin(kind, key)
+        if future is None:
+            return value
+        if not owner:
+            return future.result()
+
+        start = time.perf_counter()
+        try:
+            value = fetch(ip_address)
+        except Exception as e:
+            _observe_lookup(kind, start, 'error')
+            self._fail(key, future, e)
+            raise
+        _observe_lookup(kind, start, 'ok' if value is not None else 'empty')
+        return self._finish(kind, key, future, value)
+
+    async def get_or_fetch_async(self, kind, ip_address, fetch):
+        """
+        Same as get_or_fetch() for a coroutine fetch. Sync and async callers
+        share entries and coalesce onto each other's in-flight lookups.
+        """
+        key = (kind, ip_address)
+        value, future, owner = self._begin(kind, key)
+        if future is None:
+            return value
+        if not owner:
+            # Shielded: a cancelled waiter must not cancel the shared lookup.
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        start = time.perf_counter()
+        try:
+            value = await fetch(ip_address)
+        except BaseException as e:
+            # Also release waiters when the request is cancelled mid-lookup.
+            _observe_lookup(kind, start, 'error')
+            self._fail(key, future, e)
+            raise
+        _observe_lookup(kind, start, 'ok' if value is not None else 'empty')
+        return self._finish(kind, key, future, value)
+
+    def invalidate(self, ip_address):
+        """Drops every cached kind for one IP. Returns the number of entries removed."""
+        with self._lock:
+            keys = [(kind, ip_address) for kind in self._ttls]
+            removed = sum(1 for key in keys if self._entries.pop(key, None) is not None)
+            for key in keys:
+                self._inflight.pop(key, None)
+            return removed
+
+    def clear(self):
+        """Drops every cached entry. Returns the number of entries removed."""
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._inflight.clear()
+            return removed
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self._max_entries,
+                'in_flight': len(self._inflight),
+                'ttls': dict(self._ttls),
+                'kinds': {kind: dict(counters) for kind, counters in self._stats.items()}
+            }
+
+SNMP_CACHE = SnmpCache(SNMP_CACHE_TTLS, SNMP_CACHE_NEGATIVE_TTL, SNMP_CACHE_MAX_ENTRIES)
+
+def get_device_info(ip_address):
+    """Fetches device type, model, and hostname by IP address (cached)."""
+    return SNMP_CACHE.get_or_fetch('info', ip_address, _fetch_device_info)
+
+def get_device_neighbors(ip_address):
+    """Gets CDP neighbors of a device by IP address (cached)."""
+    return SNMP_CACHE.get_or_fetch('neighbors', ip_address, _fetch_device_neighbors)
+
+def get_full_device_neighbors(ip_address):
+    """Gets extended neighbors (CDP + ARP/IP scan) for a device (cached)."""
+    return SNMP_CACHE.get_or_fetch('full_neighbors', ip_address, _fetch_full_device_neighbors)
+
+async def get_device_info_async(ip_address):
+    return await SNMP_CACHE.get_or_fetch_async('info', ip_address, _fetch_device_info_async)
+
+async def get_device_neighbors_async(ip_address):
+    return await SNMP_CACHE.get_or_fetch_async('neighbors', ip_address, _fetch_device_neighbors_async)
+
+async def get_full_device_neighbors_async(ip_address):
+    return await SNMP_CACHE.get_or_fetch_async('full_neighbors', ip_address, _fetch_full_device_neighbors_async)
+
+# --- Server-Side Topology Discovery ---
+# Upper bound on concurrent SNMP lookups, shared by every crawl and batch
+# running in this process.
+DISCOVERY_MAX_WORKERS = 16
+DISCOVERY_EXECUTOR = ThreadPoolExecutor(max_workers=DISCOVERY_MAX_WORKERS, thread_name_prefix='snmp-lookup')
+
+def _lookup_batch(lookup, kind, ip_addresses, not_found_message):
+    """
+    Runs a single-device lookup for many IPs concurrently and returns a dict
+    keyed by IP. Failed or empty lookups are recorded as {"error": ...};
+    successful ones also update the topology index.
+    """
+    unique_ips = list(dict.fromkeys(ip_addresses))
+    results = {}
+    if not unique_ips:
+        return results
+
+    futures = {DISCOVERY_EXECUTOR.submit(lookup, ip): ip for ip in unique_ips}
+    for future in as_completed(futures):
+        ip = futures[future]
+        try:
+            result = future.result()
+        except Exception as e:
+            results[ip] = {"error": f"Lookup failed: {e}"}
+            continue
+        results[ip] = result if result else {"error": not_found_message}
+        _record_topology(kind, ip, result)
+
+    return results
+
+def get_device_info_batch(ip_addresses):
+    """Fetches device info for many IPs concurrently."""
+    return _lookup_batch(get_device_info, 'info', ip_addresses, "Device not found")
+
+def get_device_neighbors_batch(ip_addresses):
+    """Fetches CDP neighbors for many IPs concurrently."""
+    return _lookup_batch(get_device_neighbors, 'neighbors', ip_addresses, "Device not found or has no neighbors")
+
+def discover_topology(seed_ip, max_depth=2, max_devices=200, full_scan=False):
+    """
+    Crawls the network breadth-first starting at seed_ip and returns every
+    discovered node and edge in one structure.
+
+    Device info and neighbor lookups run concurrently on DISCOVERY_EXECUTOR.
+    Each IP is queried at most once; devices beyond max_depth are reported
+    as nodes but not expanded. Neighbors past the max_devices budget are not
+    queried at all and are reported as placeholder nodes with 'truncated'
+    set, so every edge still ends at a node.
+    """
+    neighbor_lookup = get_full_device_neighbors if full_scan else get_device_neighbors
+    neighbor_kind = 'full_neighbors' if full_scan else 'neighbors'
+
+    nodes = {}
+    edges = []
+    errors = {}
+    depths = {seed_ip: 0}
+    truncated = False
+
+    pending = {}
+
+    def schedule(ip, depth):
+        pending[DISCOVERY_EXECUTOR.submit(get_device_info, ip)] = ('info', ip, depth)
+        if depth < max_depth:
+            pending[DISCOVERY_EXECUTOR.submit(neighbor_lookup, ip)] = ('neighbors', ip, depth)
+
+    schedule(seed_ip, 0)
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            kind, ip, depth = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                errors[ip] = f"{kind} lookup failed: {e}"
+                continue
+            _record_topology('info' if kind == 'info' else neighbor_kind, ip, result)
+
+            if kind == 'info':
+                if result:
+                    nodes[ip] = dict(result, depth=depth)
+                else:
+                    errors[ip] = "Device not found"
+                    nodes.setdefault(ip, {"ip": ip, "hostname": ip, "type": "Unknown", "depth": depth})
+                continue
+
+            for index, neighbor in enumerate((result or {}).get('neighbors', [])):
+                neighbor_ip = neighbor.get('ip')
+                hostname = neighbor.get('hostname') or neighbor_ip
+                if not hostname:
+                    # Nothing identifies the device, so there is no node to link to.
+                    continue
+                target = neighbor_ip or hostname
+                interface = neighbor.get('interface') or ''
+                edges.append({
+                    "id": f"e-{ip}-{target}-{interface.replace('/', '-') or index}",
+                    "source": ip,
+                    "target": target,
+                    "interface": interface,
+                    "description": neighbor.get('description', ''),
+                    "bandwidth": neighbor.get('bandwidth', ''),
+                    "isFullScan": neighbor.get('isFullScan', False)
+                })
+
+                if not neighbor_ip:
+                    # End devices without an IP cannot be queried; record them as-is.
+                    nodes.setdefault(target, {"ip": "", "hostname": target, "type": "Unknown", "depth": depth + 1})
+                elif neighbor_ip not in depths:
+                    if len(depths) >= max_devices:
+                        truncated = True
+                        # Keep the edge's endpoint as a node that was not queried.
+                        nodes.setdefault(neighbor_ip, {
+                            "ip": neighbor_ip, "hostname": hostname, "type": "Unknown",
+                            "depth": depth + 1, "truncated": True
+                        })
+                        continue
+                    depths[neighbor_ip] = depth + 1
+                    schedule(neighbor_ip, depth + 1)
 
-def save_uploaded_map(map_image_file, config_content, map_name):
-    """Saves the uploaded map image and config file to the designated folders."""
+    return {
+        "seed": seed_ip,
+        "nodes": list(nodes.values()),
+        "edges": edges,
+        "errors": errors,
+        "truncated": truncated
+    }
+
+# --- Content-Addressed Map Storage ---
+# Stored files are named after a hash of their content, so identical uploads
+# share one image, one config and one rendered map.
+CONTENT_KEY_LENGTH = 32
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def _hash_image_source(map_image_file):
+    """Returns the SHA-256 hex digest of an image given as a path or a file object."""
+    digest = hashlib.sha256()
+    if isinstance(map_image_file, str):
+        with open(map_image_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    stream = getattr(map_image_file, 'stream', map_image_file)
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def normalize_config(config_content):
+    """Normalizes line endings and trailing whitespace so cosmetic edits hash identically."""
+    lines = config_content.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip() + '\n'
+
+def _write_atomic(path, write):
+    """Writes a file through a temporary name so readers never see partial content."""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _record_static_write(path)
+
+def _record_static_write(path):
+    metrics.STATIC_BYTES_WRITTEN.inc(os.path.getsize(path), directory=os.path.basename(os.path.dirname(path)))
+
+# Background formats stored as uploaded, so renders can decode JPEGs at a
+# reduced size; anything else is converted to PNG.
+STORED_BACKGROUND_EXTENSIONS = {'PNG': '.png', 'JPEG': '.jpg'}
+
+def _stored_background_path(image_key):
+    """Returns the stored background for image_key, or None."""
+    for extension in STORED_BACKGROUND_EXTENSIONS.values():
+        image_path = os.path.join("static/maps", f"{image_key}{extension}")
+        if os.path.exists(image_path):
+            return image_path
+    return None
+
+def save_uploaded_map(map_image_file, config_content):
+    """
+    Stores the uploaded map image and config file under content-addressed names.
+
+    The image is keyed by a hash of its bytes and the config by a hash of the
+    image key plus the normalized config, so re-uploading an unchanged map
+    writes nothing new. Large backgrounds also get a pre-reduced copy for
+    rendering. Returns the stored paths and the content key.
+    """
     maps_dir = "static/maps"
-    configs_dir = "static/configs"
     os.makedirs(maps_dir, exist_ok=True)
+
+    # Save Image (once per distinct background)
+    if isinstance(map_image_file, str) and \
+            os.path.dirname(os.path.abspath(map_image_file)) == os.path.abspath(maps_dir):
+        # A stored background (map redeploy) keeps its key and file.
+        image_key = os.path.splitext(os.path.basename(map_image_file))[0]
+        image_path = map_image_file
+    else:
+        image_key = _hash_image_source(map_image_file)[:CONTENT_KEY_LENGTH]
+        image_path = _stored_background_path(image_key)
+
+    if image_path is None:
+        image_stream = getattr(map_image_file, 'stream', map_image_file)
+        with Image.open(image_stream) as image:
+            extension = STORED_BACKGROUND_EXTENSIONS.get(image.format)
+            image_path = os.path.join(maps_dir, f"{image_key}{extension or '.png'}")
+            if extension is None:
+                _write_atomic(image_path, lambda tmp_path: image.save(tmp_path, 'PNG'))
+            elif isinstance(map_image_file, str):
+                # Keep the uploaded bytes instead of decoding the whole image.
+                _write_atomic(image_path, lambda tmp_path: shutil.copyfile(map_image_file, tmp_path))
+            else:
+                image_stream.seek(0)
+                _write_atomic(image_path, lambda tmp_path: _copy_stream(image_stream, tmp_path))
+        reduced_path = map_renderer.store_reduced_background(image_path)
+        if reduced_path:
+            _record_static_write(reduced_path)
+
+    config_path, content_key = _store_config(image_key, config_content)
+    return {"image_path": image_path, "config_path": config_path, "content_key": content_key,
+            "image_key": image_key}
+
+def _copy_stream(stream, path):
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(stream, f)
+
+def _store_config(image_key, config_content):
+    """
+    Stores a config for the background image_key under a content-addressed
+    name. Returns (config_path, content_key).
+    """
+    configs_dir = "static/configs"
     os.makedirs(configs_dir, exist_ok=True)
 
-    unique_id = uuid.uuid4()
-    
-    # Save Image
-    image_filename = f"{map_name}_{unique_id}.png"
-    image_path = os.path.join(maps_dir, image_filename)
-    
-    image_stream = getattr(map_image_file, 'stream', map_image_file)
-    image = Image.open(image_stream)
-    image.save(image_path)
-    
     # Update Config Content
+    image_path = _stored_background_path(image_key)
+    image_filename = os.path.basename(image_path) if image_path else f"{image_key}.png"
     cacti_image_path = f"../maps/{image_filename}"
     modified_config_content = re.sub(
-        r'^(BACKGROUND\s+).*$', 
-        fr'\1{cacti_image_path}', 
-        config_content, 
+        r'^(BACKGROUND\s+).*$',
+        fr'\1{cacti_image_path}',
+        normalize_config(config_content),
         flags=re.MULTILINE
     )
 
-    # Save Config
-    config_filename = f"{map_name}_{unique_id}.conf"
-    config_path = os.path.join(configs_dir, config_filename)
-    with open(config_path, 'w') as f:
-        f.write(modified_config_content)
+    # Save Config (once per distinct image + config pair)
+    content_key = hashlib.sha256(
+        f"{image_key}\n{modified_config_content}".encode('utf-8')
+    ).hexdigest()[:CONTENT_KEY_LENGTH]
+    config_path = os.path.join(configs_dir, f"{content_key}.conf")
+
+    if not os.path.exists(config_path):
+        def write_config(tmp_path):
+            with open(tmp_path, 'w') as f:
+                f.write(modified_config_content)
+        _write_atomic(config_path, write_config)
 
-    return {"image_path": image_path, "config_path": config_path}
+    return config_path, content_key
 
-def process_map_task(task_id, map_image_bytes, config_content, map_name):
+def queue_map_upload(map_image_file, config_content, map_name, installations, username, cacti_group_id=None,
+                     map_id=None):
     """
-    Simulates a long-running task to process and render a map.
+    Spools the uploaded image to disk once and queues one map task per
+    installation. All tasks of the upload share the spooled file by path.
+    The rendered map is recorded as a new version of map_id.
+    Raises uploads.InvalidUploadError for an unreadable or oversized image,
+    and task_queue.QueueFullError or UserQuotaExceededError when the queue
+    limits are reached. Returns the created task descriptors.
     """
+    upload_id = str(uuid.uuid4())
+    os.makedirs(task_queue.UPLOAD_SPOOL_DIR, exist_ok=True)
+    spool_path = os.path.join(task_queue.UPLOAD_SPOOL_DIR, f"{upload_id}.upload")
+    uploads.claim_upload(map_image_file, spool_path)
+
     try:
-        MOCK_TASKS[task_id].update({
-            'status': 'PROCESSING',
-            'message': 'Saving uploaded map components...',
-            'updated_at': datetime.utcnow().isoformat()
+        return _enqueue_map_tasks(upload_id, installations, username, cacti_group_id, {
+            'upload_id': upload_id,
+            'map_image': spool_path,
+            'config_content': config_content,
+            'map_name': map_name,
+            'map_id': map_id,
+            'username': username
         })
-        
-        time.sleep(2)
+    except Exception:
+        os.remove(spool_path)
+        raise
 
-        saved_paths = save_uploaded_map(map_image_bytes, config_content, map_name)
-        config_path = saved_paths['config_path']
-        
-        MOCK_TASKS[task_id].update({
+def _enqueue_map_tasks(upload_id, installations, username, cacti_group_id, payload):
+    tasks = [{
+        'id': str(uuid.uuid4()),
+        'upload_id': upload_id,
+        'hostname': installation['hostname'],
+        'cacti_group_id': cacti_group_id,
+        'payload': payload
+    } for installation in installations]
+
+    MOCK_TASKS.enqueue(
+        tasks, username,
+        max_queue_depth=task_queue.TASK_MAX_QUEUE_DEPTH,
+        max_pending_per_user=task_queue.TASK_MAX_PENDING_PER_USER
+    )
+
+    TASK_EXECUTOR.notify()
+    return [{"hostname": task['hostname'], "task_id": task['id']} for task in tasks]
+
+def _release_upload(upload_id, spool_path):
+    """Deletes a spooled upload once no task of its upload still needs it."""
+    spool_dir = os.path.abspath(task_queue.UPLOAD_SPOOL_DIR)
+    if os.path.dirname(os.path.abspath(spool_path)) != spool_dir:
+        # Redeployed map versions point at stored backgrounds, which are kept.
+        return
+    if MOCK_TASKS.is_upload_finished(upload_id):
+        try:
+            os.remove(spool_path)
+        except FileNotFoundError:
+            pass
+
+def prepare_map_render(task_ids, map_image, config_content, map_name):
+    """
+    Shared stage of an upload: saves the map components and renders the final
+    image once. Returns the rendered artifact reused by every installation.
+    """
+    MOCK_TASKS.update_many(task_ids, {
+        'status': 'PROCESSING',
+        'message': 'Saving uploaded map components...'
+    })
+
+    _simulate_latency(2)
+
+    with metrics.MAP_STAGE_SECONDS.time(stage='save'):
+        saved_paths = save_uploaded_map(map_image, config_content)
+    config_path = saved_paths['config_path']
+
+    final_map_filename = f"{saved_paths['content_key']}.png"
+    final_map_path = os.path.join('static/final_maps', final_map_filename)
+
+    # Identical inputs always render to the same image, so an existing output is reused.
+    if not os.path.exists(final_map_path):
+        MOCK_TASKS.update_many(task_ids, {
             'status': 'PROCESSING',
-            'message': 'Rendering final map image...',
-            'updated_at': datetime.utcnow().isoformat()
+            'message': 'Rendering final map image...'
         })
-        
-        time.sleep(3)
-        
-        config_filename = os.path.basename(config_path)
-        final_map_filename = config_filename.replace('.conf', '.png')
-        final_map_path = os.path.join('static/final_maps', final_map_filename)
+
+        _simulate_latency(3)
 
         map_renderer.render_and_save_map(config_path, final_map_path)
-        
-        MOCK_TASKS[task_id].update({
-            'status': 'SUCCESS',
-            'message': 'Placeholder for final map URL.',
-            'final_map_filename': final_map_filename,
-            'updated_at': datetime.utcnow().isoformat()
+        _record_static_write(final_map_path)
+
+    return {
+        'config_path': config_path,
+        'image_path': saved_paths['image_path'],
+        'image_key': saved_paths['image_key'],
+        'content_key': saved_paths['content_key'],
+        'final_map_path': final_map_path,
+        'final_map_filename': final_map_filename,
+        'map_name': map_name
+    }
+
+# --- Map Delivery ---
+DELIVERER = delivery.Deliverer()
+
+def _installation_address(hostname):
+    for installation in MOCK_CACTI_INSTALLATIONS_DB.values():
+        if installation['hostname'] == hostname:
+            return installation['ip']
+    return hostname
+
+def start_map_delivery(tasks, artifact):
+    """
+    Starts publishing the rendered map to every installation of an upload at
+    once. Returns {task_id: Future}, empty when delivery is off.
+    """
+    if not DELIVERER.enabled:
+        return {}
+    files = delivery.map_files(artifact, artifact['map_name'])
+    MOCK_TASKS.update_many([task['id'] for task in tasks], {
+        'status': 'PROCESSING',
+        'message': 'Delivering map to the Cacti installation...'
+    })
+    return {
+        task['id']: DELIVERER.submit(_installation_address(task['hostname']), files)
+        for task in tasks
+    }
+
+def deliver_map(task, artifact, transfer=None):
+    """Per-installation stage: publishes the shared rendered map for one installation task."""
+    if transfer is not None:
+        # Raises delivery.DeliveryError when the transfer failed.
+        transfer.result()
+    MOCK_TASKS.update(task['id'], {
+        'status': 'SUCCESS',
+        'message': 'Placeholder for final map URL.',
+        'final_map_filename': artifact['final_map_filename']
+    })
+
+def _deliver_to_tasks(tasks, artifact):
+    """Delivers a rendered artifact to every installation task of an upload."""
+    transfers = start_map_delivery(tasks, artifact)
+    for task in tasks:
+        try:
+            deliver_map(task, artifact, transfers.get(task['id']))
+        except Exception as e:
+            print(f"Error delivering map for task {task['id']}: {e}")
+            MOCK_TASKS.update(task['id'], {
+                'status': 'FAILURE',
+                'message': f'An internal error occurred: {e}'
+            })
+
+def process_map_task(tasks, map_image, config_content, map_name, upload_id=None, map_id=None, username=None):
+    """
+    Processes a queued map upload: renders it once, then delivers the result to
+    each installation task of the upload. map_image may be a path or a file object.
+    """
+    profile_run = profiling.start('task', f"{map_name} ({upload_id})", (map_name, upload_id, map_id, username))
+    task_ids = [task['id'] for task in tasks]
+    try:
+        try:
+            artifact = prepare_map_render(task_ids, map_image, config_content, map_name)
+            if map_id:
+                MAP_VERSIONS.add_version(
+                    map_id, map_name, username, artifact['content_key'], artifact['image_key'],
+                    artifact['config_path'], artifact['final_map_filename']
+                )
+        except Exception as e:
+            print(f"Error during map rendering for upload {upload_id}: {e}")
+            MOCK_TASKS.update_many(task_ids, {
+                'status': 'FAILURE',
+                'message': f'An internal error occurred: {e}'
+            })
+            return
+
+        _deliver_to_tasks(tasks, artifact)
+    finally:
+        if upload_id and isinstance(map_image, str):
+            _release_upload(upload_id, map_image)
+        if profile_run is not None:
+            profile_run.stop()
+
+# --- Map Versions ---
+MAP_VERSIONS = map_versions.MapStore(map_versions.MAP_DB_PATH)
+
+def get_map_versions(map_id):
+    return MAP_VERSIONS.list_versions(map_id)
+
+def get_map_owner(map_id):
+    """Returns the username that created map_id, or None for an unknown map."""
+    first_version = MAP_VERSIONS.get_version(map_id, 1)
+    return first_version['username'] if first_version else None
+
+def _patch_latest_version(map_id, base_version, node_changes, link_changes):
+    """
+    Patches the config of the latest version of a map. Returns (base,
+    patched_config, removed_links), or None for an unknown map.
+    """
+    base = MAP_VERSIONS.get_version(map_id)
+    if base is None:
+        return None
+    if base_version is not None and base_version != base['version']:
+        raise map_versions.MapVersionConflictError(
+            f"Map {map_id} is at version {base['version']}, not {base_version}."
+        )
+
+    with open(base['config_path']) as f:
+        patched_config, removed_links = map_versions.patch_config(f.read(), node_changes, link_changes)
+    return base, patched_config, removed_links
+
+def apply_map_diff(map_id, base_version, node_changes, link_changes, username):
+    """
+    Applies node/link deltas to the latest version of a map. The stored config
+    is patched in place of regenerating it, and only the tiles touched by
+    changed links are redrawn on top of the previous render.
+    Returns the new version, or None for an unknown map. Raises
+    map_versions.MapVersionConflictError when base_version is stale, and
+    ValueError for a delta that cannot be applied.
+    """
+    patched = _patch_latest_version(map_id, base_version, node_changes, link_changes)
+    if patched is None:
+        return None
+    base, patched_config, removed_links = patched
+    config_path, content_key = _store_config(base['image_key'], patched_config)
+
+    final_map_filename = f"{content_key}.png"
+    final_map_path = os.path.join('static/final_maps', final_map_filename)
+    if os.path.exists(final_map_path):
+        render = {'mode': 'cached', 'dirty_links': 0, 'dirty_tiles': 0}
+    else:
+        render = map_renderer.render_map_update(
+            base['config_path'], os.path.join('static/final_maps', base['final_map_filename']),
+            config_path, final_map_path
+        )
+        _record_static_write(final_map_path)
+
+    version = MAP_VERSIONS.add_version(
+        map_id, base['map_name'], username, content_key, base['image_key'], config_path,
+        final_map_filename, base_version=base['version']
+    )
+    version['render'] = render
+    version['removed_links'] = removed_links
+    return version
+
+def queue_map_diff(map_id, base_version, node_changes, link_changes, username,
+                   installations=None, cacti_group_id=None):
+    """
+    Checks a map diff against the latest version and queues it for
+    process_map_diff_task. Without installations a single task only records
+    the new version; otherwise there is one task per installation, like an
+    upload. Returns the created tasks, or None for an unknown map. Raises the
+    errors of apply_map_diff for a diff that cannot be applied.
+    """
+    if _patch_latest_version(map_id, base_version, node_changes, link_changes) is None:
+        return None
+    upload_id = str(uuid.uuid4())
+    return _enqueue_map_tasks(upload_id, installations or [{'hostname': None}], username, cacti_group_id, {
+        'kind': 'diff',
+        'upload_id': upload_id,
+        'map_id': map_id,
+        'base_version': base_version,
+        'node_changes': node_changes,
+        'link_changes': link_changes,
+        'username': username
+    })
+
+def process_map_diff_task(tasks, map_id, base_version, node_changes, link_changes, upload_id=None, username=None):
+    """Processes a queued map diff: applies it once, then delivers the new version to each installation task."""
+    profile_run = profiling.start('task', f"{map_id} diff ({upload_id})", (map_id, upload_id, username))
+    task_ids = [task['id'] for task in tasks]
+    try:
+        MOCK_TASKS.update_many(task_ids, {
+            'status': 'PROCESSING',
+            'message': 'Applying map edit...'
         })
+        try:
+            version = apply_map_diff(map_id, base_version, node_changes, link_changes, username)
+            if version is None:
+                raise ValueError(f"Map {map_id} no longer exists.")
+        except Exception as e:
+            print(f"Error applying diff {upload_id} to map {map_id}: {e}")
+            MOCK_TASKS.update_many(task_ids, {
+                'status': 'FAILURE',
+                'message': f'Map edit could not be applied: {e}'
+            })
+            return
+
+        artifact = {
+            'config_path': version['config_path'],
+            'image_path': _stored_background_path(version['image_key']),
+            'image_key': version['image_key'],
+            'content_key': version['content_key'],
+            'final_map_path': os.path.join('static/final_maps', version['final_map_filename']),
+            'final_map_filename': version['final_map_filename'],
+            'map_name': version['map_name']
+        }
+        installation_tasks = [task for task in tasks if task['hostname']]
+        for task in tasks:
+            if not task['hostname']:
+                deliver_map(task, artifact)
+        _deliver_to_tasks(installation_tasks, artifact)
+    finally:
+        if profile_run is not None:
+            profile_run.stop()
+
+def run_map_task(tasks, kind='upload', **payload):
+    """Task queue handler: runs an upload or a map diff."""
+    if kind == 'diff':
+        process_map_diff_task(tasks, **payload)
+    else:
+        process_map_task(tasks, **payload)
+
+# Runs queued map tasks on a bounded pool. Started by app.py in 'inline'
+# mode, or by worker.py in a separate process.
+TASK_EXECUTOR = task_queue.TaskExecutor(MOCK_TASKS, run_map_task)
+
+# --- Metrics ---
+# Read from the task store and the SNMP cache when /metrics is scraped.
+TASK_STATUSES = ('PENDING', 'PROCESSING', 'SUCCESS', 'FAILURE')
+
+def _task_status_counts():
+    counts = dict.fromkeys(TASK_STATUSES, 0)
+    counts.update(MOCK_TASKS.count_by_status())
+    return {(status,): count for status, count in counts.items()}
+
+def _snmp_cache_counts():
+    return {
+        (kind, result): count
+        for kind, counters in SNMP_CACHE.get_stats()['kinds'].items()
+        for result, count in counters.items()
+    }
 
-    except Exception as e:
-        print(f"Error during map processing for task {task_id}: {e}")
-        MOCK_TASKS[task_id].update({
-            'status': 'FAILURE',
-            'message': f'An internal error occurred: {e}',
-            'updated_at': datetime.utcnow().isoformat()
-        })
\ No newline at end of file
+metrics.CallbackMetric('autocacti_tasks', "Stored map tasks, by status.", ('status',), _task_status_counts)
+metrics.CallbackMetric(
+    'autocacti_snmp_cache_requests_total', "SNMP cache lookups, by kind and hits/misses/coalesced.",
+    ('kind', 'result'), _snmp_cache_counts, kind='counter'
+)
@@ -0,0 +1,456 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import metrics
+
+# --- Task Queue Configuration ---
+# The database and spooled uploads live outside 'static/' so they are never served.
+TASK_DATA_DIR = os.environ.get('AUTOCACTI_TASK_DATA_DIR', 'data')
+TASK_DB_PATH = os.path.join(TASK_DATA_DIR, 'tasks.sqlite3')
+UPLOAD_SPOOL_DIR = os.path.join(TASK_DATA_DIR, 'uploads')
+
+# Number of map tasks rendered concurrently per executor process.
+TASK_MAX_WORKERS = int(os.environ.get('AUTOCACTI_TASK_WORKERS', 4))
+# Maximum number of PENDING tasks across all users before uploads are refused (503).
+TASK_MAX_QUEUE_DEPTH = int(os.environ.get('AUTOCACTI_TASK_QUEUE_DEPTH', 200))
+# Maximum number of unfinished tasks a single user may have queued (429).
+TASK_MAX_PENDING_PER_USER = int(os.environ.get('AUTOCACTI_TASK_USER_LIMIT', 32))
+# Executors hold a lease on the tasks they run and renew it every third of
+# this while the tasks run. A PROCESSING task whose lease expired belongs to a
+# crashed worker and is put back in the queue.
+TASK_LEASE_SECONDS = int(os.environ.get('AUTOCACTI_TASK_LEASE_SECONDS', 60))
+# Finished (SUCCESS/FAILURE) tasks are deleted this long after their last update.
+TASK_FINISHED_TTL_SECONDS = int(os.environ.get('AUTOCACTI_TASK_TTL_SECONDS', 7 * 24 * 3600))
+# Upper bound on stored tasks; the oldest finished tasks are deleted beyond it.
+TASK_MAX_STORED = int(os.environ.get('AUTOCACTI_TASK_MAX_STORED', 100_000))
+# How often executors purge expired tasks.
+TASK_PURGE_INTERVAL_SECONDS = 300
+TASK_LIST_MAX_LIMIT = 200
+# 'inline' runs workers inside the web process; 'external' leaves the queue to worker.py.
+TASK_EXECUTION_MODE = os.environ.get('AUTOCACTI_TASK_MODE', 'inline')
+
+
+class QueueFullError(Exception):
+    """Raised when the global task queue cannot accept more work."""
+
+
+class UserQuotaExceededError(Exception):
+    """Raised when a single user already has too many unfinished tasks."""
+
+
+class TaskStore:
+    """
+    SQLite-backed store for map tasks.
+
+    Every process (web server or worker.py) opens the same database file, so
+    task state survives restarts and can be shared between processes. Each
+    thread gets its own connection.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        # Bumped on every write made through this store so that in-process
+        # listeners (task event streams) wake up immediately.
+        self._version = 0
+        self._changed = threading.Condition()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._create_schema()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                upload_id TEXT NOT NULL,
+                username TEXT,
+                hostname TEXT,
+                status TEXT NOT NULL,
+                message TEXT,
+                final_map_filename TEXT,
+                payload TEXT NOT NULL,
+                claimed_by TEXT,
+                lease_expires_at TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks (status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_tasks_username_status ON tasks (username, status);
+            CREATE INDEX IF NOT EXISTS idx_tasks_upload_status ON tasks (upload_id, status);
+        """)
+        self._migrate_schema()
+
+    def _migrate_schema(self):
+        """Adds columns and indexes introduced after the first release to existing databases."""
+        conn = self._connection()
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(tasks)")}
+        if 'cacti_group_id' not in columns:
+            conn.execute("ALTER TABLE tasks ADD COLUMN cacti_group_id INTEGER")
+        conn.executescript("""
+            CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks (created_at, id);
+            CREATE INDEX IF NOT EXISTS idx_tasks_username_created ON tasks (username, created_at, id);
+            CREATE INDEX IF NOT EXISTS idx_tasks_group_created ON tasks (cacti_group_id, created_at, id);
+            CREATE INDEX IF NOT EXISTS idx_tasks_status_updated ON tasks (status, updated_at);
+        """)
+
+    def _notify_changed(self):
+        with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    @property
+    def version(self):
+        return self._version
+
+    def wait_for_change(self, version, timeout):
+        """
+        Blocks until a write newer than version was made through this store
+        or timeout seconds pass, and returns the current version. Writes made
+        by other processes (worker.py) are only seen when the caller re-reads
+        the database after the timeout.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    @staticmethod
+    def _to_public(row):
+        task = {
+            'id': row['id'],
+            'status': row['status'],
+            'message': row['message'],
+            'updated_at': row['updated_at']
+        }
+        if row['final_map_filename']:
+            task['final_map_filename'] = row['final_map_filename']
+        return task
+
+    @classmethod
+    def _to_summary(cls, row):
+        task = cls._to_public(row)
+        task.update({
+            'upload_id': row['upload_id'],
+            'username': row['username'],
+            'hostname': row['hostname'],
+            'cacti_group_id': row['cacti_group_id'],
+            'created_at': row['created_at']
+        })
+        return task
+
+    def enqueue(self, tasks, username, max_queue_depth, max_pending_per_user):
+        """
+        Inserts new PENDING tasks for username after checking the queue limits.
+
+        The limit checks and the insert share one write transaction, so
+        concurrent uploads cannot overshoot them. Each task dict needs id,
+        upload_id, hostname and payload, and may carry cacti_group_id.
+        """
+        now = datetime.utcnow().isoformat()
+        conn = self._connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            unfinished = conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE username = ? AND status IN ('PENDING', 'PROCESSING')",
+                (username,)
+            ).fetchone()[0]
+            if unfinished + len(tasks) > max_pending_per_user:
+                raise UserQuotaExceededError(
+                    f"You already have too many map tasks in progress (limit {max_pending_per_user})."
+                )
+            pending = conn.execute("SELECT COUNT(*) FROM tasks WHERE status = 'PENDING'").fetchone()[0]
+            if pending + len(tasks) > max_queue_depth:
+                raise QueueFullError("The map rendering queue is full. Please try again shortly.")
+
+            conn.executemany(
+                "INSERT INTO tasks (id, upload_id, username, hostname, cacti_group_id, status, message, payload, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'PENDING', 'Map creation task has been queued.', ?, ?, ?)",
+                [(t['id'], t['upload_id'], username, t['hostname'], t.get('cacti_group_id'),
+                  json.dumps(t['payload']), now, now) for t in tasks]
+            )
+        self._notify_changed()
+
+    def get(self, task_id, default=None):
+        row = self._connection().execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._to_public(row) if row else default
+
+    def get_many(self, task_ids):
+        """Returns {task_id: task} for the given IDs; unknown IDs are left out."""
+        task_ids = list(task_ids)
+        found = {}
+        # Stay below SQLite's bound-parameter limit for very large batches.
+        for start in range(0, len(task_ids), 500):
+            chunk = task_ids[start:start + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            for row in self._connection().execute(
+                f"SELECT * FROM tasks WHERE id IN ({placeholders})", chunk
+            ):
+                found[row['id']] = self._to_public(row)
+        return found
+
+    def list_tasks(self, username=None, upload_id=None, cacti_group_id=None, status=None,
+                   limit=50, cursor=None):
+        """
+        Lists tasks newest first, optionally filtered by user, upload batch,
+        Cacti group and status. Pages are keyed on (created_at, id) rather than
+        an offset, so deep pages cost the same as the first one.
+
+        Returns (tasks, next_cursor); next_cursor is None on the last page.
+        """
+        conditions, params = [], []
+        for column, value in (('username', username), ('upload_id', upload_id),
+                              ('cacti_group_id', cacti_group_id), ('status', status)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if cursor:
+            cursor_created_at, _, cursor_id = cursor.partition('|')
+            conditions.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([cursor_created_at, cursor_created_at, cursor_id])
+
+        limit = max(1, min(int(limit), TASK_LIST_MAX_LIMIT))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = self._connection().execute(
+            f"SELECT * FROM tasks {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['created_at']}|{rows[-1]['id']}"
+        return [self._to_summary(row) for row in rows], next_cursor
+
+    def count_by_status(self):
+        """Returns {status: count} over all stored tasks."""
+        return {
+            row['status']: row['count'] for row in self._connection().execute(
+                "SELECT status, COUNT(*) AS count FROM tasks GROUP BY status"
+            )
+        }
+
+    def purge_expired(self, ttl_seconds=TASK_FINISHED_TTL_SECONDS, max_stored=TASK_MAX_STORED):
+        """
+        Deletes finished tasks older than ttl_seconds, then the oldest finished
+        tasks beyond max_stored rows. Unfinished tasks are never deleted.
+        Returns the number of deleted tasks.
+        """
+        cutoff = (datetime.utcnow() - timedelta(seconds=ttl_seconds)).isoformat()
+        conn = self._connection()
+        deleted = conn.execute(
+            "DELETE FROM tasks WHERE status IN ('SUCCESS', 'FAILURE') AND updated_at < ?", (cutoff,)
+        ).rowcount
+
+        excess = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] - max_stored
+        if excess > 0:
+            deleted += conn.execute(
+                "DELETE FROM tasks WHERE id IN ("
+                "SELECT id FROM tasks WHERE status IN ('SUCCESS', 'FAILURE') ORDER BY updated_at LIMIT ?)",
+                (excess,)
+            ).rowcount
+        return deleted
+
+    def update(self, task_id, fields):
+        """Updates status/message/final_map_filename of a task and bumps updated_at."""
+        self.update_many([task_id], fields)
+
+    def update_many(self, task_ids, fields):
+        """Applies the same status/message/final_map_filename update to several tasks."""
+        allowed = {k: v for k, v in fields.items() if k in ('status', 'message', 'final_map_filename')}
+        allowed['updated_at'] = fields.get('updated_at') or datetime.utcnow().isoformat()
+        assignments = ', '.join(f"{column} = ?" for column in allowed)
+        self._connection().executemany(
+            f"UPDATE tasks SET {assignments} WHERE id = ?",
+            [(*allowed.values(), task_id) for task_id in task_ids]
+        )
+        self._notify_changed()
+
+    def is_upload_finished(self, upload_id):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM tasks WHERE upload_id = ? AND status IN ('PENDING', 'PROCESSING')",
+            (upload_id,)
+        ).fetchone()[0] == 0
+
+    def claim_next(self, worker_id, lease_seconds=TASK_LEASE_SECONDS):
+        """
+        Atomically moves the oldest upload with PENDING tasks to PROCESSING for
+        worker_id, leased for lease_seconds. All PENDING tasks of that upload
+        are claimed together, since they share one rendered map.
+
+        Returns {'upload_id', 'tasks': [{'id', 'hostname'}], 'payload',
+        'created_at'} or None when the queue is empty.
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT upload_id, payload, created_at FROM tasks WHERE status = 'PENDING' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            tasks = conn.execute(
+                "SELECT id, hostname FROM tasks WHERE upload_id = ? AND status = 'PENDING' ORDER BY created_at",
+                (row['upload_id'],)
+            ).fetchall()
+            now = datetime.utcnow()
+            conn.execute(
+                "UPDATE tasks SET status = 'PROCESSING', message = 'Task picked up by a worker.', "
+                "claimed_by = ?, lease_expires_at = ?, updated_at = ? WHERE upload_id = ? AND status = 'PENDING'",
+                (worker_id, (now + timedelta(seconds=lease_seconds)).isoformat(), now.isoformat(), row['upload_id'])
+            )
+        self._notify_changed()
+        return {
+            'upload_id': row['upload_id'],
+            'tasks': [{'id': task['id'], 'hostname': task['hostname']} for task in tasks],
+            'payload': json.loads(row['payload']),
+            'created_at': row['created_at']
+        }
+
+    def renew_leases(self, worker_id, lease_seconds=TASK_LEASE_SECONDS):
+        """Extends the lease of every PROCESSING task claimed by worker_id. Returns the count."""
+        return self._connection().execute(
+            "UPDATE tasks SET lease_expires_at = ? WHERE claimed_by = ? AND status = 'PROCESSING'",
+            ((datetime.utcnow() + timedelta(seconds=lease_seconds)).isoformat(), worker_id)
+        ).rowcount
+
+    def requeue_stale(self):
+        """
+        Returns PROCESSING tasks whose lease expired to the queue. Tasks of
+        running workers keep their renewed lease and are left alone. Returns
+        the count.
+        """
+        now = datetime.utcnow().isoformat()
+        cursor = self._connection().execute(
+            "UPDATE tasks SET status = 'PENDING', message = 'Task re-queued after worker interruption.', "
+            "claimed_by = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE status = 'PROCESSING' AND lease_expires_at < ?",
+            (now, now)
+        )
+        if cursor.rowcount:
+            self._notify_changed()
+        return cursor.rowcount
+
+
+class TaskExecutor:
+    """
+    Runs queued uploads from a TaskStore on a bounded thread pool.
+
+    A single dispatcher thread claims PENDING uploads (all tasks of one upload
+    at a time) from the store only when a worker slot is free, so the number
+    of concurrently running jobs never exceeds max_workers no matter how many
+    uploads arrive. The store is the queue, which lets several executor
+    processes share it. The handler is called as handler(tasks, **payload).
+    A heartbeat thread keeps the leases of running tasks fresh, so only tasks
+    of executors that stopped renewing are ever re-queued.
+    """
+
+    def __init__(self, store, handler, max_workers=TASK_MAX_WORKERS, poll_interval=1.0):
+        self.store = store
+        self.handler = handler
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='map-task')
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._heartbeat_thread = None
+
+    def start(self):
+        if self._thread is None:
+            self.store.requeue_stale()
+            self.store.purge_expired()
+            self._start_heartbeat()
+            self._thread = threading.Thread(target=self._dispatch_loop, name='map-task-dispatcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._pool.shutdown(wait=wait)
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+
+    def notify(self):
+        """Wakes the dispatcher after new tasks were queued."""
+        self._wakeup.set()
+
+    def run_forever(self):
+        """Runs the dispatcher in the calling thread (used by worker.py)."""
+        self.store.requeue_stale()
+        self.store.purge_expired()
+        self._start_heartbeat()
+        self._dispatch_loop()
+
+    def _start_heartbeat(self):
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name='map-task-heartbeat', daemon=True)
+        self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        """
+        Renews the leases of this executor's running tasks and re-queues tasks
+        of crashed workers. Runs apart from the dispatcher, which blocks while
+        every slot is busy.
+        """
+        while not self._stopped.wait(TASK_LEASE_SECONDS / 3):
+            try:
+                self.store.renew_leases(self.worker_id)
+                if self.store.requeue_stale():
+                    self.notify()
+            except sqlite3.Error as e:
+                print(f"Task heartbeat could not renew leases: {e}")
+
+    def _dispatch_loop(self):
+        last_purge = datetime.utcnow()
+        while not self._stopped.is_set():
+            if (datetime.utcnow() - last_purge).total_seconds() > TASK_PURGE_INTERVAL_SECONDS:
+                try:
+                    self.store.purge_expired()
+                except sqlite3.Error as e:
+                    print(f"Task dispatcher could not purge expired tasks: {e}")
+                last_purge = datetime.utcnow()
+
+            self._slots.acquire()
+            claimed = None
+            try:
+                claimed = self.store.claim_next(self.worker_id)
+            except sqlite3.Error as e:
+                print(f"Task dispatcher could not claim a task: {e}")
+            if claimed is None:
+                self._slots.release()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._pool.submit(self._run, claimed)
+
+    def _run(self, claimed):
+        queued_for = datetime.utcnow() - datetime.fromisoformat(claimed['created_at'])
+        metrics.MAP_STAGE_SECONDS.observe(queued_for.total_seconds(), stage='queue')
+        try:
+            self.handler(claimed['tasks'], **claimed['payload'])
+        except Exception as e:
+            print(f"Unhandled error in upload {claimed['upload_id']}: {e}")
+            for task in claimed['tasks']:
+                self.store.update(task['id'], {'status': 'FAILURE', 'message': f'An internal error occurred: {e}'})
+        finally:
+            self._slots.release()
+
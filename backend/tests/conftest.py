@@ -0,0 +1,23 @@
+"""
+Shared test setup.
+
+The backend modules create 'data/' and 'static/' relative to the working
+directory when imported, so the tests run from a scratch directory with
+simulated SNMP latency turned off.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('AUTOCACTI_LATENCY_SCALE', '0')
+os.environ.setdefault('AUTOCACTI_TASK_MODE', 'worker')
+os.environ.setdefault('AUTOCACTI_DELIVERY', 'off')
+SCRATCH_DIR = tempfile.mkdtemp(prefix='autocacti-tests-')
+os.chdir(SCRATCH_DIR)
+atexit.register(shutil.rmtree, SCRATCH_DIR, ignore_errors=True)
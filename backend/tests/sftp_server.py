@@ -0,0 +1,117 @@
+"""
+A paramiko SSH server with an SFTP subsystem rooted at a local directory,
+standing in for a Cacti installation in delivery tests.
+"""
+import os
+import socket
+import threading
+
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface
+
+
+class _Server(paramiko.ServerInterface):
+    def __init__(self, client_key):
+        self.client_key = client_key
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_auth_publickey(self, username, key):
+        if key.get_base64() == self.client_key.get_base64():
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class _Handle(SFTPHandle):
+    def stat(self):
+        return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+def _sftp_interface(root):
+    class RootedSFTPServer(SFTPServerInterface):
+        def _path(self, path):
+            return os.path.join(root, path.lstrip('/'))
+
+        def open(self, path, flags, attr):
+            try:
+                fd = os.open(self._path(path), flags, 0o644)
+            except OSError as e:
+                return SFTPServer.convert_errno(e.errno)
+            mode = 'wb' if flags & os.O_WRONLY else ('r+b' if flags & os.O_RDWR else 'rb')
+            handle = _Handle(flags)
+            handle.readfile = handle.writefile = os.fdopen(fd, mode)
+            return handle
+
+        def stat(self, path):
+            try:
+                return SFTPAttributes.from_stat(os.stat(self._path(path)))
+            except OSError as e:
+                return SFTPServer.convert_errno(e.errno)
+
+        lstat = stat
+
+        def mkdir(self, path, attr):
+            try:
+                os.mkdir(self._path(path))
+            except OSError as e:
+                return SFTPServer.convert_errno(e.errno)
+            return paramiko.SFTP_OK
+
+        def remove(self, path):
+            try:
+                os.remove(self._path(path))
+            except OSError as e:
+                return SFTPServer.convert_errno(e.errno)
+            return paramiko.SFTP_OK
+
+        def posix_rename(self, oldpath, newpath):
+            try:
+                os.replace(self._path(oldpath), self._path(newpath))
+            except OSError as e:
+                return SFTPServer.convert_errno(e.errno)
+            return paramiko.SFTP_OK
+
+        rename = posix_rename
+
+    return RootedSFTPServer
+
+
+class SftpStandIn:
+    """
+    Serves SFTP on 127.0.0.1:<port> from root, accepting only client_key.
+    Counts the SSH connections it accepted.
+    """
+
+    def __init__(self, root, client_key):
+        self.root = root
+        self.client_key = client_key
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.connections = 0
+        self._transports = []
+        self._socket = socket.socket()
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen(16)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept, name='sftp-stand-in', daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return  # Closed.
+            self.connections += 1
+            transport = paramiko.Transport(connection)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', SFTPServer, _sftp_interface(self.root))
+            transport.start_server(server=_Server(self.client_key))
+            self._transports.append(transport)
+
+    def close(self):
+        self._socket.close()
+        for transport in self._transports:
+            transport.close()
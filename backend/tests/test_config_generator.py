@@ -0,0 +1,115 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+import config_generator
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'frontend')
+GENERATOR_JS = os.path.join(FRONTEND_DIR, 'src', 'services', 'configGenerator.js')
+CONSTANTS_JS = os.path.join(FRONTEND_DIR, 'src', 'config', 'constants.js')
+CONSTANTS_IMPORT = "import { NODE_WIDTH, NODE_HEIGHT } from '../config/constants';"
+
+
+def _node(ip, x, y, hostname=None):
+    return {'id': ip, 'type': 'custom', 'position': {'x': x, 'y': y},
+            'data': {'hostname': hostname or f'host-{ip}', 'ip': ip}}
+
+
+def _edge(source, target, interface=None, bandwidth=None):
+    data = {}
+    if interface:
+        data['interface'] = interface
+    if bandwidth:
+        data['bandwidth'] = bandwidth
+    return {'source': source, 'target': target, 'data': data}
+
+
+PARITY_CASES = {
+    'parallel links and both directions': (
+        [_node('10.0.0.1', 0, 0), _node('10.0.0.2', 333.3, 101.7), _node('10.0.0.3', -80, 450)],
+        [_edge('10.0.0.1', '10.0.0.2', 'Gi0/1', '10G'), _edge('10.0.0.1', '10.0.0.2', 'Gi0/2', '10G'),
+         _edge('10.0.0.2', '10.0.0.1', 'Gi1/1', '10G'), _edge('10.0.0.3', '10.0.0.2', 'Te1/0/1'),
+         _edge('10.0.0.2', '10.0.0.3'), _edge('10.0.0.2', '10.0.0.3')],
+        0.75,
+    ),
+    'groups, dangling edges and stacked nodes': (
+        [_node('10.0.0.1', 10, 10), _node('10.0.0.2', 10, 10), _node('10.0.0.4', 500, 10),
+         {'id': 'group-1', 'type': 'group', 'position': {'x': 0, 'y': 0}, 'data': {}}],
+        [_edge('10.0.0.1', '10.0.0.2', 'Gi0/1'), _edge('10.0.0.1', 'group-1'), _edge('10.0.0.9', '10.0.0.1'),
+         _edge('10.0.0.4', '10.0.0.1', 'Gi0/3', '100M')],
+        1,
+    ),
+    # Parallel links 7.5px off the center line land on halves, some negative.
+    'half-pixel rounding': (
+        [_node('10.0.0.1', 0, 0), _node('10.0.0.2', 0, 300), _node('10.0.0.3', -150, -200),
+         _node('10.0.0.4', 200, -200)],
+        [_edge('10.0.0.1', '10.0.0.2'), _edge('10.0.0.1', '10.0.0.2'), _edge('10.0.0.3', '10.0.0.4'),
+         _edge('10.0.0.3', '10.0.0.4')],
+        1,
+    ),
+    'devices without a hostname or IP': (
+        [{'id': '10.0.0.1', 'type': 'custom', 'position': {'x': 0, 'y': 0}, 'data': {'ip': '10.0.0.1'}},
+         {'id': '10.0.0.2', 'type': 'custom', 'position': {'x': 300, 'y': 0}, 'data': {'hostname': None}},
+         _node('10.0.0.3', 0, 300)],
+        [_edge('10.0.0.1', '10.0.0.3', 'Gi0/1'), _edge('10.0.0.2', '10.0.0.3', 'Gi0/2')],
+        1,
+    ),
+}
+
+
+def _frontend_node_size():
+    with open(CONSTANTS_JS) as f:
+        constants = f.read()
+    return {name: int(re.search(rf'export const {name} = (\d+);', constants).group(1))
+            for name in ('NODE_WIDTH', 'NODE_HEIGHT')}
+
+
+def _run_frontend_generator(tmp_path, params):
+    with open(GENERATOR_JS) as f:
+        source = f.read()
+    assert CONSTANTS_IMPORT in source
+    constants = _frontend_node_size()
+    source = source.replace(CONSTANTS_IMPORT, ''.join(
+        f"const {name} = {value};\n" for name, value in constants.items()
+    ))
+    module_path = tmp_path / 'configGenerator.mjs'
+    module_path.write_text(source)
+    script = (
+        f"import {{ generateCactiConfig }} from {json.dumps(str(module_path))};\n"
+        "let input = '';\n"
+        "process.stdin.on('data', (chunk) => { input += chunk; });\n"
+        "process.stdin.on('end', () => process.stdout.write(generateCactiConfig(JSON.parse(input))));\n"
+    )
+    result = subprocess.run(['node', '--input-type=module', '-e', script], input=json.dumps(params),
+                            capture_output=True, text=True, timeout=30, check=True)
+    return result.stdout
+
+
+def test_geometry_constants_match_the_frontend():
+    assert _frontend_node_size() == {'NODE_WIDTH': config_generator.NODE_WIDTH,
+                                'NODE_HEIGHT': config_generator.NODE_HEIGHT}
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="node is not installed")
+@pytest.mark.parametrize('case', sorted(PARITY_CASES))
+def test_config_matches_the_frontend_generator(tmp_path, case):
+    nodes, edges, scale_factor = PARITY_CASES[case]
+    params = {'nodes': nodes, 'edges': edges, 'mapName': 'site-a', 'mapWidth': 1920, 'mapHeight': 1080.5,
+              'scaleFactor': scale_factor, 'configTemplate': config_generator.CONFIG_TEMPLATE}
+
+    expected = _run_frontend_generator(tmp_path, params)
+
+    assert config_generator.generate_config(nodes, edges, 'site-a', 1920, 1080.5, scale_factor) == expected
+    assert 'LINK node00001-node00002' in expected
+
+
+def test_streamed_chunks_join_to_the_whole_config():
+    nodes, edges, scale_factor = PARITY_CASES['parallel links and both directions']
+    chunks = list(config_generator.iter_config(nodes, edges, 'site-a', 1920, 1080, scale_factor))
+
+    assert len(chunks) > 1
+    assert ''.join(chunks) == config_generator.generate_config(nodes, edges, 'site-a', 1920, 1080, scale_factor)
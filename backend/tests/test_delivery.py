@@ -0,0 +1,92 @@
+import os
+
+import paramiko
+import pytest
+
+import delivery
+from tests.sftp_server import SftpStandIn
+
+
+@pytest.fixture(scope='module')
+def client_key_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('keys') / 'id_rsa')
+    paramiko.RSAKey.generate(2048).write_private_key_file(path)
+    return path
+
+
+@pytest.fixture
+def sftp_server(tmp_path, client_key_path):
+    root = tmp_path / 'installation'
+    root.mkdir()
+    server = SftpStandIn(str(root), paramiko.RSAKey.from_private_key_file(client_key_path))
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def artifact(tmp_path):
+    paths = {}
+    for name, content in (('image', b'png bytes'), ('config', b'BACKGROUND ../maps/k.png\n'), ('render', b'map')):
+        paths[name] = str(tmp_path / name)
+        with open(paths[name], 'wb') as f:
+            f.write(content)
+    return {'image_path': paths['image'], 'image_key': 'image-key', 'config_path': paths['config'],
+            'content_key': 'content-key', 'final_map_path': paths['render']}
+
+
+def _sftp_deliverer(server, key_path):
+    deliverer = delivery.Deliverer('ssh', max_workers=2)
+    deliverer.pool = delivery.ConnectionPool(
+        lambda host: delivery.SftpTransport(host, port=server.port, key_path=key_path)
+    )
+    return deliverer
+
+
+def test_publishes_over_sftp_and_skips_unchanged_files(monkeypatch, sftp_server, client_key_path, artifact):
+    monkeypatch.setattr(delivery, 'DELIVERY_SSH_TRUST_NEW', True)
+    deliverer = _sftp_deliverer(sftp_server, client_key_path)
+    files = delivery.map_files(artifact, 'Core map/1')
+
+    assert deliverer.submit('127.0.0.1', files).result() == (3, 0)
+    assert deliverer.deliver('127.0.0.1', files) == (0, 3)
+
+    remote_root = os.path.join(sftp_server.root, delivery.DELIVERY_REMOTE_ROOT.lstrip('/'))
+    with open(os.path.join(remote_root, 'output', 'Core_map_1.png'), 'rb') as f:
+        assert f.read() == b'map'
+    with open(os.path.join(remote_root, 'configs', 'Core_map_1.conf.sha256')) as f:
+        assert f.read().strip() == 'content-key'
+    assert not [name for _, _, names in os.walk(remote_root) for name in names if name.endswith('.tmp')]
+    # The second delivery reused the pooled connection.
+    assert sftp_server.connections == 1
+
+
+def test_unknown_host_key_is_rejected(monkeypatch, sftp_server, client_key_path, artifact, tmp_path):
+    monkeypatch.setattr(delivery, 'DELIVERY_SSH_TRUST_NEW', False)
+    known_hosts = tmp_path / 'known_hosts'
+    known_hosts.write_text('')
+    monkeypatch.setattr(delivery, 'DELIVERY_SSH_KNOWN_HOSTS', str(known_hosts))
+    deliverer = _sftp_deliverer(sftp_server, client_key_path)
+
+    with pytest.raises(delivery.DeliveryError, match='Could not connect'):
+        deliverer.deliver('127.0.0.1', delivery.map_files(artifact, 'map'))
+
+
+def test_failed_transfer_drops_the_connection(monkeypatch, sftp_server, client_key_path, artifact):
+    monkeypatch.setattr(delivery, 'DELIVERY_SSH_TRUST_NEW', True)
+    deliverer = _sftp_deliverer(sftp_server, client_key_path)
+    files = delivery.map_files(dict(artifact, image_path='/does/not/exist'), 'map')
+
+    with pytest.raises(delivery.DeliveryError, match='failed'):
+        deliverer.deliver('127.0.0.1', files)
+    assert deliverer.deliver('127.0.0.1', delivery.map_files(artifact, 'map')) == (3, 0)
+    assert sftp_server.connections == 2
+
+
+def test_thread_pool_is_created_on_first_submit(tmp_path, artifact, monkeypatch):
+    monkeypatch.setattr(delivery, 'DELIVERY_LOCAL_ROOT', str(tmp_path / 'delivery'))
+    deliverer = delivery.Deliverer('local')
+    assert deliverer._executor is None
+
+    assert deliverer.submit('10.0.0.1', delivery.map_files(artifact, 'map')).result() == (3, 0)
+    assert deliverer._executor is not None
+    assert delivery.Deliverer('off')._executor is None
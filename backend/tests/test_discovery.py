@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import services
+
+SEED_IP = '10.10.1.3'
+
+
+def _assert_edges_end_at_nodes(topology):
+    node_ids = {node['ip'] or node['hostname'] for node in topology['nodes']}
+    for edge in topology['edges']:
+        assert edge['source'] in node_ids
+        assert edge['target'] in node_ids
+
+
+def test_crawl_reports_every_edge_endpoint():
+    topology = services.discover_topology(SEED_IP, max_depth=2)
+
+    assert topology['seed'] == SEED_IP
+    assert not topology['truncated']
+    assert {edge['source'] for edge in topology['edges']} >= {SEED_IP}
+    _assert_edges_end_at_nodes(topology)
+
+
+def test_device_budget_keeps_edges_connected():
+    topology = services.discover_topology(SEED_IP, max_depth=3, max_devices=3)
+
+    assert topology['truncated']
+    truncated = [node for node in topology['nodes'] if node.get('truncated')]
+    assert truncated
+    assert all(node['type'] == 'Unknown' for node in truncated)
+    queried = [node for node in topology['nodes'] if node['ip'] and not node.get('truncated')]
+    assert len(queried) <= 3
+    _assert_edges_end_at_nodes(topology)
+
+
+def test_depth_limit_stops_expansion():
+    topology = services.discover_topology(SEED_IP, max_depth=1)
+
+    assert {edge['source'] for edge in topology['edges']} == {SEED_IP}
+    assert max(node['depth'] for node in topology['nodes']) == 1
+
+
+def test_sparse_neighbor_entries_still_become_edges(monkeypatch):
+    seed = '10.200.0.1'
+    monkeypatch.setattr(services, 'get_device_info', lambda ip: {'ip': ip, 'hostname': ip, 'type': 'Router'})
+    monkeypatch.setattr(services, 'get_device_neighbors', lambda ip: {'neighbors': [
+        {'ip': '10.200.0.2'}, {'hostname': 'phone'}, {'description': 'neither IP nor hostname'}
+    ]} if ip == seed else None)
+
+    topology = services.discover_topology(seed, max_depth=1)
+
+    assert sorted(edge['target'] for edge in topology['edges']) == ['10.200.0.2', 'phone']
+    assert {edge['interface'] for edge in topology['edges']} == {''}
+    _assert_edges_end_at_nodes(topology)
+
+
+def test_concurrent_batches_share_one_lookup_pool():
+    lock = threading.Lock()
+    running = peak = 0
+
+    def lookup(ip):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.01)
+        with lock:
+            running -= 1
+
+    ips = [f'10.250.0.{i}' for i in range(40)]
+    with ThreadPoolExecutor(max_workers=3) as callers:
+        list(callers.map(lambda _: services._lookup_batch(lookup, 'info', ips, "Device not found"), range(3)))
+
+    assert peak <= services.DISCOVERY_MAX_WORKERS
@@ -0,0 +1,41 @@
+import itertools
+
+import layout
+
+
+def _nodes(routers, switches):
+    return ([{'id': f'r{i}', 'type': 'Router'} for i in range(routers)] +
+            [{'id': f's{i}', 'type': 'Switch'} for i in range(switches)])
+
+
+def _overlapping(positions):
+    spacing = layout.NODE_WIDTH + layout.MIN_NODE_SPACING
+    return [(a, b) for a, b in itertools.combinations(positions.values(), 2)
+            if abs(a['x'] - b['x']) < spacing and abs(a['y'] - b['y']) < spacing]
+
+
+def test_wide_tier_wraps_and_grows_the_canvas():
+    positions, height = layout.compute_layout(_nodes(2, 200), [], 1920, 1080)
+
+    capacity = layout.row_capacity(1920)
+    assert height == layout.rows_height(1 + -(-200 // capacity))
+    assert height > 1080
+    assert not _overlapping(positions)
+    assert all(0 <= p['x'] <= 1920 - layout.NODE_WIDTH for p in positions.values())
+    assert all(0 <= p['y'] <= height - layout.NODE_HEIGHT for p in positions.values())
+    # Routers stay above every switch row.
+    assert max(positions[f'r{i}']['y'] for i in range(2)) < min(positions[f's{i}']['y'] for i in range(200))
+
+
+def test_small_layout_keeps_the_requested_size():
+    positions, height = layout.compute_layout(_nodes(2, 5), [{'source': 'r0', 'target': 's0'}], 1920, 1080)
+
+    assert height == 1080
+    assert len(positions) == 7
+
+
+def test_force_layout_uses_the_grown_canvas():
+    positions, height = layout.compute_layout(_nodes(2, 200), [], 1920, 1080, mode='force', iterations=5)
+
+    assert height > 1080
+    assert all(p['y'] <= height - layout.NODE_HEIGHT for p in positions.values())
@@ -0,0 +1,248 @@
+import os
+
+import pytest
+from PIL import Image
+
+import config_generator
+import map_renderer
+
+# A 4000x3000 background is 48 MB as RGBA; 4 MB renders it reduced by 4.
+MAX_RENDER_BYTES = 4 * 1024 * 1024
+BACKGROUND_SIZE = (4000, 3000)
+
+
+@pytest.fixture
+def opened_images(monkeypatch):
+    """Records every image map_renderer opens, to measure what it decodes."""
+    opened = []
+    original_open = map_renderer.Image.open
+
+    def recording_open(*args, **kwargs):
+        image = original_open(*args, **kwargs)
+        opened.append(image)
+        return image
+
+    monkeypatch.setattr(map_renderer.Image, 'open', recording_open)
+    return opened
+
+
+def _largest_decode(opened):
+    # draft() shrinks an opened JPEG's size to what its decoder produces.
+    return max(image.width * image.height for image in opened)
+
+
+def _write_background(tmp_path, name, image_format):
+    path = str(tmp_path / name)
+    Image.new('RGB', BACKGROUND_SIZE, (40, 90, 160)).save(path, image_format)
+    return path
+
+
+def test_jpeg_background_is_reduced_while_decoding(tmp_path, opened_images):
+    path = _write_background(tmp_path, 'background.jpg', 'JPEG')
+
+    image, scale = map_renderer._decode_background(path, MAX_RENDER_BYTES)
+
+    assert image.width * image.height * 4 <= MAX_RENDER_BYTES
+    assert scale == (4.0, 4.0)
+    assert _largest_decode(opened_images) <= image.width * image.height
+
+
+def test_png_background_decodes_pre_reduced_copy(tmp_path, opened_images):
+    path = _write_background(tmp_path, 'background.png', 'PNG')
+    reduced_path = map_renderer.store_reduced_background(path, MAX_RENDER_BYTES)
+    assert reduced_path == map_renderer.reduced_background_path(path, 4)
+    opened_images.clear()
+
+    image, scale = map_renderer._decode_background(path, MAX_RENDER_BYTES)
+
+    assert image.size == (1000, 750)
+    assert scale == (4.0, 4.0)
+    # Only the header of the full-size PNG is read; the reduced copy is decoded.
+    decoded = [image for image in opened_images if image.filename != path]
+    assert [image.size for image in decoded] == [(1000, 750)]
+
+
+def test_pre_reduced_copy_matches_reducing_at_render_time(tmp_path):
+    path = _write_background(tmp_path, 'background.png', 'PNG')
+    expected, _ = map_renderer._decode_background(path, MAX_RENDER_BYTES)
+
+    map_renderer.store_reduced_background(path, MAX_RENDER_BYTES)
+    image, _ = map_renderer._decode_background(path, MAX_RENDER_BYTES)
+
+    assert image.tobytes() == expected.tobytes()
+
+
+def test_small_and_jpeg_backgrounds_get_no_reduced_copy(tmp_path):
+    jpeg_path = _write_background(tmp_path, 'background.jpg', 'JPEG')
+    small_path = str(tmp_path / 'small.png')
+    Image.new('RGB', (100, 100)).save(small_path)
+
+    assert map_renderer.store_reduced_background(jpeg_path, MAX_RENDER_BYTES) is None
+    assert map_renderer.store_reduced_background(small_path, MAX_RENDER_BYTES) is None
+
+
+def test_estimate_counts_the_decode_buffer(tmp_path):
+    path = _write_background(tmp_path, 'background.png', 'PNG')
+    config_path = str(tmp_path / 'map.conf')
+    with open(config_path, 'w') as f:
+        f.write(f"BACKGROUND {os.path.basename(path)}\n")
+    canvas_bytes = 2 * 1000 * 750 * 4
+
+    full_decode = map_renderer.estimate_render_bytes(config_path, MAX_RENDER_BYTES)
+    map_renderer.store_reduced_background(path, MAX_RENDER_BYTES)
+    reduced_decode = map_renderer.estimate_render_bytes(config_path, MAX_RENDER_BYTES)
+
+    assert full_decode == canvas_bytes + 4000 * 3000 * 3 + 1000 * 750 * 3
+    assert reduced_decode == canvas_bytes + 1000 * 750 * 3
+
+
+LINK_CONFIG = """BACKGROUND background.png
+NODE a
+\tPOSITION 20 20
+NODE b
+\tPOSITION 180 100
+LINK a-b
+\tNODES a b
+\tUSESCALE {usescale}
+"""
+
+
+ROUND_TRIP_NODES = [
+    {'id': '10.0.0.1', 'position': {'x': 0, 'y': 0}, 'data': {'hostname': 'core', 'ip': '10.0.0.1'}},
+    {'id': '10.0.0.2', 'position': {'x': 400, 'y': 300}, 'data': {'hostname': 'edge', 'ip': '10.0.0.2'}},
+]
+ROUND_TRIP_EDGES = [
+    {'source': '10.0.0.1', 'target': '10.0.0.2', 'data': {'interface': 'Gi0/1', 'bandwidth': '10G'}},
+    {'source': '10.0.0.1', 'target': '10.0.0.2', 'data': {'interface': 'Gi0/2', 'bandwidth': '1G'}},
+]
+
+
+def test_generated_config_parses_back_to_its_input():
+    config = config_generator.generate_config(ROUND_TRIP_NODES, ROUND_TRIP_EDGES, 'campus', 1200, 900)
+
+    data = map_renderer.parse_config(config)
+
+    assert data['background'] == 'images/backgrounds/campus.png'
+    assert (data['globals']['WIDTH'], data['globals']['HEIGHT']) == ('1200', '900')
+    assert len(data['globals']['SCALE']) == 9
+    assert data['templates']['LINK'] == {'WIDTH': '3', 'BWLABEL': 'bits', 'BANDWIDTH': '10000M'}
+    expected_nodes = {}
+    for node_pair, _ in config_generator.iter_config_entries(ROUND_TRIP_NODES, ROUND_TRIP_EDGES):
+        for node in node_pair:
+            header, position = node.split('\n')
+            x, y = position.split()[1:]
+            expected_nodes[header.split()[1]] = (int(x), int(y))
+    assert {node_id: (node['x'], node['y']) for node_id, node in data['nodes'].items()} == expected_nodes
+    assert [(link['node1'], link['node2'], link['bandwidth']) for link in data['links']] == [
+        ('node00001', 'node00002', '10G'), ('node00003', 'node00004', '1G')
+    ]
+    assert data['links'][0]['keywords']['DEVICE'] == 'core 10.0.0.1'
+    assert data['links'][1]['keywords']['INTERFACE'] == 'Gi0/2'
+
+
+HAND_WRITTEN_CONFIG = """# A hand-written map
+BACKGROUND images/site.png
+SCALE DEFAULT 0 50 0 255 0
+SCALE DEFAULT 50 100 255 0 0
+SET key_hidezero_DEFAULT 1
+
+NODE DEFAULT
+\tLABELFONT 2
+
+NODE hub
+\tPOSITION 100 200
+NODE spoke
+\tPOSITION hub 50 -20
+# a comment between blocks
+NODE leaf
+\tPOSITION spoke 10 10
+
+link hub-leaf
+\tNODES hub:NE leaf:10:-5
+\tVIA 120 210
+\tVIA 140 230
+\tTARGET rrd1.rrd:in:out rrd2.rrd
+\tWIDTH 4
+"""
+
+
+def test_parse_config_resolves_hand_written_blocks():
+    data = map_renderer.parse_config(HAND_WRITTEN_CONFIG)
+
+    assert data['globals']['SET'] == ['key_hidezero_DEFAULT 1']
+    assert data['templates']['NODE'] == {'LABELFONT': '2'}
+    assert [(node_id, node['x'], node['y']) for node_id, node in data['nodes'].items()] == [
+        ('hub', 100, 200), ('spoke', 150, 180), ('leaf', 160, 190)
+    ]
+    [link] = data['links']
+    assert (link['node1'], link.get('offset1'), link['node2'], link['offset2']) == ('hub', 'NE', 'leaf', '10:-5')
+    assert link['via'] == [(120, 210), (140, 230)]
+    assert link['targets'] == ['rrd1.rrd:in:out', 'rrd2.rrd']
+    assert link['width'] == '4'
+
+
+def test_parse_config_gives_the_same_model_for_text_files_and_lines(tmp_path):
+    config_path = tmp_path / 'map.conf'
+    config_path.write_bytes(HAND_WRITTEN_CONFIG.replace('\n', '\r\n').encode())
+    expected = map_renderer.parse_config(HAND_WRITTEN_CONFIG)
+
+    with open(config_path) as f:
+        assert map_renderer.parse_config(f) == expected
+    assert map_renderer.parse_config(HAND_WRITTEN_CONFIG.splitlines(keepends=True)) == expected
+    assert map_renderer.load_parsed_config(str(config_path)) == expected
+
+
+def test_empty_usescale_falls_back_to_default_scale(tmp_path):
+    Image.new('RGB', (200, 120), 'white').save(str(tmp_path / 'background.png'))
+    for usescale in ('', 'DEFAULT'):
+        config_path = str(tmp_path / f'map-{usescale or "empty"}.conf')
+        with open(config_path, 'w') as f:
+            f.write(LINK_CONFIG.format(usescale=usescale))
+
+        image = map_renderer.render_map_from_config(config_path)
+
+        assert image.size == (200, 120)
+        assert image.getpixel((100, 60)) != (255, 255, 255, 255)
+
+
+@pytest.mark.parametrize('supersample', [1, 2])
+def test_later_links_are_drawn_over_earlier_ones(supersample):
+    # A small square drawn after a large one keeps its fill and its outline.
+    image = Image.new('RGBA', (64, 64), 'white')
+    shapes = [((255, 0, 0, 255), [(8, 8), (56, 8), (56, 56), (8, 56)]),
+              ((0, 0, 255, 255), [(24, 24), (40, 24), (40, 40), (24, 40)])]
+
+    map_renderer._draw_link_shapes(image, shapes, supersample=supersample, tile_size=32)
+
+    assert image.getpixel((32, 32)) == (0, 0, 255, 255)
+    assert image.getpixel((16, 32)) == (255, 0, 0, 255)
+    assert min(sum(image.getpixel((x, 32))[:3]) for x in (23, 24, 25)) < 200
+
+
+def test_render_cache_lookups_are_exported_as_metrics(tmp_path):
+    import metrics
+    config_path = str(tmp_path / 'map.conf')
+    with open(config_path, 'w') as f:
+        f.write(LINK_CONFIG.format(usescale='DEFAULT'))
+    before = map_renderer.PARSED_CONFIG_CACHE.get_stats()
+
+    map_renderer.load_parsed_config(config_path)
+    map_renderer.load_parsed_config(config_path)
+
+    exported = metrics.REGISTRY.render()
+    hits = before['hits'] + 1
+    misses = before['misses'] + 1
+    assert f'autocacti_render_cache_requests_total{{cache="parsed_config",result="hits"}} {hits}' in exported
+    assert f'autocacti_render_cache_requests_total{{cache="parsed_config",result="misses"}} {misses}' in exported
+    assert 'autocacti_render_cache_bytes{cache="parsed_config"}' in exported
+
+
+def test_2000_link_map_renders_well_under_a_second(tmp_path):
+    from benchmarks import run, synthetic
+    config_path, _ = synthetic.write_map_files(str(tmp_path), 2000, 1024, 768)
+    # Warm the parsed-config and background caches, as on a re-render.
+    map_renderer.render_map_from_config(config_path)
+
+    runs = run._timed(lambda: map_renderer.render_map_from_config(config_path), 3)
+
+    assert sorted(runs)[1] < 1.0
@@ -0,0 +1,107 @@
+import pytest
+
+import map_renderer
+import map_versions
+
+CONFIG = """WIDTH 800
+HEIGHT 600
+
+# regular NODEs:
+NODE a
+\tPOSITION 10 20
+\tLABEL Core
+
+NODE b
+\tPOSITION 300 20
+
+NODE c
+\tPOSITION 300 200
+
+# regular LINKs:
+LINK a-b
+\tNODES a b
+\tBANDWIDTH 1G
+# keep me
+\tWIDTH 4
+
+LINK b-c
+\tNODES b c
+\tBANDWIDTH 10G
+
+# That's All Folks!"""
+
+
+def test_no_changes_keep_the_exact_text():
+    assert map_versions.patch_config(CONFIG) == (CONFIG, [])
+
+
+def test_moved_and_updated_blocks_parse_back():
+    patched, removed = map_versions.patch_config(
+        CONFIG,
+        node_changes={'b': {'x': 350.4, 'y': 40.6, 'keywords': {'label': 'Edge'}}},
+        link_changes={'a-b': {'keywords': {'BANDWIDTH': '10G', 'WIDTH': None}}}
+    )
+
+    data = map_renderer.parse_config(patched)
+    assert removed == []
+    assert (data['nodes']['b']['x'], data['nodes']['b']['y']) == (350, 41)
+    assert data['nodes']['b']['keywords']['LABEL'] == 'Edge'
+    assert data['links'][0]['bandwidth'] == '10G'
+    assert 'WIDTH' not in data['links'][0]['keywords']
+    assert '# keep me' in patched
+    # Untouched blocks keep their text.
+    assert 'NODE a\n\tPOSITION 10 20\n\tLABEL Core\n' in patched
+    assert 'LINK b-c\n\tNODES b c\n\tBANDWIDTH 10G\n' in patched
+    assert patched.endswith("# That's All Folks!")
+
+
+def test_new_blocks_are_added_after_their_kind():
+    patched, _ = map_versions.patch_config(
+        CONFIG,
+        node_changes={'d': {'x': 500, 'y': 500}},
+        link_changes={'c-d': {'nodes': ['c', 'd'], 'keywords': {'BANDWIDTH': '1G'}}}
+    )
+
+    data = map_renderer.parse_config(patched)
+    assert list(data['nodes']) == ['a', 'b', 'c', 'd']
+    assert [link['id'] for link in data['links']] == ['a-b', 'b-c', 'c-d']
+    assert patched.index('NODE d') < patched.index('# regular LINKs:')
+    assert patched.index('LINK c-d') < patched.index("# That's All Folks!")
+
+
+def test_deleting_a_node_removes_its_links():
+    patched, removed = map_versions.patch_config(CONFIG, node_changes={'c': None})
+
+    data = map_renderer.parse_config(patched)
+    assert removed == ['b-c']
+    assert list(data['nodes']) == ['a', 'b']
+    assert [link['id'] for link in data['links']] == ['a-b']
+
+
+def test_deleting_a_link():
+    patched, removed = map_versions.patch_config(CONFIG, link_changes={'a-b': None, 'missing': None})
+
+    assert removed == []
+    assert [link['id'] for link in map_renderer.parse_config(patched)['links']] == ['b-c']
+
+
+@pytest.mark.parametrize('node_changes, link_changes, message', [
+    ({'b': {'keywords': {'LABEL': 'x\nNODE evil'}}}, None, 'single line'),
+    ({'b': {'keywords': {'LABEL': 'x\rINCLUDE /etc/passwd'}}}, None, 'single line'),
+    ({'b': {'keywords': {'BACKGROUND': '/etc/passwd'}}}, None, 'cannot be set'),
+    (None, {'a-b': {'keywords': {'POSITION': '1 2'}}}, 'cannot be set'),
+    ({'two words': {'x': 1, 'y': 2}}, None, 'Invalid NODE ID'),
+    ({'#comment': None}, None, 'Invalid NODE ID'),
+    (None, {'a-x': {'nodes': ['a', 'x y']}}, 'Invalid NODE ID'),
+    (None, {'a-x': {'nodes': ['a', 'x']}}, 'unknown node'),
+    ({'DEFAULT': {'x': 1, 'y': 2}}, None, 'Invalid NODE ID'),
+    (None, {'default': {'keywords': {'WIDTH': '2'}}}, 'Invalid LINK ID'),
+    (None, {'a-d': {'nodes': ['a', 'DEFAULT']}}, 'Invalid NODE ID'),
+    (None, {'a-b': {'nodes': 'ab'}}, 'two node IDs'),
+    (None, {'a-c': {'nodes': ['a']}}, 'two node IDs'),
+    (None, {'a-c': {'keywords': {'WIDTH': '2'}}}, 'two node IDs'),
+    ({'b': 'moved'}, None, 'must be an object'),
+])
+def test_invalid_changes_are_rejected(node_changes, link_changes, message):
+    with pytest.raises(ValueError, match=message):
+        map_versions.patch_config(CONFIG, node_changes, link_changes)
@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import services
+
+CONFIG = "BACKGROUND images/original.png\nWIDTH 800\nHEIGHT 600\n"
+
+
+def test_jpeg_background_is_stored_as_uploaded(tmp_path):
+    upload_path = str(tmp_path / 'upload.jpg')
+    Image.new('RGB', (64, 48), (200, 30, 30)).save(upload_path, 'JPEG')
+
+    saved = services.save_uploaded_map(upload_path, CONFIG)
+
+    assert saved['image_path'].endswith('.jpg')
+    with open(upload_path, 'rb') as upload, open(saved['image_path'], 'rb') as stored:
+        assert stored.read() == upload.read()
+    with open(saved['config_path']) as f:
+        assert f"BACKGROUND ../maps/{saved['image_key']}.jpg" in f.read()
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(services.time, 'monotonic', clock)
+    return clock
+
+
+def _cache():
+    return services.SnmpCache({'info': 60}, negative_ttl=5, max_entries=2)
+
+
+def test_snmp_cache_serves_fresh_entries_until_their_ttl(clock):
+    cache = _cache()
+    fetched = []
+    fetch = lambda ip: fetched.append(ip) or {'ip': ip}
+
+    assert cache.get_or_fetch('info', 'a', fetch) == {'ip': 'a'}
+    clock.now += 59
+    assert cache.get_or_fetch('info', 'a', fetch) == {'ip': 'a'}
+    assert fetched == ['a']
+
+    clock.now += 2
+    cache.get_or_fetch('info', 'a', fetch)
+    assert fetched == ['a', 'a']
+    assert cache.get_stats()['kinds']['info'] == {'hits': 1, 'misses': 2, 'coalesced': 0}
+
+
+def test_snmp_cache_retries_empty_results_after_the_negative_ttl(clock):
+    cache = _cache()
+    fetched = []
+    fetch = lambda ip: fetched.append(ip)
+
+    assert cache.get_or_fetch('info', 'a', fetch) is None
+    clock.now += 4
+    assert cache.get_or_fetch('info', 'a', fetch) is None
+    assert len(fetched) == 1
+
+    clock.now += 2
+    cache.get_or_fetch('info', 'a', fetch)
+    assert len(fetched) == 2
+
+
+def test_snmp_cache_evicts_the_least_recently_used_entry(clock):
+    cache = _cache()
+    fetched = []
+    fetch = lambda ip: fetched.append(ip) or {'ip': ip}
+
+    for ip in ('a', 'b', 'a', 'c', 'a', 'b'):
+        cache.get_or_fetch('info', ip, fetch)
+
+    assert fetched == ['a', 'b', 'c', 'b']
+    assert cache.get_stats()['entries'] == 2
+
+
+def test_snmp_cache_coalesces_concurrent_lookups():
+    cache = _cache()
+    release = threading.Event()
+    fetched = []
+
+    def fetch(ip):
+        fetched.append(ip)
+        release.wait(5)
+        return {'ip': ip}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(cache.get_or_fetch, 'info', 'a', fetch) for _ in range(8)]
+        while cache.get_stats()['kinds']['info']['coalesced'] < 7:
+            time.sleep(0.01)
+        release.set()
+        results = [future.result(5) for future in futures]
+
+    assert fetched == ['a']
+    assert all(result == {'ip': 'a'} for result in results)
+
+
+def test_snmp_cache_releases_waiters_when_the_lookup_fails():
+    cache = _cache()
+
+    def fetch(ip):
+        raise TimeoutError(ip)
+
+    with pytest.raises(TimeoutError):
+        cache.get_or_fetch('info', 'a', fetch)
+    assert cache.get_stats()['in_flight'] == 0
+    assert cache.get_or_fetch('info', 'a', lambda ip: {'ip': ip}) == {'ip': 'a'}
+
+
+def test_snmp_cache_invalidation_drops_the_result_of_a_running_lookup(clock):
+    cache = _cache()
+    fetched = []
+
+    def fetch(ip):
+        fetched.append(ip)
+        if len(fetched) == 1:
+            cache.invalidate(ip)
+        return {'ip': ip, 'fetch': len(fetched)}
+
+    assert cache.get_or_fetch('info', 'a', fetch) == {'ip': 'a', 'fetch': 1}
+    assert cache.get_or_fetch('info', 'a', fetch) == {'ip': 'a', 'fetch': 2}
+    assert cache.get_or_fetch('info', 'a', fetch) == {'ip': 'a', 'fetch': 2}
@@ -0,0 +1,137 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import task_queue
+
+
+@pytest.fixture
+def store(tmp_path):
+    return task_queue.TaskStore(str(tmp_path / 'tasks.sqlite3'))
+
+
+def _enqueue(store, hostnames=('host-a', 'host-b'), username='user', **limits):
+    upload_id = str(uuid.uuid4())
+    tasks = [{'id': str(uuid.uuid4()), 'upload_id': upload_id, 'hostname': hostname, 'payload': {'n': 1}}
+             for hostname in hostnames]
+    store.enqueue(tasks, username, max_queue_depth=limits.get('depth', 100),
+                  max_pending_per_user=limits.get('per_user', 100))
+    return upload_id, [task['id'] for task in tasks]
+
+
+def _expire_leases(store):
+    past = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+    store._connection().execute("UPDATE tasks SET lease_expires_at = ?", (past,))
+
+
+def test_claim_takes_every_task_of_the_oldest_upload(store):
+    first_upload, first_ids = _enqueue(store)
+    _enqueue(store)
+
+    claimed = store.claim_next('worker-1')
+
+    assert claimed['upload_id'] == first_upload
+    assert sorted(task['id'] for task in claimed['tasks']) == sorted(first_ids)
+    assert claimed['payload'] == {'n': 1}
+    assert {store.get(task_id)['status'] for task_id in first_ids} == {'PROCESSING'}
+
+
+def test_claim_returns_none_when_queue_is_empty(store):
+    assert store.claim_next('worker-1') is None
+
+
+def test_enqueue_limits(store):
+    _enqueue(store, hostnames=['a', 'b'], per_user=3)
+    with pytest.raises(task_queue.UserQuotaExceededError):
+        _enqueue(store, hostnames=['c', 'd'], per_user=3)
+    with pytest.raises(task_queue.QueueFullError):
+        _enqueue(store, hostnames=['c'], username='other', depth=2)
+
+
+def test_requeue_leaves_leased_tasks_alone(store):
+    _, task_ids = _enqueue(store, hostnames=['a'])
+    store.claim_next('worker-1')
+
+    assert store.requeue_stale() == 0
+    assert store.get(task_ids[0])['status'] == 'PROCESSING'
+
+
+def test_requeue_reclaims_expired_leases(store):
+    _, task_ids = _enqueue(store, hostnames=['a'])
+    store.claim_next('worker-1')
+    _expire_leases(store)
+
+    assert store.requeue_stale() == 1
+    assert store.get(task_ids[0])['status'] == 'PENDING'
+    assert store.claim_next('worker-2') is not None
+
+
+def test_renewed_lease_survives_requeue(store):
+    _, task_ids = _enqueue(store, hostnames=['a'])
+    store.claim_next('worker-1')
+    _expire_leases(store)
+
+    assert store.renew_leases('worker-1') == 1
+    assert store.renew_leases('worker-2') == 0
+    assert store.requeue_stale() == 0
+
+
+def test_purge_keeps_unfinished_tasks(store):
+    _, finished = _enqueue(store)
+    _, unfinished = _enqueue(store, hostnames=['c'])
+    old = (datetime.utcnow() - timedelta(days=30)).isoformat()
+    store.update_many(finished, {'status': 'SUCCESS', 'updated_at': old})
+    store.update_many(unfinished, {'updated_at': old})
+
+    assert store.purge_expired(ttl_seconds=3600) == 2
+    assert store.get(finished[0]) is None
+    assert store.get(unfinished[0])['status'] == 'PENDING'
+
+
+def test_purge_trims_to_max_stored(store):
+    _, finished = _enqueue(store, hostnames=['a', 'b', 'c'])
+    store.update_many(finished, {'status': 'FAILURE'})
+
+    assert store.purge_expired(max_stored=1) == 2
+
+
+def test_list_tasks_pages_through_filtered_tasks(store):
+    for _ in range(3):
+        _enqueue(store, hostnames=['a', 'b'])
+    _enqueue(store, hostnames=['c'], username='other')
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = store.list_tasks(username='user', limit=4, cursor=cursor)
+        seen.extend(page)
+        if cursor is None:
+            break
+
+    assert len(seen) == 6
+    assert len({task['id'] for task in seen}) == 6
+    assert {task['username'] for task in seen} == {'user'}
+    assert [task['created_at'] for task in seen] == sorted((task['created_at'] for task in seen), reverse=True)
+    assert store.count_by_status() == {'PENDING': 7}
+
+
+def test_executor_runs_queued_uploads(store):
+    done = threading.Event()
+    seen = []
+
+    def handler(tasks, n):
+        seen.append((len(tasks), n))
+        store.update_many([task['id'] for task in tasks], {'status': 'SUCCESS'})
+        done.set()
+
+    executor = task_queue.TaskExecutor(store, handler, max_workers=1, poll_interval=0.05).start()
+    try:
+        _, task_ids = _enqueue(store)
+        executor.notify()
+        assert done.wait(5)
+    finally:
+        executor.stop()
+
+    assert seen == [(2, 1)]
+    assert store.get(task_ids[0])['status'] == 'SUCCESS'
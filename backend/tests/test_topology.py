@@ -0,0 +1,155 @@
+import services
+import topology
+
+
+def _index():
+    # a - b - c, and d hanging off c over two parallel links.
+    return topology.build_index(
+        {ip: {'hostname': ip.upper(), 'type': 'Router'} for ip in 'abcd'},
+        {
+            'a': [{'ip': 'b', 'hostname': 'B', 'interface': 'g0/1', 'bandwidth': '10G'}],
+            'b': [{'ip': 'c', 'hostname': 'C', 'interface': 'g0/2', 'bandwidth': '1G'}],
+            'c': [{'ip': 'd', 'hostname': 'D', 'interface': 'g0/3', 'bandwidth': '1G'},
+                  {'ip': 'd', 'hostname': 'D', 'interface': 'g0/4', 'bandwidth': '1G'}],
+        }
+    )
+
+
+def test_unchanged_updates_keep_the_version():
+    index = _index()
+    version = index.version
+
+    index.add_device('a', 'A', 'Router')
+    index.set_neighbors('c', list(index.device_neighbors('c')))
+
+    assert index.version == version
+
+
+def test_neighbor_change_invalidates_cached_queries():
+    index = _index()
+    cache = topology.QueryCache(index)
+    assert cache.get_or_compute(('path',), lambda: topology.shortest_path(index, 'a', 'd'))['nodes'] == \
+        ['a', 'b', 'c', 'd']
+
+    index.set_neighbors('a', [{'ip': 'b', 'hostname': 'B', 'interface': 'g0/1', 'bandwidth': '10G'},
+                              {'ip': 'd', 'hostname': 'D', 'interface': 'g0/9', 'bandwidth': '10G'}])
+
+    assert cache.get_or_compute(('path',), lambda: topology.shortest_path(index, 'a', 'd'))['nodes'] == ['a', 'd']
+
+
+def test_lookups_update_the_service_index():
+    version = services.TOPOLOGY.version
+    services.discover_topology('10.10.1.3', max_depth=2)
+    services.get_device_neighbors_batch(['10.10.1.3', '10.10.1.4'])
+    # The mock tables already built the index, so answers change nothing.
+    assert services.TOPOLOGY.version == version
+
+    services._record_topology('neighbors', '10.77.0.1', {'neighbors': [
+        {'ip': '10.10.1.3', 'hostname': 'core', 'interface': 'Gi0/1', 'bandwidth': '1G'}
+    ]})
+
+    assert services.TOPOLOGY.version > version
+    assert '10.77.0.1' in services.TOPOLOGY.neighbors('10.10.1.3')
+
+
+def _chain(node_ids, bandwidth='1G'):
+    return {a: [{'ip': b, 'hostname': b.upper(), 'interface': f'to-{b}', 'bandwidth': bandwidth}]
+            for a, b in zip(node_ids, node_ids[1:])}
+
+
+def _connected(index, start, removed_node=None, removed_bundle=None):
+    """Brute-force reachability, for checking the graph queries."""
+    seen, stack = {start}, [start]
+    while stack:
+        for neighbor_id, bundle in index.neighbors(stack.pop()).items():
+            if neighbor_id == removed_node or bundle is removed_bundle or neighbor_id in seen:
+                continue
+            seen.add(neighbor_id)
+            stack.append(neighbor_id)
+    return seen
+
+
+def test_shortest_path_prefers_bandwidth_or_hops():
+    neighbors = _chain(['a', 'b', 'c', 'd'], bandwidth='10G')
+    neighbors['a'].append({'ip': 'd', 'hostname': 'D', 'interface': 'slow', 'bandwidth': '100M'})
+    index = topology.build_index({ip: {'hostname': ip.upper()} for ip in 'abcd'}, neighbors)
+
+    by_bandwidth = topology.shortest_path(index, 'a', 'd')
+    by_hops = topology.shortest_path(index, 'a', 'd', metric='hops')
+
+    assert by_bandwidth['nodes'] == ['a', 'b', 'c', 'd']
+    assert len(by_bandwidth['bundles']) == 3
+    assert by_bandwidth['cost'] == 3 * topology.REFERENCE_BANDWIDTH_BPS / 10**10
+    assert by_hops == {'nodes': ['a', 'd'], 'bundles': [index.neighbors('a')['d']['id']], 'cost': 1}
+
+
+def test_shortest_path_between_unconnected_or_unknown_nodes():
+    neighbors = {**_chain(['a', 'b']), **_chain(['c', 'd'])}
+    index = topology.build_index({ip: {'hostname': ip.upper()} for ip in 'abcd'}, neighbors)
+
+    assert topology.shortest_path(index, 'a', 'd') is None
+    assert topology.shortest_path(index, 'a', 'missing') is None
+    assert topology.shortest_path(index, 'a', 'a') == {'nodes': ['a'], 'bundles': [], 'cost': 0}
+
+
+def test_critical_elements_of_a_chain_with_a_parallel_bundle():
+    critical = topology.critical_elements(_index())
+
+    assert critical['articulation_points'] == ['b', 'c']
+    assert sorted((bridge['source'], bridge['target'], bridge['link_count']) for bridge in critical['bridges']) == [
+        ('a', 'b', 1), ('b', 'c', 1), ('c', 'd', 2)
+    ]
+
+
+def test_a_ring_has_no_critical_elements():
+    ring = ['a', 'b', 'c', 'd', 'a']
+    index = topology.build_index({ip: {'hostname': ip.upper()} for ip in 'abcd'}, _chain(ring))
+
+    assert topology.critical_elements(index) == {'articulation_points': [], 'bridges': []}
+
+
+def test_critical_elements_match_brute_force_on_a_campus():
+    import data_sources
+    index = data_sources.SyntheticDataSource(300, 1).index
+    node_ids = list(index.node_ids())
+    component_size = {node_id: len(_connected(index, node_id)) for node_id in node_ids}
+
+    critical = topology.critical_elements(index)
+
+    expected_points = []
+    for node_id in node_ids:
+        neighbor_ids = list(index.neighbors(node_id))
+        if neighbor_ids and len(_connected(index, neighbor_ids[0], removed_node=node_id)) < \
+                component_size[node_id] - 1:
+            expected_points.append(node_id)
+    assert critical['articulation_points'] == sorted(expected_points)
+    expected_bridges = sorted(
+        bundle['id'] for bundle in index.bundles()
+        if bundle['target'] not in _connected(index, bundle['source'], removed_bundle=bundle)
+    )
+    assert sorted(bridge['id'] for bridge in critical['bridges']) == expected_bridges
+    for node_id in node_ids:
+        assert topology.failure_impact(index, node_id)['is_articulation_point'] == (node_id in expected_points)
+
+
+def test_critical_elements_do_not_recurse_on_deep_chains():
+    node_ids = [f'n{i}' for i in range(5000)]
+    index = topology.build_index({ip: {'hostname': ip} for ip in node_ids}, _chain(node_ids))
+
+    critical = topology.critical_elements(index)
+
+    assert len(critical['articulation_points']) == 4998
+    assert len(critical['bridges']) == 4999
+
+
+def test_failure_impact_reports_the_cut_off_devices():
+    index = _index()
+
+    assert topology.failure_impact(index, 'c') == {
+        'node': 'c', 'is_articulation_point': True, 'isolated_components': [['d']], 'isolated_count': 1
+    }
+    assert topology.failure_impact(index, 'b')['isolated_components'] == [['a']]
+    assert topology.failure_impact(index, 'a') == {
+        'node': 'a', 'is_articulation_point': False, 'isolated_components': [], 'isolated_count': 0
+    }
+    assert topology.failure_impact(index, 'missing') is None
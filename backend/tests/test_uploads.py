@@ -0,0 +1,79 @@
+import struct
+import zlib
+
+import pytest
+from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+import uploads
+
+
+def _chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def _png_header(width, height):
+    """A PNG that declares width x height; only its header is ever read."""
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + _chunk(b'IHDR', ihdr) + _chunk(b'IDAT', b'') + _chunk(b'IEND', b'')
+
+
+class _Upload:
+    def __init__(self, stream):
+        self.stream = stream
+
+
+def _spool(tmp_path, data, chunk_size=4):
+    spooled = uploads.SpooledUploadFile(str(tmp_path / 'spool'))
+    for start in range(0, len(data), chunk_size):
+        spooled.write(data[start:start + chunk_size])
+    return spooled
+
+
+def test_pillow_accepts_every_size_below_the_upload_limit():
+    assert Image.MAX_IMAGE_PIXELS == uploads.MAX_UPLOAD_PIXELS
+
+
+def test_claim_accepts_a_large_background_below_the_limit(tmp_path):
+    # 250M pixels: above Pillow's default bomb threshold, below ours.
+    spooled = _spool(tmp_path, _png_header(20_000, 12_500))
+    destination = str(tmp_path / 'claimed.png')
+
+    assert uploads.claim_upload(_Upload(spooled), destination) == 'PNG'
+
+
+def test_claim_rejects_too_many_pixels(tmp_path):
+    spooled = _spool(tmp_path, _png_header(20_000, 20_000))
+    destination = tmp_path / 'claimed.png'
+
+    with pytest.raises(uploads.InvalidUploadError, match='the limit is'):
+        uploads.claim_upload(_Upload(spooled), str(destination))
+    assert not destination.exists()
+
+
+def test_claim_rejects_an_unreadable_image(tmp_path):
+    spooled = _spool(tmp_path, b'\x89PNG\r\n\x1a\n' + b'garbage' * 10)
+
+    with pytest.raises(uploads.InvalidUploadError, match='could not be read'):
+        uploads.claim_upload(_Upload(spooled), str(tmp_path / 'claimed.png'))
+
+
+def test_spool_rejects_a_non_image_signature(tmp_path):
+    with pytest.raises(UnsupportedMediaType):
+        _spool(tmp_path, b'<html>not an image</html>')
+
+
+def test_spool_rejects_oversized_uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, 'MAX_UPLOAD_BYTES', 64)
+    spooled = uploads.SpooledUploadFile(str(tmp_path / 'spool'))
+
+    with pytest.raises(RequestEntityTooLarge):
+        spooled.write(_png_header(10, 10) + b'\0' * 64)
+    assert not (tmp_path / 'spool' / spooled.name).exists()
+
+
+def test_unclaimed_spool_file_is_deleted_on_close(tmp_path):
+    spooled = _spool(tmp_path, _png_header(10, 10))
+    spooled.close()
+
+    assert not list((tmp_path / 'spool').iterdir())
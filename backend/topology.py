@@ -0,0 +1,450 @@
+import hashlib
+import heapq
+import re
+import threading
+from collections import OrderedDict, deque
+from types import MappingProxyType
+
+# --- Bandwidth Parsing ---
+BANDWIDTH_UNITS = {'': 1, 'b': 1, 'k': 10**3, 'm': 10**6, 'g': 10**9, 't': 10**12}
+BANDWIDTH_PATTERN = re.compile(r'^\s*([0-9]*\.?[0-9]+)\s*([kmgt]?)(?:b|bps)?\s*$', re.IGNORECASE)
+
+def parse_bandwidth(value):
+    """Converts a bandwidth string such as '10G', '100M' or '9600b' to bits per second (0 if unknown)."""
+    match = BANDWIDTH_PATTERN.match(str(value or ''))
+    if not match:
+        return 0
+    return int(float(match.group(1)) * BANDWIDTH_UNITS[match.group(2).lower()])
+
+def format_bandwidth(bps):
+    """Formats bits per second the way the mock data writes bandwidth ('40G', '100M')."""
+    if not bps:
+        return 'Unknown'
+    for suffix, factor in (('T', 10**12), ('G', 10**9), ('M', 10**6), ('K', 10**3)):
+        if bps >= factor:
+            return f"{bps / factor:g}{suffix}"
+    return f"{bps}b"
+
+def anonymous_node_id(hostname):
+    """Stable node ID for a neighbor that reports no IP address."""
+    return f"noip-{hashlib.sha1(hostname.encode('utf-8')).hexdigest()[:12]}"
+
+
+class TopologyIndex:
+    """
+    In-memory graph of devices and the links between them.
+
+    Neighbor lists are recorded per device and per scan scope ('cdp' for the
+    standard neighbor table, 'full' for extras found only by a full scan).
+    Every observation is folded into an undirected bundle per device pair:
+    one bundle holds all parallel links between two devices, as seen from
+    each side, and the bundle's link count and total bandwidth come from the
+    side that reports more links (both sides usually report the same cable).
+
+    Recording one device's neighbors only touches the bundles of that
+    device, so the index is updated incrementally. Neighbor queries return
+    read-only views of the adjacency, so they cost O(degree) and copy nothing.
+    """
+
+    SCOPES = ('cdp', 'full')
+
+    def __init__(self):
+        self.version = 0
+        self._nodes = {}
+        self._ids_by_hostname = {}
+        self._adjacency = {}
+        self._reported = {}
+        self._links_by_neighbor = {}
+        self._merged_neighbors = {}
+        self._lock = threading.RLock()
+
+    # --- Nodes ---
+    def add_device(self, ip, hostname, device_type='Unknown', model='Unknown Model'):
+        """
+        Registers (or updates) a device that has an IP address. Returns its
+        node ID. Re-registering an unchanged device keeps the index version.
+        """
+        with self._lock:
+            node = self._nodes.setdefault(ip, {'id': ip, 'ip': ip})
+            fields = {'hostname': hostname, 'type': device_type, 'model': model}
+            if all(node.get(key) == value for key, value in fields.items()) and \
+                    self._ids_by_hostname.get(hostname) == ip:
+                return ip
+            node.update(fields)
+            self._ids_by_hostname[hostname] = ip
+            self._adjacency.setdefault(ip, {})
+            self.version += 1
+            return ip
+
+    def resolve_node_id(self, neighbor):
+        """
+        Returns the node ID for a neighbor entry. Neighbors reported without
+        an IP resolve to a known device with the same hostname when there is
+        one, and otherwise to a stable ID derived from the hostname.
+        """
+        if neighbor.get('ip'):
+            return neighbor['ip']
+        hostname = neighbor.get('hostname', '')
+        return self._ids_by_hostname.get(hostname) or anonymous_node_id(hostname)
+
+    def _ensure_neighbor_node(self, node_id, neighbor):
+        if node_id not in self._nodes:
+            self._nodes[node_id] = {
+                'id': node_id,
+                'ip': neighbor.get('ip', ''),
+                'hostname': neighbor.get('hostname', node_id),
+                'type': 'Unknown',
+                'model': 'Unknown Model'
+            }
+            self._adjacency[node_id] = {}
+
+    def get_node(self, node_id):
+        node = self._nodes.get(node_id)
+        return MappingProxyType(node) if node is not None else None
+
+    def node_ids(self):
+        return self._nodes.keys()
+
+    def find_node(self, key):
+        """Resolves a node ID, IP address or hostname to a node ID, or None."""
+        if key in self._nodes:
+            return key
+        return self._ids_by_hostname.get(key) or (
+            anonymous_node_id(key) if anonymous_node_id(key) in self._nodes else None
+        )
+
+    # --- Links ---
+    def set_neighbors(self, device_id, neighbors, scope='cdp'):
+        """
+        Replaces the neighbor list that device_id reported in the given scope
+        and updates the bundles it touches. An unchanged list keeps the index
+        version, so cached queries stay valid.
+        """
+        if scope not in self.SCOPES:
+            raise ValueError(f"Unknown neighbor scope: {scope}")
+
+        with self._lock:
+            if device_id not in self._nodes:
+                self._nodes[device_id] = {'id': device_id, 'ip': device_id, 'hostname': device_id,
+                                          'type': 'Unknown', 'model': 'Unknown Model'}
+                self._adjacency[device_id] = {}
+
+            reported = self._reported.setdefault(device_id, {})
+            neighbors = list(neighbors)
+            if reported.get(scope) == neighbors:
+                return
+            reported[scope] = neighbors
+            touched = set(self._links_by_neighbor.get(device_id, ()))
+
+            links_by_neighbor = {}
+            for neighbor_scope in self.SCOPES:
+                for neighbor in reported.get(neighbor_scope, ()):
+                    neighbor_id = self.resolve_node_id(neighbor)
+                    self._ensure_neighbor_node(neighbor_id, neighbor)
+                    links_by_neighbor.setdefault(neighbor_id, []).append(MappingProxyType({
+                        'interface': neighbor.get('interface', ''),
+                        'description': neighbor.get('description', ''),
+                        'bandwidth': neighbor.get('bandwidth', ''),
+                        'bandwidth_bps': parse_bandwidth(neighbor.get('bandwidth')),
+                        'isFullScan': neighbor_scope == 'full' or neighbor.get('isFullScan', False)
+                    }))
+            self._links_by_neighbor[device_id] = links_by_neighbor
+            touched.update(links_by_neighbor)
+
+            # The raw lists are what the SNMP lookups return, built once per update.
+            cdp_neighbors = reported.get('cdp', [])
+            self._merged_neighbors[device_id] = {
+                'cdp': cdp_neighbors,
+                'full': cdp_neighbors + reported.get('full', [])
+            }
+
+            for neighbor_id in touched:
+                self._rebuild_bundle(device_id, neighbor_id)
+            self.version += 1
+
+    def _rebuild_bundle(self, a, b):
+        source, target = sorted((a, b))
+        links_by_side = {
+            source: self._links_by_neighbor.get(source, {}).get(target, []),
+            target: self._links_by_neighbor.get(target, {}).get(source, [])
+        }
+        if not any(links_by_side.values()):
+            self._adjacency.get(source, {}).pop(target, None)
+            self._adjacency.get(target, {}).pop(source, None)
+            return
+
+        # Prefer the side that reports more links; ties go to the higher total.
+        reporting_side = max(
+            links_by_side,
+            key=lambda side: (len(links_by_side[side]), sum(l['bandwidth_bps'] for l in links_by_side[side]))
+        )
+        links = links_by_side[reporting_side]
+        total_bps = sum(link['bandwidth_bps'] for link in links)
+        bundle = MappingProxyType({
+            'id': f"b-{source}-{target}",
+            'source': source,
+            'target': target,
+            'reported_by': reporting_side,
+            'links': tuple(links),
+            'link_count': len(links),
+            'total_bandwidth_bps': total_bps,
+            'total_bandwidth': format_bandwidth(total_bps),
+            'isFullScan': all(link['isFullScan'] for link in links)
+        })
+        self._adjacency[source][target] = bundle
+        self._adjacency[target][source] = bundle
+
+    # --- Queries ---
+    def neighbors(self, node_id):
+        """Returns a read-only {neighbor_id: bundle} view of node_id's adjacency, or None."""
+        adjacency = self._adjacency.get(node_id)
+        return MappingProxyType(adjacency) if adjacency is not None else None
+
+    def device_neighbors(self, device_id, full_scan=False):
+        """
+        Returns the raw neighbor entries device_id reported (CDP only, or CDP
+        plus full-scan extras), in the format of the SNMP lookups. The lists
+        are built once per update and shared; callers must not modify them.
+        """
+        merged = self._merged_neighbors.get(device_id)
+        if merged is None:
+            return None
+        return merged['full' if full_scan else 'cdp']
+
+    def bundles(self):
+        """Yields every bundle once."""
+        for node_id, adjacency in self._adjacency.items():
+            for neighbor_id, bundle in adjacency.items():
+                if node_id == bundle['source']:
+                    yield bundle
+
+    def to_dict(self, node_ids=None):
+        """Serializes the whole graph, or the subgraph induced by node_ids, for JSON responses."""
+        with self._lock:
+            if node_ids is None:
+                node_ids = self._nodes.keys()
+            node_ids = {node_id for node_id in node_ids if node_id in self._nodes}
+            return {
+                'version': self.version,
+                'nodes': [dict(self._nodes[node_id]) for node_id in node_ids],
+                'bundles': [
+                    dict(bundle, links=[dict(link) for link in bundle['links']])
+                    for node_id in node_ids
+                    for neighbor_id, bundle in self._adjacency[node_id].items()
+                    if node_id == bundle['source'] and neighbor_id in node_ids
+                ]
+            }
+
+
+def build_index(devices, neighbors, full_scan_extras=None):
+    """
+    Builds a TopologyIndex from {ip: device info}, {ip: [neighbor]} and an
+    optional {ip: [full-scan neighbor]} mapping.
+    """
+    index = TopologyIndex()
+    for ip, device in devices.items():
+        index.add_device(ip, device.get('hostname', ip), device.get('type', 'Unknown'),
+                         device.get('model', 'Unknown Model'))
+    for ip, device_neighbors in neighbors.items():
+        index.set_neighbors(ip, device_neighbors, scope='cdp')
+    for ip, extras in (full_scan_extras or {}).items():
+        index.set_neighbors(ip, extras, scope='full')
+    return index
+
+
+# --- Graph Queries ---
+# Link cost for bandwidth-weighted paths is REFERENCE_BANDWIDTH / bandwidth,
+# as in OSPF, so fatter bundles are preferred. Bundles of unknown bandwidth
+# cost as much as a 1 Mbps link.
+REFERENCE_BANDWIDTH_BPS = 10**12
+UNKNOWN_BANDWIDTH_COST = REFERENCE_BANDWIDTH_BPS / 10**6
+QUERY_CACHE_MAX_ENTRIES = 256
+
+def bundle_cost(bundle, metric='bandwidth'):
+    if metric == 'hops':
+        return 1
+    bps = bundle['total_bandwidth_bps']
+    return REFERENCE_BANDWIDTH_BPS / bps if bps else UNKNOWN_BANDWIDTH_COST
+
+def shortest_path(index, source, target, metric='bandwidth'):
+    """
+    Dijkstra over the bundle graph. metric is 'bandwidth' (prefer high total
+    bandwidth) or 'hops'. Returns {'nodes', 'bundles', 'cost'} or None when
+    the two nodes are not connected.
+    """
+    with index._lock:
+        adjacency = index._adjacency
+        if source not in adjacency or target not in adjacency:
+            return None
+
+        distances = {source: 0}
+        previous = {}
+        heap = [(0, source)]
+        while heap:
+            distance, node_id = heapq.heappop(heap)
+            if node_id == target:
+                break
+            if distance > distances[node_id]:
+                continue
+            for neighbor_id, bundle in adjacency[node_id].items():
+                candidate = distance + bundle_cost(bundle, metric)
+                if candidate < distances.get(neighbor_id, float('inf')):
+                    distances[neighbor_id] = candidate
+                    previous[neighbor_id] = (node_id, bundle)
+                    heapq.heappush(heap, (candidate, neighbor_id))
+
+        if target not in distances:
+            return None
+
+        nodes, bundles = [target], []
+        while nodes[-1] != source:
+            node_id, bundle = previous[nodes[-1]]
+            nodes.append(node_id)
+            bundles.append(bundle['id'])
+        nodes.reverse()
+        bundles.reverse()
+        return {'nodes': nodes, 'bundles': bundles, 'cost': distances[target]}
+
+def critical_elements(index):
+    """
+    Finds articulation points (devices whose failure splits the network) and
+    bridges (bundles whose failure does) with an iterative Tarjan DFS, so
+    deep topologies cannot hit the recursion limit. O(V + E).
+    """
+    with index._lock:
+        adjacency = index._adjacency
+        discovery, low = {}, {}
+        articulation_points, bridges = set(), []
+        counter = 0
+
+        for root in adjacency:
+            if root in discovery:
+                continue
+            discovery[root] = low[root] = counter
+            counter += 1
+            root_children = 0
+            # Stack entries: (node, parent, iterator over its neighbors)
+            stack = [(root, None, iter(adjacency[root].items()))]
+            while stack:
+                node_id, parent, neighbors = stack[-1]
+                advanced = False
+                for neighbor_id, bundle in neighbors:
+                    if neighbor_id == parent:
+                        continue
+                    if neighbor_id in discovery:
+                        low[node_id] = min(low[node_id], discovery[neighbor_id])
+                        continue
+                    discovery[neighbor_id] = low[neighbor_id] = counter
+                    counter += 1
+                    if node_id == root:
+                        root_children += 1
+                    stack.append((neighbor_id, node_id, iter(adjacency[neighbor_id].items())))
+                    advanced = True
+                    break
+                if advanced:
+                    continue
+
+                stack.pop()
+                if parent is not None:
+                    low[parent] = min(low[parent], low[node_id])
+                    if low[node_id] > discovery[parent]:
+                        bridges.append(adjacency[parent][node_id])
+                    if parent != root and low[node_id] >= discovery[parent]:
+                        articulation_points.add(parent)
+            if root_children > 1:
+                articulation_points.add(root)
+
+        return {
+            'articulation_points': sorted(articulation_points),
+            'bridges': [
+                {'id': b['id'], 'source': b['source'], 'target': b['target'], 'link_count': b['link_count']}
+                for b in bridges
+            ]
+        }
+
+def failure_impact(index, node_id):
+    """
+    Returns the devices cut off if node_id fails: every connected component
+    left after removing it except the largest one, which is assumed to keep
+    the rest of the network reachable.
+    """
+    with index._lock:
+        adjacency = index._adjacency
+        if node_id not in adjacency:
+            return None
+
+        seen = {node_id}
+        components = []
+        for start in adjacency[node_id]:
+            if start in seen:
+                continue
+            seen.add(start)
+            component, queue = [], deque([start])
+            while queue:
+                current = queue.popleft()
+                component.append(current)
+                for neighbor_id in adjacency[current]:
+                    if neighbor_id not in seen:
+                        seen.add(neighbor_id)
+                        queue.append(neighbor_id)
+            components.append(component)
+
+        components.sort(key=len, reverse=True)
+        isolated = [sorted(component) for component in components[1:]]
+        return {
+            'node': node_id,
+            'is_articulation_point': len(components) > 1,
+            'isolated_components': isolated,
+            'isolated_count': sum(len(component) for component in isolated)
+        }
+
+def k_hop_node_ids(index, node_id, hops):
+    """Returns the IDs of all nodes within hops links of node_id (breadth-first)."""
+    with index._lock:
+        adjacency = index._adjacency
+        if node_id not in adjacency:
+            return None
+        depths = {node_id: 0}
+        queue = deque([node_id])
+        while queue:
+            current = queue.popleft()
+            if depths[current] == hops:
+                continue
+            for neighbor_id in adjacency[current]:
+                if neighbor_id not in depths:
+                    depths[neighbor_id] = depths[current] + 1
+                    queue.append(neighbor_id)
+        return list(depths)
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of graph query results tied to a TopologyIndex version.
+    Any update to the index bumps its version, which empties the cache.
+    """
+
+    def __init__(self, index, max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.index = index
+        self.max_entries = max_entries
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if self._version != self.index.version:
+                self._entries.clear()
+                self._version = self.index.version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            version = self._version
+
+        result = compute()
+        with self._lock:
+            # Drop the result if the index changed while it was computed.
+            if self._version == version == self.index.version:
+                self._entries[key] = result
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result
@@ -0,0 +1,152 @@
+import os
+import tempfile
+import warnings
+
+from flask import Request
+from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+import task_queue
+
+# --- Upload Limits ---
+MAX_UPLOAD_BYTES = int(os.environ.get('AUTOCACTI_MAX_UPLOAD_MB', 64)) * 1024 * 1024
+# Largest background (width * height) accepted; guards against decompression bombs.
+MAX_UPLOAD_PIXELS = int(os.environ.get('AUTOCACTI_MAX_UPLOAD_PIXELS', 300_000_000))
+# Pillow refuses images over twice its own limit (about 179M pixels by
+# default) with DecompressionBombError. Use ours instead, so accepted
+# backgrounds can be opened and rendered, and larger ones get our message.
+Image.MAX_IMAGE_PIXELS = MAX_UPLOAD_PIXELS
+
+# Leading bytes of the image formats accepted as map backgrounds.
+IMAGE_SIGNATURES = {
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+    b'\xff\xd8\xff': 'JPEG',
+    b'GIF87a': 'GIF',
+    b'GIF89a': 'GIF',
+    b'BM': 'BMP',
+}
+SIGNATURE_LENGTH = max(len(signature) for signature in IMAGE_SIGNATURES)
+
+
+class InvalidUploadError(ValueError):
+    """Raised when an uploaded map image is not an acceptable background."""
+
+
+class SpooledUploadFile:
+    """
+    File object that werkzeug streams an uploaded file part into.
+
+    Bytes go straight to a temporary file in the upload spool directory. The
+    size limit and the image signature are checked as the bytes arrive, so an
+    oversized or non-image upload is rejected before it is fully received.
+    Unless claimed by claim_upload(), the file is deleted when closed.
+    """
+
+    def __init__(self, spool_dir):
+        os.makedirs(spool_dir, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=spool_dir, suffix='.part', delete=False)
+        self.name = self._file.name
+        self.size = 0
+        self.format = None
+        self.claimed = False
+        self._head = b''
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > MAX_UPLOAD_BYTES:
+            self.close()
+            raise RequestEntityTooLarge(f"Map image exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit.")
+
+        if self.format is None and len(self._head) < SIGNATURE_LENGTH:
+            self._head += bytes(data[:SIGNATURE_LENGTH - len(self._head)])
+            self.format = next(
+                (fmt for signature, fmt in IMAGE_SIGNATURES.items() if self._head.startswith(signature)),
+                None
+            )
+            if self.format is None and len(self._head) >= SIGNATURE_LENGTH:
+                self.close()
+                raise UnsupportedMediaType("Map image must be a PNG, JPEG, GIF or BMP file.")
+
+        return self._file.write(data)
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        return self._file.flush()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        self._file.close()
+        if not self.claimed and os.path.exists(self.name):
+            os.remove(self.name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class SpoolingRequest(Request):
+    """Flask request that streams uploaded files into the task spool directory."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledUploadFile(task_queue.UPLOAD_SPOOL_DIR)
+
+
+def _validate_image_header(path):
+    """Reads only the image header to check the format and dimensions."""
+    try:
+        with warnings.catch_warnings():
+            # Oversized images are rejected below with a clearer message.
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(path) as image:
+                width, height = image.size
+                image_format = image.format
+    except (OSError, Image.DecompressionBombError) as e:
+        raise InvalidUploadError(f"Map image could not be read: {e}")
+
+    if width * height > MAX_UPLOAD_PIXELS:
+        raise InvalidUploadError(
+            f"Map image is {width}x{height} pixels; the limit is {MAX_UPLOAD_PIXELS} pixels."
+        )
+    return image_format
+
+
+def claim_upload(file_storage, destination_path):
+    """
+    Moves an uploaded file to destination_path and validates its header.
+
+    A file that was streamed into the spool by SpoolingRequest is renamed in
+    place, so the upload is only ever written to disk once. Any other file
+    object is copied in chunks. Returns the detected image format.
+    """
+    stream = file_storage.stream
+    if isinstance(stream, SpooledUploadFile):
+        stream.flush()
+        stream.claimed = True
+        os.replace(stream.name, destination_path)
+    else:
+        file_storage.save(destination_path)
+
+    try:
+        return _validate_image_header(destination_path)
+    except InvalidUploadError:
+        os.remove(destination_path)
+        raise
@@ -0,0 +1,25 @@
+"""
+Standalone map task worker.
+
+Run the web server with AUTOCACTI_TASK_MODE=external and start one or more of
+these processes from the backend directory to render queued maps outside the
+web process:
+
+    python worker.py
+
+With AUTOCACTI_WORKER_METRICS_PORT set, the worker's render and queue
+metrics are served on http://<host>:<port>/metrics.
+"""
+import os
+
+import metrics
+import services
+
+
+if __name__ == '__main__':
+    print(f"Map task worker {services.TASK_EXECUTOR.worker_id} started "
+          f"with {services.TASK_EXECUTOR.max_workers} slots.")
+    metrics_port = os.environ.get('AUTOCACTI_WORKER_METRICS_PORT')
+    if metrics_port:
+        metrics.start_http_server(int(metrics_port))
+    services.TASK_EXECUTOR.run_forever()
@@ -22,9 +22,13 @@ const ErrorIcon = () => (
     </svg>
 );
 
+const supportsEventSource = typeof window !== 'undefined' && typeof window.EventSource !== 'undefined';
+
 const UploadSuccessPopup = ({ data, onClose }) => {
     const { t } = useTranslation();
     const [tasks, setTasks] = useState([]);
+    // Task updates are streamed; polling is the fallback when streaming is unavailable or fails.
+    const [streaming, setStreaming] = useState(supportsEventSource);
     // Ref to track if the component is mounted to prevent state updates after unmounting.
     const isMountedRef = useRef(false);
     // Ref to hold the timeout ID for cleanup.
@@ -43,10 +47,55 @@ const UploadSuccessPopup = ({ data, onClose }) => {
         } else {
             setTasks([]);
         }
+        setStreaming(supportsEventSource);
     }, [data]);
 
-    // Effect to manage the polling lifecycle. It starts when `tasks` state is initialized.
+    // Effect to follow the tasks over a Server-Sent Events stream.
+    useEffect(() => {
+        if (!streaming || tasks.length === 0) return undefined;
+
+        let source = null;
+        let closed = false;
+        api.openTaskEvents(tasks.map(task => task.task_id))
+            .then(eventSource => {
+                if (closed) {
+                    eventSource.close();
+                    return;
+                }
+                source = eventSource;
+                source.addEventListener('task', event => {
+                    const { id, status, message } = JSON.parse(event.data);
+                    setTasks(currentTasks => currentTasks.map(task => {
+                        if (task.task_id !== id) return task;
+                        if (status === 'SUCCESS') return { ...task, status, url: message };
+                        if (status === 'FAILURE') return { ...task, status, error: message };
+                        return { ...task, status };
+                    }));
+                });
+                source.addEventListener('done', () => source.close());
+                source.onerror = () => {
+                    // Dropped or rejected stream: fall back to polling.
+                    source.close();
+                    if (!closed) setStreaming(false);
+                };
+            })
+            .catch(err => {
+                console.error('Failed to open the task event stream:', err);
+                if (!closed) setStreaming(false);
+            });
+
+        return () => {
+            closed = true;
+            if (source) source.close();
+        };
+        // Re-subscribe only when a new set of tasks is shown (see the polling effect below).
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, [tasks.length, streaming]);
+
+    // Effect to manage the polling lifecycle. It starts when `tasks` state is
+    // initialized and the event stream is not in use.
     useEffect(() => {
+        if (streaming) return undefined;
         isMountedRef.current = true;
         // Clear any lingering timeout from a previous render/data change.
         clearTimeout(pollTimeoutRef.current);
@@ -60,35 +109,47 @@ const UploadSuccessPopup = ({ data, onClose }) => {
             // Use a functional update to get the latest task state for processing.
             const updatedTasks = await new Promise(resolve => {
                 setTasks(currentTasks => {
-                    const promises = currentTasks.map(async (task) => {
-                        if (task.status === 'SUCCESS' || task.status === 'FAILURE') {
-                            return task; // Don't poll finished tasks.
-                        }
-                        
-                        allTasksFinished = false; // Mark that polling needs to continue.
-
-                        try {
-                            const response = await api.getTaskStatus(task.task_id);
-                            const { status, message } = response.data;
-                            
-                            if (status === 'SUCCESS') {
-                                return { ...task, status: 'SUCCESS', url: message };
-                            }
-                            if (status === 'FAILURE' || status === 'REVOKED') {
-                                return { ...task, status: 'FAILURE', error: message };
-                            }
-                            // Task is still processing (PENDING, STARTED, etc.).
-                            return { ...task, status };
-
-                        } catch (err) {
-                            console.error(`Failed to get status for task ${task.task_id}:`, err);
-                            return { ...task, status: 'FAILURE', error: t('app.errorTaskStatus') };
-                        }
-                    });
-                    
-                    // Resolve the outer promise with the array of updated task objects.
-                    Promise.all(promises).then(resolve);
-                    
+                    const unfinished = currentTasks.filter(
+                        task => task.status !== 'SUCCESS' && task.status !== 'FAILURE'
+                    );
+                    if (unfinished.length === 0) {
+                        resolve(currentTasks);
+                        return currentTasks;
+                    }
+                    allTasksFinished = false; // Mark that polling needs to continue.
+
+                    // Poll every unfinished task with a single batch request.
+                    api.getTaskStatusBatch(unfinished.map(task => task.task_id))
+                        .then(response => {
+                            const { tasks: statuses, missing } = response.data;
+                            resolve(currentTasks.map(task => {
+                                if (task.status === 'SUCCESS' || task.status === 'FAILURE') {
+                                    return task; // Don't poll finished tasks.
+                                }
+                                if (missing.includes(task.task_id)) {
+                                    return { ...task, status: 'FAILURE', error: t('app.errorTaskStatus') };
+                                }
+                                const { status, message } = statuses[task.task_id];
+
+                                if (status === 'SUCCESS') {
+                                    return { ...task, status: 'SUCCESS', url: message };
+                                }
+                                if (status === 'FAILURE' || status === 'REVOKED') {
+                                    return { ...task, status: 'FAILURE', error: message };
+                                }
+                                // Task is still processing (PENDING, STARTED, etc.).
+                                return { ...task, status };
+                            }));
+                        })
+                        .catch(err => {
+                            console.error('Failed to get task statuses:', err);
+                            resolve(currentTasks.map(task =>
+                                (task.status === 'SUCCESS' || task.status === 'FAILURE')
+                                    ? task
+                                    : { ...task, status: 'FAILURE', error: t('app.errorTaskStatus') }
+                            ));
+                        });
+
                     // Return the current state for this render cycle; the new state will be set below.
                     return currentTasks;
                 });
@@ -118,7 +179,7 @@ const UploadSuccessPopup = ({ data, onClose }) => {
         };
         // Dependency is tasks.length. When `data` changes -> `tasks` changes -> `tasks.length` changes,
         // this effect's cleanup runs (stopping old polls) and then runs again (starting new polls).
-    }, [tasks.length, t]);
+    }, [tasks.length, t, streaming]);
 
     if (!data || !data.tasks || data.tasks.length === 0) {
         return null;
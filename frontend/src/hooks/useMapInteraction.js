@@ -123,12 +123,8 @@ export const useMapInteraction = (theme, onShowNeighborPopup) => {
       const response = await api.getDeviceNeighbors(sourceNode.id);
       const allNeighbors = response.data.neighbors;
 
-      allNeighbors.forEach(neighbor => {
-        if (neighbor.ip) {
-          api.getDeviceInfo(neighbor.ip).catch(() => { });
-          api.getDeviceNeighbors(neighbor.ip).catch(() => { });
-        }
-      });
+      const neighborIps = allNeighbors.filter(neighbor => neighbor.ip).map(neighbor => neighbor.ip);
+      api.prefetchDevices(neighborIps).catch(() => { });
 
       setState(prev => {
         if (!prev) return prev;
@@ -134,4 +134,100 @@ export const createMap = (formData) => {
 
 export const getTaskStatus = (taskId) => {
     return apiClient.get(`/task-status/${taskId}`);
-};
\ No newline at end of file
+};
+
+/**
+ * Fetches the status of several tasks in one request.
+ * Resolves to { tasks: { [taskId]: task }, missing: [taskId] }.
+ */
+export const getTaskStatusBatch = (taskIds) => {
+    return apiClient.post('/task-status/batch', { task_ids: taskIds });
+};
+
+/**
+ * Opens a Server-Sent Events stream of status changes for several tasks.
+ * EventSource cannot send the Authorization header, so a short-lived ticket
+ * for these tasks is fetched first. Resolves to the EventSource; it emits
+ * 'task' events (same JSON as getTaskStatus) and a final 'done' event.
+ */
+export const openTaskEvents = async (taskIds) => {
+    const response = await apiClient.post('/task-events/ticket', { task_ids: taskIds });
+    const params = new URLSearchParams({ task_ids: taskIds.join(','), ticket: response.data.ticket });
+    return new EventSource(`${apiClient.defaults.baseURL}/task-events?${params}`);
+};
+
+/**
+ * Generates the Weathermap .conf on the server (same output as generateCactiConfig),
+ * which keeps the browser responsive when exporting very large maps.
+ */
+export const generateConfig = ({ nodes, edges, mapName, mapWidth, mapHeight, scaleFactor }) => {
+    return apiClient.post('/generate-config', {
+        nodes, edges, map_name: mapName, map_width: mapWidth, map_height: mapHeight, scale_factor: scaleFactor
+    }, { responseType: 'text' });
+};
+
+/**
+ * Returns the version history of a map created with createMap (its map_id).
+ */
+export const getMapVersions = (mapId) => {
+    return apiClient.get(`/maps/${mapId}`);
+};
+
+/**
+ * Applies node and link deltas to the latest version of a map instead of
+ * uploading it again. nodes/links map IDs to changes, or to null to delete.
+ * Pass cacti_group_id to redeploy the new version. The edit runs as a queued
+ * task: resolves (202) to { map_id, tasks: [{ hostname, task_id }] }, to be
+ * followed with getTaskStatusBatch or openTaskEvents. Rejects with 409 when
+ * baseVersion is no longer the latest version.
+ */
+export const applyMapDiff = (mapId, baseVersion, { nodes = {}, links = {} }, cactiGroupId = null) => {
+    const body = { base_version: baseVersion, nodes, links };
+    if (cactiGroupId !== null) body.cacti_group_id = cactiGroupId;
+    return apiClient.post(`/maps/${mapId}/diff`, body);
+};
+
+/**
+ * Asks the server to lay out nodes ([{ id, type }]) and edges ([{ source, target }])
+ * on a width x height map. mode is 'hierarchical' or 'force'.
+ * Resolves to { width, height, positions: { [nodeId]: { x, y } } } (top-left
+ * node positions). height is larger than requested when wide tiers wrap.
+ */
+export const computeLayout = (nodes, edges, width, height, mode = 'hierarchical') => {
+    return apiClient.post('/layout', { nodes, edges, width, height, mode });
+};
+
+/**
+ * Crawls the topology on the server starting from a seed IP and returns
+ * all discovered nodes and edges in a single response.
+ */
+export const discoverTopology = (ip, maxDepth = 2, maxDevices = 200, fullScan = false) => {
+    return apiClient.post('/discover', { ip, max_depth: maxDepth, max_devices: maxDevices, full_scan: fullScan });
+};
+
+/**
+ * Resolves device info and neighbors for many IPs with two batched requests
+ * and seeds the per-device GET cache with every successful result, so later
+ * getDeviceInfo/getDeviceNeighbors calls for those IPs are served locally.
+ */
+export const prefetchDevices = (ips) => {
+    const uncached = [...new Set(ips)].filter(ip =>
+        !getFromCache(`/get-device-info/${ip}`) || !getFromCache(`/get-device-neighbors/${ip}`)
+    );
+    if (uncached.length === 0) {
+        return Promise.resolve();
+    }
+
+    const seedCache = (urlPrefix) => (response) => {
+        Object.entries(response.data).forEach(([ip, result]) => {
+            if (!result.error) {
+                setToCache(`${urlPrefix}/${ip}`, result);
+            }
+        });
+    };
+
+    return Promise.all([
+        apiClient.post('/devices/batch', { ips: uncached }).then(seedCache('/get-device-info')),
+        apiClient.post('/neighbors/batch', { ips: uncached }).then(seedCache('/get-device-neighbors')),
+    ]);
+};